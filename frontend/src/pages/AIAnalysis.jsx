@@ -253,6 +253,7 @@ const AIAnalysis = () => {
                 )}
                 <span className="analysis-date">
                   Generated on {report.overall_health.analysis_date}
+                  {report.analysis_cache && ` (cached result, served ${report.analysis_cache.served_at})`}
                 </span>
               </div>
               <div className="report-actions">
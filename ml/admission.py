@@ -0,0 +1,172 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from ingest import FLOAT_DTYPE, SENSOR_COLUMNS
+from parallel import ParallelScoring, shared_memory_bytes
+
+logger = logging.getLogger(__name__)
+
+# Per-process limits; each gunicorn worker enforces its own
+MEMORY_BUDGET_BYTES = int(os.getenv('ADMISSION_MEMORY_BUDGET_MB', 512)) * 1024 * 1024
+MAX_CONCURRENT_ANALYSES = int(os.getenv('ADMISSION_MAX_CONCURRENT', 2))
+# Requests over budget wait this long in a queue of at most MAX_QUEUED before a 429
+QUEUE_TIMEOUT_SECONDS = float(os.getenv('ADMISSION_QUEUE_SECONDS', 15))
+MAX_QUEUED = int(os.getenv('ADMISSION_MAX_QUEUED', 4))
+# Request threads per worker (gunicorn.conf.py reads the same variable). Analysis
+# requests, from reading the upload to the report, may hold all but one of
+# them, so /health and /validate-csv always find a free thread
+WORKER_THREADS = int(os.getenv('GUNICORN_THREADS', 4))
+
+# Cost model measured on synthetic exports (peak RSS growth and wall time per
+# reading); standard analysis holds the whole frame, its event dicts and the
+# IsolationForest inputs, streaming only one chunk and the reservoir sample.
+# Standard analyses large enough for the analysis pool also hold the shared
+# memory blocks (see parallel.shared_memory_bytes)
+STANDARD_BYTES_PER_ROW = 450
+STREAM_BYTES_PER_ROW = 600
+BASE_ANALYSIS_BYTES = 32 * 1024 * 1024
+SECONDS_PER_ROW = 20e-6
+
+
+class AdmissionController:
+    """Memory and concurrency admission for analysis requests in one process
+
+    Each analysis reserves its estimated peak memory from a per-process
+    budget and one of max_concurrent slots. Requests that don't fit queue in
+    arrival order for up to queue_timeout seconds; when the queue is full or
+    the wait runs out acquire() returns None and the caller answers 429 with
+    retry_after(). A request estimated above the whole budget runs alone.
+
+    enter() caps the analysis requests a process handles at once, from the
+    upload on, at threads - 1; the rest are refused straight away rather
+    than holding a request thread, so one thread is always left for
+    /health and /validate-csv.
+    """
+
+    def __init__(self, memory_budget=None, max_concurrent=None, queue_timeout=None, max_queued=None, threads=None, parallel=None):
+        self.memory_budget = memory_budget or MEMORY_BUDGET_BYTES
+        self.parallel = parallel or ParallelScoring()
+        self.max_in_flight = max(1, (threads or WORKER_THREADS) - 1)
+        # Running and queued analyses are in flight too, so they share the same cap
+        self.max_concurrent = min(max_concurrent or MAX_CONCURRENT_ANALYSES, self.max_in_flight)
+        self.queue_timeout = queue_timeout if queue_timeout is not None else QUEUE_TIMEOUT_SECONDS
+        max_queued = max_queued if max_queued is not None else MAX_QUEUED
+        self.max_queued = min(max_queued, self.max_in_flight - self.max_concurrent)
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._running = {}
+        self._reserved = 0
+        self._in_flight = 0
+        self.stats = {'admitted_total': 0, 'queued_total': 0, 'rejected_total': 0}
+
+    def enter(self):
+        """Count an analysis request in from its start; False when threads - 1 are already taken"""
+        with self._condition:
+            if self._in_flight >= self.max_in_flight:
+                self.stats['rejected_total'] += 1
+                return False
+            self._in_flight += 1
+            return True
+
+    def leave(self):
+        with self._condition:
+            self._in_flight -= 1
+
+    def estimate(self, upload_bytes, rows, analysis_mode='standard', sensors=None, parallel_rows=None):
+        """Estimated peak memory and CPU time of analyzing rows readings
+
+        parallel_rows is the largest analysis this process scores on the
+        analysis pool (rows by default, 0 when the work runs elsewhere) and
+        sensors its sensor count (the original three by default).
+        """
+        if analysis_mode == 'stream':
+            chunk_rows = int(os.getenv('STREAM_CHUNK_ROWS', 100000))
+            memory = BASE_ANALYSIS_BYTES + min(rows, chunk_rows) * STREAM_BYTES_PER_ROW
+        else:
+            memory = BASE_ANALYSIS_BYTES + rows * STANDARD_BYTES_PER_ROW
+            parallel_rows = rows if parallel_rows is None else parallel_rows
+            if self.parallel.enabled(parallel_rows):
+                # The matrix copy and output arrays in shared memory
+                memory += shared_memory_bytes(parallel_rows, sensors or len(SENSOR_COLUMNS), np.dtype(FLOAT_DTYPE))
+        return {
+            'upload_bytes': int(upload_bytes),
+            'rows': int(rows),
+            'memory_bytes': int(memory),
+            'cpu_seconds': round(rows * SECONDS_PER_ROW, 3)
+        }
+
+    def acquire(self, cost):
+        """Reserve cost (from estimate()); returns a ticket for release(), or None when refused"""
+        ticket = {
+            'memory_bytes': min(cost['memory_bytes'], self.memory_budget),
+            'cpu_seconds': cost['cpu_seconds']
+        }
+        deadline = time.monotonic() + self.queue_timeout
+        with self._condition:
+            if self._queue or not self._fits(ticket):
+                if len(self._queue) >= self.max_queued:
+                    self.stats['rejected_total'] += 1
+                    return None
+                self.stats['queued_total'] += 1
+                self._queue.append(ticket)
+                logger.debug(f'Analysis queued for admission ({len(self._queue)} waiting, {self._reserved} bytes reserved)')
+                try:
+                    # First in, first admitted: only the head of the queue may take capacity
+                    while self._queue[0] is not ticket or not self._fits(ticket):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.stats['rejected_total'] += 1
+                            return None
+                        self._condition.wait(remaining)
+                finally:
+                    self._queue.remove(ticket)
+                    self._condition.notify_all()
+
+            ticket['started'] = time.monotonic()
+            self._running[id(ticket)] = ticket
+            self._reserved += ticket['memory_bytes']
+            self.stats['admitted_total'] += 1
+            return ticket
+
+    def release(self, ticket):
+        with self._condition:
+            if self._running.pop(id(ticket), None) is not None:
+                self._reserved -= ticket['memory_bytes']
+            self._condition.notify_all()
+
+    def retry_after(self):
+        """Seconds until the running analyses are expected to have finished"""
+        now = time.monotonic()
+        with self._condition:
+            remaining = sum(
+                max(ticket['cpu_seconds'] - (now - ticket['started']), 1.0)
+                for ticket in self._running.values()
+            )
+            remaining += sum(ticket['cpu_seconds'] for ticket in self._queue)
+        # The slots run in parallel, so the backlog drains max_concurrent at a time
+        return max(1, math.ceil(remaining / self.max_concurrent))
+
+    def summary(self):
+        with self._condition:
+            return {
+                'in_flight': self._in_flight,
+                'running': len(self._running),
+                'queued': len(self._queue),
+                'reserved_mb': round(self._reserved / (1024 * 1024), 1),
+                'memory_budget_mb': self.memory_budget // (1024 * 1024),
+                'max_in_flight': self.max_in_flight,
+                'max_concurrent': self.max_concurrent,
+                **self.stats
+            }
+
+    def _fits(self, ticket):
+        if len(self._running) >= self.max_concurrent:
+            return False
+        # An over-budget request is clamped to the budget, so it only fits on an idle process
+        return self._reserved + ticket['memory_bytes'] <= self.memory_budget
@@ -0,0 +1,148 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from metrics import metrics
+
+# isolation_forest: fit on every row (the original behaviour)
+# subsample: fit on a random sample of rows, then score every row
+# parallel: subsample fit, scoring split across threads
+# robust_z: per-sensor median/MAD z-scores, no model to fit
+ANOMALY_DETECTORS = ('isolation_forest', 'subsample', 'parallel', 'robust_z')
+
+DEFAULT_ANOMALY_DETECTOR = os.getenv('ANOMALY_DETECTOR', 'isolation_forest')
+ANOMALY_SAMPLE_SIZE = int(os.getenv('ANOMALY_SAMPLE_SIZE', 50000))
+ANOMALY_SCORING_WORKERS = int(os.getenv('ANOMALY_SCORING_WORKERS', os.cpu_count() or 1))
+
+# Rows per scoring task; smaller inputs are scored in the calling thread
+SCORING_CHUNK_ROWS = int(os.getenv('ANOMALY_SCORING_CHUNK_ROWS', 65536))
+
+# |modified z| above this flags a reading (Iglewicz and Hoaglin suggest 3.5)
+ROBUST_Z_THRESHOLD = float(os.getenv('ANOMALY_ROBUST_Z', 3.5))
+
+# MAD * 1.4826 estimates the standard deviation of normally distributed data
+MAD_SCALE = 1.4826
+# Mean absolute deviation * 1.2533 does the same when more than half the readings are identical
+MEAN_AD_SCALE = 1.2533
+
+
+class RobustZDetector:
+    """Flags readings whose modified z-score exceeds a threshold on any sensor
+
+    Fitting is a median and median absolute deviation per sensor, so it costs
+    one pass over the sample, and predict() scores rows independently, which
+    suits chunked and real-time input. predict() returns sklearn-style labels
+    (-1 anomalous, 1 normal); readings with a NaN sensor are never flagged.
+    """
+
+    def __init__(self, threshold=None):
+        self.threshold = ROBUST_Z_THRESHOLD if threshold is None else threshold
+        self.median_ = None
+        self.scale_ = None
+
+    def fit(self, features):
+        features = np.asarray(features, dtype=np.float64)
+        self.median_ = np.nanmedian(features, axis=0)
+        deviations = np.abs(features - self.median_)
+        scale = MAD_SCALE * np.nanmedian(deviations, axis=0)
+
+        # A sensor that is constant most of the time has a MAD of zero
+        flat = ~(scale > 0)
+        if flat.any():
+            scale[flat] = MEAN_AD_SCALE * np.nanmean(deviations[:, flat], axis=0)
+        self.scale_ = np.where(scale > 0, scale, 1e-9)
+        return self
+
+    def predict(self, values):
+        z = np.abs(np.asarray(values, dtype=np.float64) - self.median_) / self.scale_
+        with np.errstate(invalid='ignore'):
+            flagged = (z > self.threshold).any(axis=1)
+        return np.where(flagged, -1, 1)
+
+
+class AnomalyDetector:
+    """The anomaly detector chosen for one analysis
+
+    fit() trains on the given rows (a random sample of at most sample_size
+    for the subsample and parallel modes) or, with a machine_id, goes through
+    the per-machine model store; predict() can be called once or per chunk.
+    describe() is the report's 'anomaly_detection' block: the detector, the
+    rows the model was trained on and the rows scored.
+    """
+
+    def __init__(self, name=None, sample_size=None, workers=None, seed=42):
+        self.name = name or DEFAULT_ANOMALY_DETECTOR
+        if self.name not in ANOMALY_DETECTORS:
+            raise ValueError(f'Invalid anomaly_detector: {self.name}. Use one of: {", ".join(ANOMALY_DETECTORS)}')
+        self.sample_size = ANOMALY_SAMPLE_SIZE if sample_size is None else int(sample_size)
+        if self.sample_size < 1:
+            raise ValueError('anomaly_sample_size must be a positive integer')
+        self.workers = max(1, ANOMALY_SCORING_WORKERS if workers is None else int(workers))
+        self.seed = seed
+
+        self.model = None
+        self.source = None
+        self.trained_rows = 0
+        self.rows_scored = 0
+
+    def fit(self, features, model_store=None, machine_id=None, thresholds=None, sensors=None):
+        """Train (or load) the model; returns self
+
+        sensors names the feature columns, so a stored per-machine model is
+        only reused for the same sensors (and the same detector mode).
+        """
+        features = np.asarray(features)
+        training = self.training_rows(features)
+
+        if self.name == 'robust_z':
+            self.model = RobustZDetector().fit(training)
+            self.source = 'fitted'
+            self.trained_rows = len(training)
+        elif machine_id is not None:
+            entry, self.source = model_store.get_detector_entry(
+                machine_id, training, thresholds=thresholds, mode=self.name, sensors=sensors
+            )
+            self.model = entry['model']
+            self.trained_rows = int(entry.get('n_samples', len(training)))
+        else:
+            from sklearn.ensemble import IsolationForest
+            with metrics.timer('anomaly_model_fit_seconds', model='ephemeral'):
+                self.model = IsolationForest(contamination=0.1, random_state=42).fit(training)
+            self.source = 'fitted'
+            self.trained_rows = len(training)
+        return self
+
+    def training_rows(self, features):
+        """Every row, or a reproducible random sample of sample_size rows"""
+        if self.name == 'isolation_forest' or len(features) <= self.sample_size:
+            return features
+        rng = np.random.default_rng(self.seed)
+        picked = np.sort(rng.choice(len(features), self.sample_size, replace=False))
+        return features[picked]
+
+    def predict(self, values):
+        """Labels for each row: -1 anomalous, 1 normal"""
+        self.rows_scored += len(values)
+        if self.name != 'parallel' or self.workers == 1 or len(values) <= SCORING_CHUNK_ROWS:
+            return self.model.predict(values)
+
+        # Trees are walked in compiled code without the GIL, so threads scale;
+        # every row is scored independently, so the labels match a single call
+        bounds = range(0, len(values), SCORING_CHUNK_ROWS)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            parts = pool.map(lambda start: self.model.predict(values[start:start + SCORING_CHUNK_ROWS]), bounds)
+            return np.concatenate(list(parts))
+
+    def describe(self):
+        info = {
+            'detector': self.name,
+            'sample_size': int(self.trained_rows),
+            'rows_scored': int(self.rows_scored),
+            'model': self.source
+        }
+        if self.name == 'parallel':
+            info['workers'] = self.workers
+        if self.name == 'robust_z':
+            info['z_threshold'] = self.model.threshold
+        return info
@@ -1,25 +1,51 @@
-from flask import Flask, request, jsonify
+import time
+# Start of import-to-ready timing; everything below counts towards startup
+IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, Request, Response, g, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 from datetime import datetime
+import gc
 import os
+import re
 import json
-import pandas as pd
-from model import analyzer
+import shutil
+import threading
+import uuid
+from model import analyzer, ANALYZER_VERSION
+from jobs import JobManager
+from batch import BatchAnalysis, is_zip
+from admission import AdmissionController
+from result_cache import ResultCache, analysis_cache_key, save_and_hash
+from online import OnlineAnalytics
+from ingest import SENSOR_COLUMNS, UnsupportedFormatError, UploadSpool, describe_upload, detect_format, estimate_rows, sniff_upload, source_size
+from metrics import metrics
+from anomaly import DEFAULT_ANOMALY_DETECTOR
+from report_views import REPORT_LISTS, RESPONSE_MODES, iter_ndjson, iter_stored_ndjson, page, report_head, stored_summary, summary_view, top_view
+from sensors import SensorSet, is_thresholds
+from serialization import JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPES, compress, decode_json, encode, encode_json, media_types, summary as serialization_summary
 from werkzeug.utils import secure_filename
 import logging
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
+# Configure logging (LOG_LEVEL=DEBUG adds per-request analysis detail)
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+class AnalysisRequest(Request):
+    """Request whose file uploads are UploadSpools, analyzed where they were received"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UploadSpool(dir=UPLOAD_FOLDER)
+
 app = Flask(__name__)
+app.request_class = AnalysisRequest
 
 # CORS Configuration
 cors_origins_str = os.getenv('CORS_ORIGINS', 'http://localhost:8080,https://factory-pulse.netlify.app,https://factorypulse-backend.onrender.com')
@@ -33,16 +59,99 @@ CORS(app,
      methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'])
 
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
-ALLOWED_EXTENSIONS = {'csv'}
 
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
+# Upload limits: standard analysis loads the whole file, streaming reads it in chunks
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_MB', 16)) * 1024 * 1024
+STREAM_MAX_UPLOAD_BYTES = int(os.getenv('STREAM_MAX_UPLOAD_MB', 512)) * 1024 * 1024
+
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# Background analysis jobs (POST /jobs); state is shared between workers on disk
+JOB_FOLDER = os.path.join(os.path.dirname(__file__), 'jobs')
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+REPORT_ID_PATTERN = re.compile(r'[0-9a-f]{64}')
+job_manager = JobManager(JOB_FOLDER)
+
+# Content-addressed cache of analysis reports (memory LRU + optional disk tier)
+RESULT_CACHE_FOLDER = os.path.join(os.path.dirname(__file__), 'cache')
+result_cache = ResultCache(RESULT_CACHE_FOLDER)
+
+# Report delivery: default list cap for response_mode=top and page sizes for /reports
+DEFAULT_TOP_N = int(os.getenv('REPORT_TOP_N', 100))
+DEFAULT_PAGE_SIZE = int(os.getenv('REPORT_PAGE_SIZE', 500))
+MAX_PAGE_SIZE = int(os.getenv('REPORT_MAX_PAGE_SIZE', 5000))
+
+# Fleet analysis (POST /analyze/batch): one pool process per machine at a time
+batch_analysis = BatchAnalysis()
+
+# Memory budget and concurrency limit for analyses in this worker; with
+# gunicorn threads, /health and /validate-csv stay responsive meanwhile
+admission = AdmissionController(parallel=analyzer.parallel)
+
+# Rolling per-machine state for incremental ingest
+ONLINE_STATE_FOLDER = os.path.join(os.path.dirname(__file__), 'online_state')
+online_analytics = OnlineAnalytics(analyzer, ONLINE_STATE_FOLDER)
+INGEST_MAX_BATCH = int(os.getenv('INGEST_MAX_BATCH', 10000))
+app.config['MAX_CONTENT_LENGTH'] = max(MAX_UPLOAD_BYTES, STREAM_MAX_UPLOAD_BYTES)
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_start = time.perf_counter()
+    metrics.gauge_add('http_requests_in_flight', 1, route=g.metrics_route)
+
+# Requests that upload or analyze; each holds a request thread throughout
+ANALYSIS_ENDPOINTS = ('analyze_machinery', 'analyze_batch', 'submit_job', 'store_history', 'analyze_history')
+
+@app.before_request
+def limit_analysis_requests():
+    """429 before the upload is read when the analysis requests already hold all but one thread"""
+    if request.endpoint not in ANALYSIS_ENDPOINTS:
+        return None
+    if not admission.enter():
+        metrics.inc('admission_rejected_total', route=g.metrics_route)
+        logger.warning(f'Refused analysis request: worker at capacity ({admission.summary()})')
+        response = jsonify({
+            'success': False,
+            'error': 'Analysis capacity is full',
+            'message': 'Too many analyses are running on this worker. Please retry shortly.'
+        })
+        response.headers['Retry-After'] = str(admission.retry_after())
+        return response, 429
+    g.admission_entered = True
+    return None
+
+@app.after_request
+def record_response_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    # Teardown runs even when a view raises, so the in-flight counts never leak
+    if g.get('admission_entered'):
+        admission.leave()
+    if 'metrics_start' not in g:
+        return
+    metrics.gauge_add('http_requests_in_flight', -1, route=g.metrics_route)
+    metrics.observe(
+        'http_request_duration_seconds',
+        time.perf_counter() - g.metrics_start,
+        route=g.metrics_route,
+        method=request.method,
+        status=g.get('metrics_status', 500)
+    )
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({
+        'success': False,
+        'error': 'Uploaded file is too large',
+        'max_upload_mb': app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    }), 413
 
 @app.route('/', methods=['GET', 'HEAD'])
 def root():
@@ -55,7 +164,14 @@ def root():
         'endpoints': {
             'health': '/health',
             'analyze': 'POST /analyze',
-            'validate': 'POST /validate-csv'
+            'analyze_batch': 'POST /analyze/batch',
+            'jobs': 'POST /jobs, GET|DELETE /jobs/<id>',
+            'report_pages': 'GET /reports/<id>/<stress_events|anomalies>',
+            'ingest': 'POST /machines/<id>/readings',
+            'machine_health': 'GET /machines/<id>/health',
+            'history': 'POST|GET /machines/<id>/history, GET /machines/<id>/history/trends, POST /machines/<id>/history/analyze',
+            'validate': 'POST /validate-csv',
+            'metrics': '/metrics'
         },
         'message': 'ML Service is running'
     }), 200
@@ -68,93 +184,862 @@ def health_check():
         'timestamp': datetime.now().isoformat(),
         'service': 'ml',
         'message': 'ML Service is running',
-        'analyzer': 'Machinery Health Analyzer'
+        'analyzer': 'Machinery Health Analyzer',
+        'startup': startup,
+        'result_cache': result_cache.summary(),
+        'admission': admission.summary(),
+        'serialization': serialization_summary()
     }), 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition merged across all service processes"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def parse_response_view(source):
+    """Read response_mode/top_n from form or query args
+    
+    Returns (view, None) or (None, error_response).
+    """
+    mode = source.get('response_mode', 'full')
+    if mode not in RESPONSE_MODES:
+        return None, (jsonify({
+            'success': False,
+            'error': f'Invalid response_mode: {mode}. Use one of: {", ".join(RESPONSE_MODES)}'
+        }), 400)
+    
+    top_n = source.get('top_n', DEFAULT_TOP_N, type=int)
+    if top_n is None or top_n < 0:
+        return None, (jsonify({
+            'success': False,
+            'error': 'top_n must be a non-negative integer'
+        }), 400)
+    
+    return {'mode': mode, 'top_n': top_n}, None
+
+def report_response(report, view, report_id=None, headers=None):
+    """Render a report dict in a non-full response mode"""
+    headers = dict(headers or {})
+    if report_id is not None:
+        headers['X-Report-Id'] = report_id
+    
+    if view['mode'] == 'ndjson':
+        return Response(iter_ndjson(report, report_id), status=200, mimetype='application/x-ndjson', headers=headers)
+    if view['mode'] == 'top':
+        body = top_view(report, view['top_n'], report_id)
+    else:
+        body = summary_view(report, report_id)
+    
+    return serialized_response(body, headers=headers)
+
+def serialized_response(body=None, status=200, headers=None, payload=None, cache_key=None):
+    """A report response in the client's Accept type and Accept-Encoding
+    
+    JSON (orjson when installed) unless the client prefers MessagePack,
+    compressed with zstd or gzip when the client accepts it and the body is
+    large enough. payload is body already encoded as JSON (a cached report);
+    with cache_key body is stored in the result cache (see cache_report). Encode
+    time and size feed the metrics and a Server-Timing header.
+    """
+    media_type = request.accept_mimetypes.best_match(media_types(), default=JSON_MEDIA_TYPE)
+    response_format = 'msgpack' if media_type in MSGPACK_MEDIA_TYPES else 'json'
+    
+    started = time.perf_counter()
+    if payload is None and (cache_key or response_format == 'json'):
+        payload = encode_json(body)
+    if response_format == 'msgpack':
+        if body is None:
+            body = decode_json(payload)
+        data = encode(body, media_type)
+    else:
+        data = payload
+    serialize_seconds = time.perf_counter() - started
+    
+    if cache_key:
+        cache_report(cache_key, body, payload)
+    
+    started = time.perf_counter()
+    data, content_encoding = compress(data, request.accept_encodings)
+    compress_seconds = time.perf_counter() - started
+    
+    metrics.observe('report_encode_seconds', serialize_seconds, format=response_format, step='serialize')
+    timing = f'serialize;dur={serialize_seconds * 1000:.2f}'
+    if content_encoding:
+        metrics.observe('report_encode_seconds', compress_seconds, format=response_format, step='compress')
+        timing += f', compress;dur={compress_seconds * 1000:.2f}'
+    metrics.observe('report_bytes', len(data), format=response_format, encoding=content_encoding or 'identity')
+    
+    response = Response(data, status=status, mimetype=media_type, headers=headers)
+    response.headers['Vary'] = 'Accept, Accept-Encoding'
+    response.headers['Server-Timing'] = timing
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    return response, status
+
+def admission_refused_response(cost):
+    """429 for an analysis this worker has no capacity for right now"""
+    metrics.inc('admission_rejected_total', route=g.get('metrics_route', 'unmatched'))
+    logger.warning(f'Refused analysis of ~{cost["rows"]} rows: worker at capacity ({admission.summary()})')
+    response = jsonify({
+        'success': False,
+        'error': 'Analysis capacity is full',
+        'message': 'Too many analyses are running on this worker. Please retry shortly.',
+        'estimated_memory_mb': round(cost['memory_bytes'] / (1024 * 1024), 1),
+        'estimated_rows': cost['rows']
+    })
+    response.headers['Retry-After'] = str(admission.retry_after())
+    return response, 429
+
+def prepare_analysis_request(filename_prefix='', save_upload=True):
+    """Validate an analysis upload and, with save_upload, save it to the upload folder
+    
+    Returns (analysis, None) on success, where analysis holds the upload
+    source (the saved filepath, or the in-memory/memory-mapped upload when
+    not saved; filepath is then None), the analysis mode and the analyzer
+    keyword options, or (None, error_response) when the request is invalid.
+    """
+    if 'file' not in request.files:
+        return None, (jsonify({
+            'success': False,
+            'error': 'No file provided'
+        }), 400)
+    
+    file = request.files['file']
+    
+    if file.filename == '':
+        return None, (jsonify({
+            'success': False,
+            'error': 'No file selected'
+        }), 400)
+    
+    # The format is detected from the content, so the file name is not checked
+    try:
+        upload_format = detect_format(file.stream)
+    except UnsupportedFormatError as e:
+        return None, (jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400)
+    
+    # 'stream' analyzes in chunks with bounded memory and a larger upload limit
+    analysis_mode = request.form.get('analysis_mode', 'standard')
+    if analysis_mode not in ('standard', 'stream'):
+        return None, (jsonify({
+            'success': False,
+            'error': f'Invalid analysis_mode: {analysis_mode}. Use "standard" or "stream"'
+        }), 400)
+    
+    if analysis_mode == 'standard' and request.content_length and request.content_length > MAX_UPLOAD_BYTES:
+        return None, (jsonify({
+            'success': False,
+            'error': 'File too large for standard analysis',
+            'message': f'Use analysis_mode=stream for uploads over {MAX_UPLOAD_BYTES // (1024 * 1024)}MB',
+            'max_upload_mb': MAX_UPLOAD_BYTES // (1024 * 1024)
+        }), 413)
+    
+    response_view, error_response = parse_response_view(request.form)
+    if error_response:
+        return None, error_response
+    
+    # Get machine-specific thresholds (REQUIRED)
+    thresholds = None
+    machine_name = None
+    machine_id = None
+    
+    if 'thresholds' not in request.form:
+        return None, (jsonify({
+            'success': False,
+            'error': 'Machine thresholds are required',
+            'message': 'This CSV file must be downloaded from a specific machine in the dashboard'
+        }), 400)
+    
+    try:
+        thresholds = json.loads(request.form['thresholds'])
+        logger.debug(f'Received machine-specific thresholds: {thresholds}')
+    except Exception as e:
+        return None, (jsonify({
+            'success': False,
+            'error': 'Invalid threshold format',
+            'message': str(e)
+        }), 400)
+    
+    if 'machine_name' in request.form:
+        machine_name = request.form['machine_name']
+        logger.debug(f'Analyzing for machine: {machine_name}')
+    
+    if 'machine_id' in request.form:
+        machine_id = request.form['machine_id']
+        logger.debug(f'Machine ID: {machine_id}')
+    
+    # Optional stress output mode: per-reading 'events' or collapsed 'episodes'
+    # (streaming defaults to episodes so the event list stays small)
+    default_stress_mode = 'episodes' if analysis_mode == 'stream' else 'events'
+    stress_mode = request.form.get('stress_mode', default_stress_mode)
+    max_episodes = request.form.get('max_episodes', type=int)
+    # Optional time-bucketed timeline: minute, hour, shift or day
+    timeline = request.form.get('timeline') or None
+    
+    # Optional anomaly detector: isolation_forest, subsample, parallel or robust_z
+    anomaly_detector = request.form.get('anomaly_detector') or None
+    anomaly_sample_size = request.form.get('anomaly_sample_size', type=int)
+    
+    # Optional per-stage timing block in the report
+    include_timings = request.form.get('include_timings', 'false').lower() in ('1', 'true', 'yes')
+    
+    # Optionally keep the readings in the machine's history for later range
+    # analyses; stored by the caller once admission is granted
+    store_history = request.form.get('store_history', 'false').lower() in ('1', 'true', 'yes')
+    if store_history and machine_id is None:
+        return None, (jsonify({
+            'success': False,
+            'error': 'store_history requires a machine_id'
+        }), 400)
+    
+    if save_upload:
+        # Save file, hashing the bytes as they stream in for the result cache
+        filename = filename_prefix + secure_filename(file.filename)
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        upload_digest = save_and_hash(file, filepath)
+        source = filepath
+    else:
+        # Read in place; the spool is closed (and any spilled bytes freed) with the request
+        filepath = None
+        source = file.stream.view()
+        upload_digest = file.stream.sha256()
+    metrics.observe('upload_bytes', source_size(source), format=upload_format)
+    
+    return {
+        'filepath': filepath,
+        'source': source,
+        'upload_digest': upload_digest,
+        'upload_format': upload_format,
+        'analysis_mode': analysis_mode,
+        'response_view': response_view,
+        'store_history': store_history,
+        'options': {
+            'thresholds': thresholds,
+            'machine_name': machine_name,
+            'stress_mode': stress_mode,
+            'max_episodes': max_episodes,
+            'machine_id': machine_id,
+            'include_timings': include_timings,
+            'timeline': timeline,
+            'anomaly_detector': anomaly_detector,
+            'anomaly_sample_size': anomaly_sample_size
+        }
+    }, None
+
+def cache_report(cache_key, report, payload=None):
+    """Store a report in the result cache, and its lists separately for pages and NDJSON streams"""
+    result_cache.put(cache_key, payload if payload is not None else encode_json(report))
+    result_cache.put_lists(cache_key, report_head(report), {name: report.get(name, []) for name in REPORT_LISTS})
+
+def stored_report_lists(cache_key):
+    """The StoredLists of a cached report, or None when the report isn't cached
+    
+    Lists evicted apart from their report are stored again from the full
+    report, which is then the only time it's decoded.
+    """
+    stored = result_cache.get_lists(cache_key)
+    if stored is not None:
+        return stored
+    cached = result_cache.get(cache_key)
+    if cached is None:
+        return None
+    report = decode_json(cached)
+    result_cache.put_lists(cache_key, report_head(report), {name: report.get(name, []) for name in REPORT_LISTS})
+    return result_cache.get_lists(cache_key)
+
+def cached_report(cache_key, view):
+    """The cached form a view is served from: StoredLists for summary and NDJSON, else the report bytes"""
+    if view['mode'] in ('summary', 'ndjson'):
+        return stored_report_lists(cache_key)
+    return result_cache.get(cache_key)
+
+def cache_hit_info():
+    """analysis_cache field of a report served from the result cache
+    
+    The report's analysis_date stays the time it was analyzed; served_at is
+    the time of this response, so clients can show both.
+    """
+    return {'status': 'hit', 'served_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+def cached_report_response(cached, view, cache_key):
+    headers = {'X-Analysis-Cache': 'hit', 'X-Report-Id': cache_key}
+    if view['mode'] == 'full':
+        # Append the field to the stored JSON object rather than re-encoding it
+        payload = cached[:-1] + b',"analysis_cache":' + encode_json(cache_hit_info()) + b'}'
+        return serialized_response(payload=payload, headers=headers)
+    if view['mode'] in ('summary', 'ndjson'):
+        summary = stored_summary(cached, cache_key)
+        summary['analysis_cache'] = cache_hit_info()
+        if view['mode'] == 'ndjson':
+            return Response(iter_stored_ndjson(cached, summary), status=200, mimetype='application/x-ndjson', headers=headers)
+        return serialized_response(summary, headers=headers)
+    report = decode_json(cached)
+    report['analysis_cache'] = cache_hit_info()
+    return report_response(report, view, cache_key, {'X-Analysis-Cache': 'hit'})
+
+def record_upload_history(analysis):
+    """Store the upload's readings for store_history=true; call within an admission ticket
+    
+    Returns an error response when the upload can't be stored, else None.
+    """
+    if not analysis['store_history']:
+        return None
+    try:
+        analyzer.record_history(analysis['options']['machine_id'], analysis['source'])
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    return None
+
 @app.route('/analyze', methods=['POST'])
 def analyze_machinery():
     try:
-        if 'file' not in request.files:
+        analysis, error_response = prepare_analysis_request(save_upload=False)
+        if error_response:
+            return error_response
+        
+        source = analysis['source']
+        options = analysis['options']
+        cache_key = analysis_cache_key(
+            analysis['upload_digest'],
+            options['thresholds'],
+            ANALYZER_VERSION,
+            options={
+                'analysis_mode': analysis['analysis_mode'],
+                'stress_mode': options['stress_mode'],
+                'max_episodes': options['max_episodes'],
+                'machine_name': options['machine_name'],
+                'machine_id': options['machine_id'],
+                'timeline': options['timeline'],
+                'anomaly_detector': options['anomaly_detector'] or DEFAULT_ANOMALY_DETECTOR,
+                'anomaly_sample_size': options['anomaly_sample_size']
+            }
+        )
+        
+        # Repeat uploads are answered from the cache without parsing the CSV
+        # (unless their readings are to be stored); timing requests always
+        # run so the timings describe this request
+        view = analysis['response_view']
+        cached = None if options['include_timings'] else cached_report(cache_key, view)
+        if cached is not None and not analysis['store_history']:
+            return cached_report_response(cached, view, cache_key)
+        
+        # Reserve memory and a slot for the analysis, or ask the client to come back
+        cost = admission.estimate(
+            source_size(source),
+            estimate_rows(source, analysis['upload_format']),
+            analysis['analysis_mode'],
+            sensors=len(options['thresholds']) if isinstance(options['thresholds'], dict) else None
+        )
+        ticket = admission.acquire(cost)
+        if ticket is None:
+            return admission_refused_response(cost)
+        
+        # Analyze with machine-specific thresholds
+        analyze = analyzer.analyze_csv_stream if analysis['analysis_mode'] == 'stream' else analyzer.analyze_csv
+        try:
+            error_response = record_upload_history(analysis)
+            if error_response:
+                return error_response
+            if cached is not None:
+                return cached_report_response(cached, view, cache_key)
+            result = analyze(source, **options)
+        finally:
+            admission.release(ticket)
+        
+        if not result['success']:
+            return jsonify(result), 400
+        
+        # Only cached reports can be paged through /reports/<id>
+        report_id = None if options['include_timings'] else cache_key
+        if view['mode'] == 'full':
+            headers = {'X-Analysis-Cache': 'miss'}
+            if report_id:
+                headers['X-Report-Id'] = report_id
+            return serialized_response(result, headers=headers, cache_key=report_id)
+        
+        if report_id:
+            cache_report(cache_key, result)
+        return report_response(result, view, report_id, {'X-Analysis-Cache': 'miss'})
+            
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """Analyze a fleet in one request: a zip of per-machine exports or one file with a machine_id column
+    
+    thresholds is a JSON map of machine id to thresholds ('default' applies
+    to machines without their own entry; a single thresholds object applies
+    to all); machine_names optionally maps ids to names. The per-machine
+    reports honour response_mode=full|summary|top and the /analyze options.
+    """
+    work_dir = None
+    try:
+        if 'file' not in request.files or request.files['file'].filename == '':
             return jsonify({
                 'success': False,
                 'error': 'No file provided'
             }), 400
         
-        file = request.files['file']
+        response_view, error_response = parse_response_view(request.form)
+        if error_response:
+            return error_response
+        if response_view['mode'] == 'ndjson':
+            return jsonify({
+                'success': False,
+                'error': 'response_mode=ndjson is not available for batch analysis'
+            }), 400
         
-        if file.filename == '':
+        try:
+            threshold_map = json.loads(request.form.get('thresholds', 'null'))
+            machine_names = json.loads(request.form.get('machine_names', '{}'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid threshold format',
+                'message': str(e)
+            }), 400
+        if not isinstance(threshold_map, dict) or not isinstance(machine_names, dict):
             return jsonify({
                 'success': False,
-                'error': 'No file selected'
+                'error': 'Machine thresholds are required',
+                'message': 'thresholds must map machine ids to their thresholds'
             }), 400
         
-        if not allowed_file(file.filename):
+        work_dir = os.path.join(app.config['UPLOAD_FOLDER'], f'batch_{uuid.uuid4().hex}')
+        os.makedirs(work_dir)
+        upload_path = os.path.join(work_dir, 'upload')
+        request.files['file'].save(upload_path)
+        metrics.observe('upload_bytes', os.path.getsize(upload_path), format='batch')
+        
+        # A long-format file holds every machine, so it is read with every
+        # sensor any thresholds describe (the original three when none do)
+        single_thresholds = is_thresholds(threshold_map)
+        if single_thresholds:
+            threshold_sets = [threshold_map]
+        else:
+            threshold_sets = [entry for entry in threshold_map.values() if is_thresholds(entry)]
+        sensors = []
+        try:
+            for entry in threshold_sets:
+                sensors += [name for name in SensorSet(entry).names if name not in sensors]
+        except ValueError as e:
             return jsonify({
                 'success': False,
-                'error': 'Only CSV files are allowed'
+                'error': 'Invalid threshold format',
+                'message': str(e)
             }), 400
+        sensors = sensors or list(SENSOR_COLUMNS)
         
-        # Save file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        options = {
+            'stress_mode': request.form.get('stress_mode', 'events'),
+            'max_episodes': request.form.get('max_episodes', type=int),
+            'timeline': request.form.get('timeline') or None,
+            'include_timings': request.form.get('include_timings', 'false').lower() in ('1', 'true', 'yes'),
+            'anomaly_detector': request.form.get('anomaly_detector') or None,
+            'anomaly_sample_size': request.form.get('anomaly_sample_size', type=int)
+        }
+        machines = None
+        skipped_rows = 0
+        if is_zip(upload_path):
+            # A zip is only extracted by the split, so its members are
+            # estimated one by one afterwards
+            try:
+                machines, skipped_rows = batch_analysis.split(upload_path, work_dir, sensors=sensors)
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
+            machine_rows = [estimate_rows(source) for _, source in machines]
+            rows = sum(machine_rows)
+            # Only a batch analyzed in this process (one machine or one batch
+            # worker) scores on this process's analysis pool, a machine at a time
+            in_process = min(batch_analysis.max_workers, len(machines)) <= 1
+            parallel_rows = max(machine_rows, default=0) if in_process else 0
+        else:
+            # Splitting a long-format file parses all of it and copies every
+            # machine's rows, so its memory is reserved before the split
+            try:
+                rows = estimate_rows(upload_path)
+            except UnsupportedFormatError:
+                return jsonify({
+                    'success': False,
+                    'error': 'Upload a zip of per-machine exports or one file with a machine_id column'
+                }), 400
+            parallel_rows = rows
+        
+        cost = admission.estimate(os.path.getsize(upload_path), rows, sensors=len(sensors), parallel_rows=parallel_rows)
+        ticket = admission.acquire(cost)
+        if ticket is None:
+            return admission_refused_response(cost)
+        try:
+            if machines is None:
+                try:
+                    machines, skipped_rows = batch_analysis.split(upload_path, work_dir, sensors=sensors)
+                except ValueError as e:
+                    return jsonify({
+                        'success': False,
+                        'error': str(e)
+                    }), 400
+            
+            if single_thresholds:
+                thresholds = {machine_id: threshold_map for machine_id, _ in machines}
+            else:
+                default = threshold_map.get('default')
+                thresholds = {machine_id: threshold_map.get(machine_id, default) for machine_id, _ in machines}
+            
+            batch = batch_analysis.run(machines, thresholds, machine_names=machine_names, options=options)
+        finally:
+            admission.release(ticket)
+        
+        reports = batch['reports']
+        if response_view['mode'] == 'summary':
+            reports = {machine_id: summary_view(report) for machine_id, report in reports.items()}
+        elif response_view['mode'] == 'top':
+            reports = {machine_id: top_view(report, response_view['top_n']) for machine_id, report in reports.items()}
+        
+        return serialized_response({
+            'success': True,
+            'machines': len(machines),
+            'analyzed': len(batch['reports']),
+            'fleet_ranking': batch['fleet_ranking'],
+            'reports': reports,
+            'failed': batch['failed'],
+            'skipped_rows': skipped_rows,
+            'workers': batch['workers'],
+            'seconds': batch['seconds']
+        })
         
-        # Get machine-specific thresholds (REQUIRED)
-        thresholds = None
-        machine_name = None
-        machine_id = None
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+    finally:
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue an analysis in the background worker pool and return its job id"""
+    try:
+        analysis, error_response = prepare_analysis_request(filename_prefix=f'job_{uuid.uuid4().hex}_')
+        if error_response:
+            return error_response
+        
+        # Readings to keep are stored now, within the admission budget, so a
+        # bad upload is still answered with a 400
+        if analysis['store_history']:
+            cost = admission.estimate(source_size(analysis['filepath']), estimate_rows(analysis['filepath'], analysis['upload_format']))
+            ticket = admission.acquire(cost)
+            if ticket is None:
+                error_response = admission_refused_response(cost)
+            else:
+                try:
+                    error_response = record_upload_history(analysis)
+                finally:
+                    admission.release(ticket)
+            if error_response:
+                try:
+                    os.remove(analysis['filepath'])
+                except:
+                    pass
+                return error_response
         
-        if 'thresholds' not in request.form:
-            # Clean up file
+        options = analysis['options']
+        job = job_manager.submit(
+            analysis['filepath'],
+            analysis['analysis_mode'],
+            options,
+            machine_name=options['machine_name'],
+            machine_id=options['machine_id']
+        )
+        
+        if job is None:
             try:
-                os.remove(filepath)
+                os.remove(analysis['filepath'])
             except:
                 pass
             
+            response = jsonify({
+                'success': False,
+                'error': 'Analysis queue is full',
+                'message': 'Too many analyses are queued. Please retry shortly.'
+            })
+            response.headers['Retry-After'] = '30'
+            return response, 429
+        
+        return jsonify({
+            'success': True,
+            'job_id': job['job_id'],
+            'status': job['status'],
+            'status_url': f'/jobs/{job["job_id"]}'
+        }), 202
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status, progress and (once completed) the result of an analysis job
+    
+    response_mode=summary|top (query args) trims the result's lists.
+    """
+    view, error_response = parse_response_view(request.args)
+    if error_response:
+        return error_response
+    if view['mode'] == 'ndjson':
+        return jsonify({
+            'success': False,
+            'error': 'response_mode=ndjson is not available for job results'
+        }), 400
+    
+    job = job_manager.status(job_id) if JOB_ID_PATTERN.fullmatch(job_id) else None
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found',
+            'message': 'The job id is unknown or its result has expired'
+        }), 404
+    
+    result = job.get('result')
+    if result and result.get('success') and view['mode'] == 'summary':
+        job['result'] = summary_view(result)
+    elif result and result.get('success') and view['mode'] == 'top':
+        job['result'] = top_view(result, view['top_n'])
+    
+    return serialized_response({'success': True, **job})
+
+@app.route('/reports/<report_id>/<list_name>', methods=['GET'])
+def report_page(report_id, list_name):
+    """Cursor pagination over the stress events or anomalies of a cached report"""
+    if list_name not in REPORT_LISTS:
+        return jsonify({
+            'success': False,
+            'error': f'Unknown list: {list_name}. Use one of: {", ".join(REPORT_LISTS)}'
+        }), 404
+    
+    cursor = request.args.get('cursor', '0')
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    if not cursor.isdigit() or limit is None or not 0 < limit <= MAX_PAGE_SIZE:
+        return jsonify({
+            'success': False,
+            'error': f'cursor must be a value returned as next_cursor and limit between 1 and {MAX_PAGE_SIZE}'
+        }), 400
+    
+    stored = stored_report_lists(report_id) if REPORT_ID_PATTERN.fullmatch(report_id) else None
+    try:
+        list_page = stored and page(stored, list_name, int(cursor), limit)
+    except OSError:
+        # Evicted between finding the entry and reading the page
+        list_page = None
+    if list_page is None:
+        return jsonify({
+            'success': False,
+            'error': 'Report not found',
+            'message': 'The report has expired from the cache; run the analysis again'
+        }), 404
+    
+    return serialized_response({
+        'success': True,
+        'report_id': report_id,
+        **list_page
+    })
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running analysis job"""
+    job = job_manager.cancel(job_id) if JOB_ID_PATTERN.fullmatch(job_id) else None
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    
+    return jsonify({'success': True, **job}), 200
+
+@app.route('/machines/<machine_id>/readings', methods=['POST'])
+def ingest_readings(machine_id):
+    """Fold a small batch of readings into the machine's rolling analytics"""
+    try:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict) or 'readings' not in payload:
             return jsonify({
                 'success': False,
-                'error': 'Machine thresholds are required',
-                'message': 'This CSV file must be downloaded from a specific machine in the dashboard'
+                'error': 'JSON body with a readings list is required'
             }), 400
         
+        readings = payload['readings']
+        if isinstance(readings, list) and len(readings) > INGEST_MAX_BATCH:
+            return jsonify({
+                'success': False,
+                'error': f'Batch too large: at most {INGEST_MAX_BATCH} readings per request'
+            }), 413
+        
         try:
-            thresholds = json.loads(request.form['thresholds'])
-            print(f'✓ Received machine-specific thresholds: {thresholds}')
-        except Exception as e:
-            # Clean up file
-            try:
-                os.remove(filepath)
-            except:
-                pass
-            
+            batch = online_analytics.ingest(
+                machine_id,
+                readings,
+                thresholds=payload.get('thresholds'),
+                machine_name=payload.get('machine_name')
+            )
+        except ValueError as e:
             return jsonify({
                 'success': False,
-                'error': 'Invalid threshold format',
-                'message': str(e)
+                'error': str(e)
+            }), 400
+        
+        return jsonify({'success': True, 'machine_id': machine_id, **batch}), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/machines/<machine_id>/health', methods=['GET'])
+def machine_health(machine_id):
+    """Current rolling health assessment for a machine"""
+    try:
+        assessment = online_analytics.assessment(machine_id)
+        if assessment is None:
+            return jsonify({
+                'success': False,
+                'error': 'No readings ingested for this machine'
+            }), 404
+        
+        return jsonify(assessment), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/machines/<machine_id>/history', methods=['POST'])
+def store_history(machine_id):
+    """Add an upload's timestamped readings to the machine's day-partitioned history"""
+    try:
+        if 'file' not in request.files or request.files['file'].filename == '':
+            return jsonify({
+                'success': False,
+                'error': 'No file provided'
             }), 400
         
-        if 'machine_name' in request.form:
-            machine_name = request.form['machine_name']
-            print(f'✓ Analyzing for machine: {machine_name}')
+        file = request.files['file']
+        try:
+            upload_format = detect_format(file.stream)
+        except UnsupportedFormatError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
-        if 'machine_id' in request.form:
-            machine_id = request.form['machine_id']
-            print(f'✓ Machine ID: {machine_id}')
+        source = file.stream.view()
+        cost = admission.estimate(source_size(source), estimate_rows(source, upload_format))
+        ticket = admission.acquire(cost)
+        if ticket is None:
+            return admission_refused_response(cost)
+        try:
+            stored = analyzer.record_history(machine_id, source)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        finally:
+            admission.release(ticket)
         
-        # Analyze with machine-specific thresholds
-        result = analyzer.analyze_csv(filepath, thresholds=thresholds, machine_name=machine_name)
+        return jsonify({'success': True, 'machine_id': machine_id, **stored}), 200
         
-        # Clean up uploaded file
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/machines/<machine_id>/history', methods=['GET'])
+def history_summary(machine_id):
+    """Stored days and reading counts for a machine"""
+    summary = analyzer.history.summary(machine_id)
+    if summary is None:
+        return jsonify({
+            'success': False,
+            'error': 'No stored history for this machine'
+        }), 404
+    return jsonify({'success': True, **summary}), 200
+
+@app.route('/machines/<machine_id>/history/trends', methods=['GET'])
+def history_trends(machine_id):
+    """Day-granularity trends from the history index (?start=&end=, end exclusive)"""
+    result = analyzer.history_trends(machine_id, request.args.get('start'), request.args.get('end'))
+    if not result['success']:
+        return jsonify(result), 404 if 'No stored readings' in result['error'] else 400
+    return jsonify(result), 200
+
+@app.route('/machines/<machine_id>/history/analyze', methods=['POST'])
+def analyze_history(machine_id):
+    """Full analysis of stored readings in [start, end) without re-uploading them
+    
+    JSON body: thresholds (required), start, end and the /analyze options
+    (machine_name, stress_mode, max_episodes, timeline, include_timings,
+    anomaly_detector, anomaly_sample_size). response_mode/top_n are query args.
+    """
+    try:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            return jsonify({
+                'success': False,
+                'error': 'JSON body with thresholds is required'
+            }), 400
+        
+        view, error_response = parse_response_view(request.args)
+        if error_response:
+            return error_response
+        
+        # The machine's whole history bounds what a range can read
+        stored = analyzer.history.summary(machine_id)
+        cost = admission.estimate(0, stored['total_readings'] if stored else 0)
+        ticket = admission.acquire(cost)
+        if ticket is None:
+            return admission_refused_response(cost)
         try:
-            os.remove(filepath)
-        except:
-            pass
+            result = analyzer.analyze_history(
+                machine_id,
+                start=payload.get('start'),
+                end=payload.get('end'),
+                thresholds=payload.get('thresholds'),
+                machine_name=payload.get('machine_name'),
+                stress_mode=payload.get('stress_mode', 'events'),
+                max_episodes=payload.get('max_episodes'),
+                include_timings=bool(payload.get('include_timings', False)),
+                timeline=payload.get('timeline'),
+                anomaly_detector=payload.get('anomaly_detector'),
+                anomaly_sample_size=payload.get('anomaly_sample_size')
+            )
+        finally:
+            admission.release(ticket)
         
-        if result['success']:
-            return jsonify(result), 200
-        else:
+        if not result['success']:
             return jsonify(result), 400
-            
+        
+        if view['mode'] == 'full':
+            return serialized_response(result)
+        return report_response(result, view)
+        
     except Exception as e:
         return jsonify({
             'success': False,
@@ -163,6 +1048,11 @@ def analyze_machinery():
 
 @app.route('/validate-csv', methods=['POST'])
 def validate_csv():
+    """Check an upload has the columns analysis needs
+    
+    thresholds optionally describes the machine's sensors as for /analyze;
+    without it the original temperature, vibration and current are required.
+    """
     try:
         if 'file' not in request.files:
             return jsonify({
@@ -172,29 +1062,65 @@ def validate_csv():
         
         file = request.files['file']
         
-        if not allowed_file(file.filename):
+        try:
+            upload_format = detect_format(file.stream)
+        except UnsupportedFormatError as e:
             return jsonify({
                 'valid': False,
-                'error': 'Only CSV files are allowed'
+                'error': str(e)
             }), 400
         
-        # Read and validate CSV
-        df = pd.read_csv(file)
+        required_columns = list(SENSOR_COLUMNS)
+        if request.values.get('thresholds'):
+            try:
+                required_columns = SensorSet(json.loads(request.values['thresholds'])).names
+            except ValueError as e:
+                return jsonify({
+                    'valid': False,
+                    'error': 'Invalid threshold format',
+                    'message': str(e)
+                }), 400
+        
+        # deep=true parses every row as analysis would; by default only the
+        # header and a sample are parsed and rows are counted from the bytes
+        deep = request.values.get('deep', 'false').lower() in ('1', 'true', 'yes')
+        if deep or upload_format not in ('csv', 'csv_gzip', 'csv_zstd'):
+            # Full parses and the Arrow readers need the analysis libraries
+            analysis_libraries_ready.wait()
+        if deep:
+            # Binary formats still answer from their metadata
+            columns, rows = describe_upload(file.stream, upload_format)
+            metadata = {}
+        else:
+            sniffed = sniff_upload(file.stream.view(), upload_format)
+            columns, rows = sniffed['columns'], sniffed['rows']
+            metadata = {'dtypes': sniffed['dtypes'], 'timestamp': sniffed['timestamp']}
         
-        required_columns = ['temperature', 'vibration', 'current']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = [col for col in required_columns if col not in columns]
         
         if missing_columns:
             return jsonify({
                 'valid': False,
                 'error': f'Missing required columns: {", ".join(missing_columns)}',
-                'found_columns': list(df.columns)
+                'found_columns': columns
+            }), 400
+        
+        non_numeric = [col for col in required_columns if metadata.get('dtypes', {}).get(col) == 'text']
+        if non_numeric:
+            return jsonify({
+                'valid': False,
+                'error': f'Non-numeric values in columns: {", ".join(non_numeric)}',
+                'found_columns': columns,
+                **metadata
             }), 400
         
         return jsonify({
             'valid': True,
-            'rows': len(df),
-            'columns': list(df.columns)
+            'rows': rows,
+            'columns': columns,
+            'format': upload_format,
+            'mode': 'deep' if deep else 'fast',
+            **metadata
         }), 200
         
     except Exception as e:
@@ -203,6 +1129,58 @@ def validate_csv():
             'error': str(e)
         }), 500
 
+# Heavy analysis libraries are imported lazily. Under gunicorn preload they are
+# loaded here in the master, with the persisted anomaly models, and shared
+# copy-on-write by the forked workers; otherwise a background thread loads
+# them so / and /health answer immediately.
+PRELOAD_APP = os.getenv('GUNICORN_PRELOAD', 'false').lower() in ('1', 'true', 'yes')
+BACKGROUND_WARM_UP = os.getenv('ML_BACKGROUND_WARMUP', 'true').lower() in ('1', 'true', 'yes')
+startup = {'preload': PRELOAD_APP, 'analysis_libraries': 'deferred', 'import_to_ready_seconds': None}
+
+# Set once the warm-up is over; two threads importing sklearn at the same time
+# can hit the interpreter's import deadlock detection, so the views that import
+# pandas, sklearn, joblib or pyarrow wait for the background import instead of
+# racing it. Everything else (/validate-csv's fast path, job status, report
+# pages, the rolling machine health) answers during the warm-up
+analysis_libraries_ready = threading.Event()
+WARM_UP_ENDPOINTS = {
+    'analyze_machinery', 'analyze_batch', 'submit_job', 'ingest_readings',
+    'store_history', 'history_trends', 'analyze_history'
+}
+
+def warm_up_analyzer():
+    startup['analysis_libraries'] = 'loading'
+    try:
+        startup.update(analyzer.warm_up(preload_models=PRELOAD_APP))
+        startup['analysis_libraries'] = 'loaded'
+        logger.info(
+            f'Analysis libraries loaded in {startup["libraries_seconds"]}s '
+            f'({startup["models_loaded"]} anomaly models preloaded)'
+        )
+    except Exception as e:
+        # Requests fall back to importing on first use
+        startup['analysis_libraries'] = 'failed'
+        logger.error(f'Analysis library warm-up failed: {e}')
+    finally:
+        analysis_libraries_ready.set()
+
+@app.before_request
+def wait_for_warm_up():
+    if request.endpoint in WARM_UP_ENDPOINTS:
+        analysis_libraries_ready.wait()
+
+if PRELOAD_APP:
+    warm_up_analyzer()
+    # Keep the garbage collector from touching (and so copying) the preloaded objects in workers
+    gc.freeze()
+elif BACKGROUND_WARM_UP:
+    threading.Thread(target=warm_up_analyzer, name='analysis-warm-up', daemon=True).start()
+else:
+    analysis_libraries_ready.set()
+
+startup['import_to_ready_seconds'] = round(time.perf_counter() - IMPORT_STARTED, 3)
+logger.info(f'ML service ready {startup["import_to_ready_seconds"]}s after import (preload: {PRELOAD_APP})')
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5001))
     debug = os.getenv('FLASK_ENV', 'development') == 'development'
@@ -0,0 +1,209 @@
+import atexit
+import logging
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from ingest import SENSOR_COLUMNS, UnsupportedFormatError, detect_format, read_sensor_frame, read_sensor_header
+from jobs import analysis_mp_context
+from parallel import WEB_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Worker processes per web worker for /analyze/batch, by default the cores
+# shared out between the web workers; machines beyond that queue
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', max(1, (os.cpu_count() or 1) // WEB_WORKERS)))
+BATCH_MAX_MACHINES = int(os.getenv('BATCH_MAX_MACHINES', 200))
+# Zip bomb guard: total declared size of the extracted members
+BATCH_MAX_UNCOMPRESSED_BYTES = int(os.getenv('BATCH_MAX_UNCOMPRESSED_MB', 2048)) * 1024 * 1024
+
+MACHINE_ID_COLUMN = 'machine_id'
+ZIP_MAGIC = b'PK\x03\x04'
+
+# Stripped from zip member names to get the machine id ('press-4.csv.gz' -> 'press-4')
+EXPORT_SUFFIXES = ('.gz', '.zst', '.csv', '.parquet', '.arrow', '.arrows', '.feather', '.ipc')
+
+
+class BatchAnalysis:
+    """Fleet analysis for POST /analyze/batch
+
+    An upload is split into one input per machine: the members of a zip of
+    exports (named after the machine), or the machine_id groups of a
+    long-format file. Each machine is analyzed in a process pool, so the
+    wall time grows with machines / workers rather than with the machine
+    count, and the reports are ranked by overall health score.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or BATCH_WORKERS
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def split(self, path, work_dir, sensors=None):
+        """[(machine_id, input)] where input is a file path or a DataFrame, and rows skipped
+
+        sensors names the sensor columns a long-format file must have
+        (SENSOR_COLUMNS by default). Raises ValueError when the upload is
+        neither a zip nor has a machine_id column, or exceeds the batch limits.
+        """
+        if is_zip(path):
+            return self._split_zip(path, work_dir), 0
+        return self._split_long(path, sensors or SENSOR_COLUMNS)
+
+    def run(self, machines, thresholds, machine_names=None, options=None):
+        """Analyze every machine; returns {'reports', 'failed', 'fleet_ranking', 'workers', 'seconds'}
+
+        thresholds and machine_names map machine ids to their values.
+        """
+        machine_names = machine_names or {}
+        options = options or {}
+        started = time.perf_counter()
+
+        tasks = [
+            (machine_id, source, thresholds.get(machine_id), machine_names.get(machine_id))
+            for machine_id, source in machines
+        ]
+        workers = min(self.max_workers, len(tasks))
+        if workers <= 1:
+            results = [analyze_machine(*task, options) for task in tasks]
+        else:
+            executor = self._pool()
+            futures = [executor.submit(analyze_machine, *task, options) for task in tasks]
+            results = [future.result() for future in futures]
+
+        reports = {}
+        failed = {}
+        for (machine_id, _, _, _), report in zip(tasks, results):
+            if report.get('success'):
+                reports[machine_id] = report
+            else:
+                failed[machine_id] = report.get('error', 'Analysis failed')
+
+        return {
+            'reports': reports,
+            'failed': failed,
+            'fleet_ranking': fleet_ranking(reports),
+            'workers': max(workers, 1),
+            'seconds': round(time.perf_counter() - started, 3)
+        }
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=analysis_mp_context())
+                atexit.register(self._executor.shutdown, wait=True, cancel_futures=True)
+            return self._executor
+
+    def _split_zip(self, path, work_dir):
+        with zipfile.ZipFile(path) as archive:
+            members = [
+                info for info in archive.infolist()
+                if not info.is_dir()
+                and not os.path.basename(info.filename).startswith('.')
+                and not info.filename.startswith('__MACOSX/')
+            ]
+            if not members:
+                raise ValueError('The zip contains no export files')
+            if len(members) > BATCH_MAX_MACHINES:
+                raise ValueError(f'Too many machines: at most {BATCH_MAX_MACHINES} per batch')
+            if sum(info.file_size for info in members) > BATCH_MAX_UNCOMPRESSED_BYTES:
+                raise ValueError(f'Zip contents exceed {BATCH_MAX_UNCOMPRESSED_BYTES // (1024 * 1024)}MB uncompressed')
+
+            machines = []
+            seen = set()
+            for i, info in enumerate(members):
+                machine_id = _machine_id_from_name(info.filename)
+                if machine_id in seen:
+                    raise ValueError(f'More than one export for machine {machine_id}')
+                seen.add(machine_id)
+
+                # Extracted under our own name, so member paths can't escape work_dir
+                target = os.path.join(work_dir, f'machine_{i}')
+                with archive.open(info) as src, open(target, 'wb') as dst:
+                    while True:
+                        block = src.read(1024 * 1024)
+                        if not block:
+                            break
+                        dst.write(block)
+                machines.append((machine_id, target))
+        return machines
+
+    def _split_long(self, path, sensors):
+        try:
+            fmt = detect_format(path)
+        except UnsupportedFormatError:
+            raise ValueError('Upload a zip of per-machine exports or one file with a machine_id column')
+
+        columns = read_sensor_header(path, fmt)
+        if MACHINE_ID_COLUMN not in columns:
+            raise ValueError('Upload a zip of per-machine exports or one file with a machine_id column')
+        missing = [col for col in sensors if col not in columns]
+        if missing:
+            raise ValueError(f'CSV must contain columns: {", ".join(sensors)}')
+
+        df = read_sensor_frame(path, fmt, columns=columns, extra_columns=[MACHINE_ID_COLUMN], sensors=sensors)
+        skipped = int(df[MACHINE_ID_COLUMN].isna().sum())
+        groups = df.groupby(MACHINE_ID_COLUMN, sort=False)
+        if groups.ngroups > BATCH_MAX_MACHINES:
+            raise ValueError(f'Too many machines: at most {BATCH_MAX_MACHINES} per batch')
+
+        machines = [
+            (str(machine_id), group.drop(columns=MACHINE_ID_COLUMN).reset_index(drop=True))
+            for machine_id, group in groups
+        ]
+        if not machines:
+            raise ValueError('No rows with a machine_id')
+        return machines, skipped
+
+
+def analyze_machine(machine_id, source, thresholds, machine_name, options):
+    """One machine's report; runs in a pool process (or inline for a single machine)"""
+    from model import analyzer
+
+    kwargs = dict(options, thresholds=thresholds, machine_name=machine_name or machine_id, machine_id=machine_id)
+    if isinstance(source, str):
+        report = analyzer.analyze_csv(source, **kwargs)
+    else:
+        report = analyzer.analyze_dataframe(source, **kwargs)
+    if report.get('success'):
+        report['machine_id'] = machine_id
+    return report
+
+
+def fleet_ranking(reports):
+    """Machines ordered from worst to best overall health score"""
+    ranking = [
+        {
+            'machine_id': machine_id,
+            'machine_name': report['overall_health']['machine_name'],
+            'score': report['overall_health']['score'],
+            'status': report['overall_health']['status'],
+            'critical_events': report['summary']['critical_events'],
+            'anomalies_detected': report['summary']['anomalies_detected'],
+            'health_trend': report['summary']['health_trend']
+        }
+        for machine_id, report in reports.items()
+    ]
+    ranking.sort(key=lambda entry: (entry['score'], -entry['critical_events'], entry['machine_id']))
+    for rank, entry in enumerate(ranking, start=1):
+        entry['rank'] = rank
+    return ranking
+
+
+def is_zip(path):
+    with open(path, 'rb') as f:
+        return f.read(len(ZIP_MAGIC)) == ZIP_MAGIC
+
+
+def _machine_id_from_name(name):
+    machine_id = os.path.basename(name)
+    stripped = True
+    while stripped:
+        stripped = False
+        for suffix in EXPORT_SUFFIXES:
+            if machine_id.lower().endswith(suffix) and len(machine_id) > len(suffix):
+                machine_id = machine_id[:-len(suffix)]
+                stripped = True
+    return machine_id
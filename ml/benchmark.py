@@ -0,0 +1,217 @@
+"""Stage-level benchmark for MachineryHealthAnalyzer
+
+Times each analysis stage on synthetic data at several sizes and reports peak
+RSS. Each size runs in a fresh process so peak memory is per size.
+
+Usage:
+    python benchmark.py --sizes 1k,10k,100k --output results.json
+    python benchmark.py --baseline benchmarks/baseline.json --tolerance 0.25
+    python benchmark.py --sizes 1k,10k --save-baseline benchmarks/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+
+DEFAULT_SIZES = '1k,10k,100k,1m,10m'
+
+STAGES = [
+    'read_csv',
+    'health_scoring',
+    'analyze_stress_patterns',
+    'detect_anomalies',
+    'calculate_trends',
+    'generate_recommendations',
+    'json_serialization'
+]
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    multiplier = {'k': 1000, 'm': 1000000}.get(text[-1], 1)
+    number = text[:-1] if text[-1] in 'km' else text
+    return int(float(number) * multiplier)
+
+
+def run_size(rows, seed, repeat, workdir):
+    """Generate one dataset and time every stage; runs in its own process"""
+    import numpy as np
+    from model import analyzer
+    from ingest import SENSOR_COLUMNS, read_sensor_frame
+    from sensors import sensor_matrix
+    from synthetic_data import DEFAULT_THRESHOLDS, generate_sensor_data
+
+    thresholds = DEFAULT_THRESHOLDS
+    csv_path = os.path.join(workdir, f'synthetic_{rows}_{seed}.csv')
+    if not os.path.exists(csv_path):
+        generate_sensor_data(rows, seed=seed).to_csv(csv_path, index=False)
+
+    best = {stage: float('inf') for stage in STAGES}
+    for _ in range(repeat):
+        timings = {}
+
+        start = time.perf_counter()
+        df = read_sensor_frame(csv_path)
+        timings['read_csv'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scores = analyzer.calculate_health_scores_matrix(sensor_matrix(df, SENSOR_COLUMNS), thresholds)
+        timings['health_scoring'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        stress_events = analyzer.analyze_stress_patterns(df, thresholds)
+        timings['analyze_stress_patterns'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        anomalies = analyzer.detect_anomalies(df)
+        timings['detect_anomalies'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        trends = analyzer.calculate_trends(df)
+        timings['calculate_trends'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        overall_health = {'score': round(float(np.mean(scores)), 2), 'total_readings': len(df)}
+        recommendations = analyzer.generate_recommendations(
+            overall_health, stress_events, trends, machine_name='Benchmark', thresholds=thresholds
+        )
+        timings['generate_recommendations'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        payload = json.dumps({
+            'overall_health': overall_health,
+            'stress_events': stress_events,
+            'anomalies': anomalies,
+            'trends': trends,
+            'recommendations': recommendations
+        }, default=str)
+        timings['json_serialization'] = time.perf_counter() - start
+
+        for stage, seconds in timings.items():
+            best[stage] = min(best[stage], seconds)
+
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+
+    return {
+        'rows': rows,
+        'csv_bytes': os.path.getsize(csv_path),
+        'stages': {stage: round(best[stage], 6) for stage in STAGES},
+        'total_seconds': round(sum(best.values()), 6),
+        'peak_rss_mb': round(peak_rss_mb, 1),
+        'stress_events': len(stress_events),
+        'anomalies': len(anomalies),
+        'report_bytes': len(payload)
+    }
+
+
+def environment():
+    import numpy
+    import pandas
+    import sklearn
+    from model import ANALYZER_VERSION
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'analyzer_version': ANALYZER_VERSION,
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'pandas': pandas.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Stages slower than baseline by more than tolerance (fractional), per size"""
+    baseline_by_rows = {entry['rows']: entry for entry in baseline.get('results', [])}
+    regressions = []
+    for entry in results:
+        reference = baseline_by_rows.get(entry['rows'])
+        if reference is None:
+            continue
+        for stage, seconds in entry['stages'].items():
+            before = reference['stages'].get(stage)
+            # Ignore sub-millisecond stages where timer noise dominates
+            if before is None or before < 0.001:
+                continue
+            ratio = seconds / before
+            if ratio > 1 + tolerance:
+                regressions.append({
+                    'rows': entry['rows'],
+                    'stage': stage,
+                    'baseline_seconds': before,
+                    'seconds': seconds,
+                    'ratio': round(ratio, 3)
+                })
+    return regressions
+
+
+def print_table(results):
+    header = f'{"rows":>10}  ' + '  '.join(f'{stage[:12]:>12}' for stage in STAGES) + f'  {"total":>9}  {"rss MB":>8}'
+    print(header)
+    for entry in results:
+        cells = '  '.join(f'{entry["stages"][stage]:>12.4f}' for stage in STAGES)
+        print(f'{entry["rows"]:>10}  {cells}  {entry["total_seconds"]:>9.3f}  {entry["peak_rss_mb"]:>8.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark MachineryHealthAnalyzer stages')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f'comma-separated row counts (default {DEFAULT_SIZES})')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per size; the fastest is reported')
+    parser.add_argument('--workdir', default=None, help='where generated CSVs are kept (default: temp dir)')
+    parser.add_argument('--output', help='write machine-readable results to this JSON file')
+    parser.add_argument('--baseline', help='compare against a stored results JSON')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown vs baseline (0.25 = 25%%)')
+    parser.add_argument('--save-baseline', help='write results as the new baseline JSON')
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes.split(',') if size.strip()]
+    workdir = args.workdir or tempfile.mkdtemp(prefix='factorypulse-bench-')
+    os.makedirs(workdir, exist_ok=True)
+
+    results = []
+    for rows in sizes:
+        # Fresh spawned process per size so peak RSS is not inherited
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+            entry = pool.submit(run_size, rows, args.seed, args.repeat, workdir).result()
+        results.append(entry)
+        print(f'{rows} rows: {entry["total_seconds"]:.3f}s, peak RSS {entry["peak_rss_mb"]:.1f} MB', file=sys.stderr)
+
+    report = {'environment': environment(), 'results': results}
+    print_table(results)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        report['regressions'] = regressions
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        for item in regressions:
+            print(f'REGRESSION {item["rows"]} rows {item["stage"]}: '
+                  f'{item["baseline_seconds"]:.4f}s -> {item["seconds"]:.4f}s (x{item["ratio"]})')
+        if regressions:
+            sys.exit(1)
+        print('No regressions against baseline')
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
@@ -0,0 +1,246 @@
+import heapq
+import os
+
+import numpy as np
+
+# At most this many change points per series
+MAX_CHANGE_POINTS = int(os.getenv('CHANGEPOINT_MAX', 8))
+# Shortest segment as a fraction of the readings (and never under MIN_SEGMENT_ROWS)
+MIN_SEGMENT_FRACTION = float(os.getenv('CHANGEPOINT_MIN_SEGMENT_FRACTION', 0.02))
+MIN_SEGMENT_ROWS = 10
+# Smallest mean shift reported for a sensor, in standard deviations of the whole series
+MIN_SHIFT_STD = float(os.getenv('CHANGEPOINT_MIN_SHIFT_STD', 0.5))
+# Smallest health score shift; matches the 5 points health_trend_from_halves calls a change
+HEALTH_MIN_SHIFT = float(os.getenv('CHANGEPOINT_HEALTH_MIN_SHIFT', 5.0))
+
+# Most blocks kept when change points are computed from streamed chunks;
+# blocks start as single readings and double in size when this fills up
+STREAM_MAX_BLOCKS = int(os.getenv('CHANGEPOINT_STREAM_MAX_BLOCKS', 4096))
+
+
+def unit_sums(values):
+    """(sums, counts, sums of squares) treating every reading as its own unit; NaN counts as missing"""
+    values = np.asarray(values, dtype=np.float64)
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    return filled, present.astype(np.float64), filled * filled
+
+
+def block_sums(values, block_rows):
+    """unit_sums aggregated over consecutive blocks of block_rows readings"""
+    sums, counts, squares = unit_sums(values)
+    starts = np.arange(0, len(sums), block_rows)
+    return np.add.reduceat(sums, starts), np.add.reduceat(counts, starts), np.add.reduceat(squares, starts)
+
+
+def binary_segmentation(sums, counts, squares, min_shift, max_change_points=None, min_segment=None):
+    """Units at which a new segment starts, by greedy binary segmentation
+
+    Units are readings or blocks of readings described by their sum, count
+    and sum of squares. Splitting [a, b) at k reduces the squared error
+    around the segment means by S_l^2/N_l + S_r^2/N_r - S^2/N, which prefix
+    sums give for every k of a segment in one vectorized pass, so each round
+    costs O(segment length) and the whole search O(n log k). The best split
+    anywhere is taken while its gain beats a BIC penalty on the series
+    variance and the two means differ by at least min_shift.
+    """
+    max_change_points = MAX_CHANGE_POINTS if max_change_points is None else max_change_points
+    prefix_sum = np.concatenate(([0.0], np.cumsum(sums)))
+    prefix_count = np.concatenate(([0.0], np.cumsum(counts)))
+    total = prefix_count[-1]
+    if total < 2:
+        return []
+    if min_segment is None:
+        min_segment = max(MIN_SEGMENT_ROWS, MIN_SEGMENT_FRACTION * total)
+
+    variance = max(float(np.sum(squares)) / total - (prefix_sum[-1] / total) ** 2, 0.0)
+    penalty = 2 * variance * np.log(total)
+
+    def best_split(a, b):
+        k = np.arange(a + 1, b)
+        if len(k) == 0:
+            return None
+        n_left = prefix_count[k] - prefix_count[a]
+        n_right = prefix_count[b] - prefix_count[k]
+        s_left = prefix_sum[k] - prefix_sum[a]
+        s_right = prefix_sum[b] - prefix_sum[k]
+        valid = (n_left >= min_segment) & (n_right >= min_segment)
+        if not valid.any():
+            return None
+        n_all = n_left + n_right
+        s_all = s_left + s_right
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gain = s_left ** 2 / n_left + s_right ** 2 / n_right - s_all ** 2 / n_all
+            shift = np.abs(s_right / n_right - s_left / n_left)
+        gain = np.where(valid & (shift >= min_shift), gain, -np.inf)
+        i = int(np.argmax(gain))
+        if not gain[i] > penalty:
+            return None
+        return float(gain[i]), int(k[i])
+
+    boundaries = []
+    candidates = []
+    split = best_split(0, len(sums))
+    if split is not None:
+        heapq.heappush(candidates, (-split[0], split[1], 0, len(sums)))
+
+    while candidates and len(boundaries) < max_change_points:
+        _, k, a, b = heapq.heappop(candidates)
+        boundaries.append(k)
+        for left, right in ((a, k), (k, b)):
+            split = best_split(left, right)
+            if split is not None:
+                heapq.heappush(candidates, (-split[0], split[1], left, right))
+
+    return sorted(boundaries)
+
+
+def describe_segments(boundaries, sums, counts, unit_rows, total_rows, labels, higher_is_worse):
+    """Report block for one series: segments, change points and degradation onset
+
+    unit_rows holds the first reading of each unit and labels(rows) turns
+    reading positions into timestamp labels. A change point is a
+    degradation when the mean moves in the worse direction; the onset is
+    set only while the series is still degrading (its last change point is
+    a degradation) and is where that run of degradations started.
+    """
+    edges = [0] + list(boundaries) + [len(sums)]
+    starts = [int(unit_rows[edge]) for edge in edges[:-1]]
+    ends = [int(unit_rows[edge]) - 1 if edge < len(sums) else total_rows - 1 for edge in edges[1:]]
+    start_labels = labels(starts)
+    end_labels = labels(ends)
+
+    segments = []
+    for i in range(len(edges) - 1):
+        count = float(np.sum(counts[edges[i]:edges[i + 1]]))
+        mean = float(np.sum(sums[edges[i]:edges[i + 1]])) / count if count else None
+        segments.append({
+            'start': start_labels[i],
+            'end': end_labels[i],
+            'readings': ends[i] - starts[i] + 1,
+            'mean': round(mean, 2) if mean is not None else None
+        })
+
+    change_points = []
+    for i in range(1, len(segments)):
+        before, after = segments[i - 1]['mean'], segments[i]['mean']
+        if before is None or after is None:
+            continue
+        degradation = after > before if higher_is_worse else after < before
+        point = {
+            'timestamp': segments[i]['start'],
+            'before': before,
+            'after': after,
+            'shift': round(after - before, 2),
+            'degradation': degradation
+        }
+        change_points.append(point)
+
+    # The first of the trailing run of degradations: when the current decline began
+    onset = None
+    for point in reversed(change_points):
+        if not point['degradation']:
+            break
+        onset = point['timestamp']
+
+    return {
+        'segments': segments,
+        'change_points': change_points,
+        'degradation_onset': onset
+    }
+
+
+def min_sensor_shift(sums, counts, squares):
+    """MIN_SHIFT_STD standard deviations of a series"""
+    total = float(np.sum(counts))
+    if total == 0:
+        return np.inf
+    mean = float(np.sum(sums)) / total
+    variance = max(float(np.sum(squares)) / total - mean * mean, 0.0)
+    return MIN_SHIFT_STD * np.sqrt(variance)
+
+
+class BlockAccumulator:
+    """Per-block sums, counts and squares of several series, fed chunk by chunk
+
+    The row count is unknown until the stream ends, so blocks start as
+    single readings and, whenever max_blocks are full, adjacent pairs merge
+    and the block size doubles. A stream of up to max_blocks readings is
+    thus segmented reading by reading, like the in-memory analysis, and a
+    longer one on at least max_blocks / 2 blocks. Blocks depend only on the
+    row count, not on how the input was chunked, so streamed change points
+    match for any chunk size. The labels of each block's first and last
+    reading are kept for the report.
+    """
+
+    def __init__(self, width, max_blocks=None):
+        self.max_blocks = max(2, (max_blocks or STREAM_MAX_BLOCKS) // 2 * 2)
+        self.width = width
+        self.block_rows = 1
+        self.blocks = 0
+        self.sums = np.zeros((self.max_blocks, width))
+        self.counts = np.zeros((self.max_blocks, width))
+        self.squares = np.zeros((self.max_blocks, width))
+        self.labels = {}
+        self.rows = 0
+
+    def update(self, values, labels):
+        """Fold in a rows x width chunk and its per-row labels"""
+        i = 0
+        while i < len(values):
+            offset = self.rows % self.block_rows
+            if offset:
+                # Fill the last block
+                take = min(self.block_rows - offset, len(values) - i)
+                sums, counts, squares = unit_sums(values[i:i + take])
+                self.sums[self.blocks - 1] += sums.sum(axis=0)
+                self.counts[self.blocks - 1] += counts.sum(axis=0)
+                self.squares[self.blocks - 1] += squares.sum(axis=0)
+            elif self.blocks == self.max_blocks:
+                self._merge()
+                continue
+            else:
+                # As many new blocks as there is room for, in one pass
+                take = min((self.max_blocks - self.blocks) * self.block_rows, len(values) - i)
+                starts = np.arange(0, take, self.block_rows)
+                new = slice(self.blocks, self.blocks + len(starts))
+                sums, counts, squares = unit_sums(values[i:i + take])
+                self.sums[new] = np.add.reduceat(sums, starts)
+                self.counts[new] = np.add.reduceat(counts, starts)
+                self.squares[new] = np.add.reduceat(squares, starts)
+                self.blocks += len(starts)
+                for start in starts.tolist():
+                    self.labels[self.rows + start] = labels[i + start]
+                    if start:
+                        self.labels[self.rows + start - 1] = labels[i + start - 1]
+            self.rows += take
+            i += take
+            self.labels[self.rows - 1] = labels[i - 1]
+
+    def _merge(self):
+        """Sum adjacent pairs of blocks, doubling the block size"""
+        for array in (self.sums, self.counts, self.squares):
+            pairs = array[0::2] + array[1::2]
+            array[:] = 0.0
+            array[:len(pairs)] = pairs
+        self.blocks //= 2
+        self.block_rows *= 2
+        # Only block edges and the last reading are ever labelled
+        self.labels = {
+            row: label for row, label in self.labels.items()
+            if row % self.block_rows == 0 or (row + 1) % self.block_rows == 0 or row == self.rows - 1
+        }
+
+    def series(self, column):
+        """(sums, counts, squares) of one series over the blocks"""
+        return (
+            self.sums[:self.blocks, column].copy(),
+            self.counts[:self.blocks, column].copy(),
+            self.squares[:self.blocks, column].copy()
+        )
+
+    def unit_rows(self):
+        return np.arange(self.blocks) * self.block_rows
+
+    def label(self, rows):
+        return [self.labels[row] for row in rows]
@@ -0,0 +1,145 @@
+import os
+
+import numpy as np
+
+from ingest import SENSOR_COLUMNS
+
+# Recent window: this fraction of the readings, within [MIN, MAX] rows
+WINDOW_FRACTION = float(os.getenv('FORECAST_WINDOW_FRACTION', 0.2))
+MIN_WINDOW_ROWS = int(os.getenv('FORECAST_MIN_WINDOW_ROWS', 30))
+MAX_WINDOW_ROWS = int(os.getenv('FORECAST_MAX_WINDOW_ROWS', 50000))
+
+# Crossings further out than this are reported as beyond the horizon
+MAX_HORIZON_HOURS = float(os.getenv('FORECAST_MAX_HORIZON_HOURS', 720))
+
+# Two-sided 95% normal quantile for the slope band
+CONFIDENCE_Z = 1.96
+# Readings further than this many robust standard deviations from the first fit are dropped
+OUTLIER_Z = 3.5
+
+SECONDS_PER_HOUR = 3600
+
+
+def window_size(n):
+    """Rows in the recent window for n readings"""
+    return int(min(n, max(MIN_WINDOW_ROWS, min(MAX_WINDOW_ROWS, int(n * WINDOW_FRACTION)))))
+
+
+def forecast_thresholds(timestamps, values, thresholds, window_start=None, names=None):
+    """Time until each sensor's warning and critical thresholds are crossed
+
+    timestamps is a datetime64 array for the window (None or containing NaT
+    falls back to reading counts as the time axis) and values the window's
+    rows x sensors matrix with a column per sensor in names (SENSOR_COLUMNS
+    by default); window_start is the label of its first reading.
+    Slopes are per hour, or per reading without timestamps. Each sensor gets
+    a weighted least-squares line over the window, refit once without
+    readings far from the first fit (spikes), so the whole forecast is two
+    passes over the window. The
+    slope's standard error gives an approximate 95% band on the crossing
+    time; autocorrelated readings make the band optimistic.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+
+    use_hours = timestamps is not None and not np.isnat(timestamps).any()
+    if use_hours:
+        seconds = (timestamps - timestamps[0]) / np.timedelta64(1, 's')
+        t = np.asarray(seconds, dtype=np.float64) / SECONDS_PER_HOUR
+        use_hours = n > 1 and t[-1] > t[0]
+    if not use_hours:
+        t = np.arange(n, dtype=np.float64)
+
+    weights = (~np.isnan(values)).astype(np.float64)
+    filled = np.where(weights > 0, values, 0.0)
+    intercept, slope = _weighted_fit(t, filled, weights)
+
+    # One robust reweighting pass: drop readings far off the first line
+    residuals = np.where(weights > 0, filled - (intercept + np.outer(t, slope)), np.nan)
+    with np.errstate(invalid='ignore'):
+        centre = np.nanmedian(residuals, axis=0)
+        scale = 1.4826 * np.nanmedian(np.abs(residuals - centre), axis=0)
+        keep = np.abs(residuals - centre) <= OUTLIER_Z * np.where(scale > 0, scale, np.inf)
+    weights = weights * keep
+    intercept, slope = _weighted_fit(t, filled, weights)
+    slope_se = _slope_standard_error(t, filled, weights, intercept, slope)
+
+    level = intercept + slope * t[-1]
+    horizon = MAX_HORIZON_HOURS if use_hours else None
+    sensors = {}
+    for i, sensor in enumerate(names or SENSOR_COLUMNS):
+        if not np.isfinite(slope[i]):
+            continue
+        band = (slope[i] - CONFIDENCE_Z * slope_se[i], slope[i] + CONFIDENCE_Z * slope_se[i])
+        entry = {
+            'level': round(float(level[i]), 2),
+            'slope': round(float(slope[i]), 6),
+            'slope_band': [round(float(band[0]), 6), round(float(band[1]), 6)]
+        }
+        sensor_thresholds = (thresholds or {}).get(sensor, {})
+        for name in ('warning', 'critical'):
+            if sensor_thresholds.get(name) is not None:
+                entry[name] = _crossing(
+                    float(level[i]), slope[i], band, sensor_thresholds[name], horizon,
+                    timestamps[-1] if use_hours else None
+                )
+        sensors[sensor] = entry
+
+    return {
+        'window_readings': n,
+        'window_start': window_start,
+        'time_unit': 'hours' if use_hours else 'readings',
+        'sensors': sensors
+    }
+
+
+def _weighted_fit(t, values, weights):
+    """Per-column intercept and slope of a weighted least-squares line"""
+    w_sum = weights.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t_mean = (weights * t[:, None]).sum(axis=0) / w_sum
+        y_mean = (weights * values).sum(axis=0) / w_sum
+        dt = t[:, None] - t_mean
+        s_tt = (weights * dt * dt).sum(axis=0)
+        s_ty = (weights * dt * (values - y_mean)).sum(axis=0)
+        slope = s_ty / s_tt
+    return y_mean - slope * t_mean, slope
+
+
+def _slope_standard_error(t, values, weights, intercept, slope):
+    w_sum = weights.sum(axis=0)
+    residuals = values - (intercept + np.outer(t, slope))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = (weights * residuals * residuals).sum(axis=0) / np.maximum(w_sum - 2, 1)
+        t_mean = (weights * t[:, None]).sum(axis=0) / w_sum
+        s_tt = (weights * (t[:, None] - t_mean) ** 2).sum(axis=0)
+        return np.sqrt(variance / s_tt)
+
+
+def _crossing(level, slope, band, threshold, horizon, last_timestamp):
+    """Forecast entry for one threshold: status, time to cross with its band, and ETA"""
+    entry = {'threshold': threshold}
+    if level >= threshold:
+        entry['status'] = 'exceeded'
+        return entry
+    if not slope > 0:
+        entry['status'] = 'not_approaching'
+        return entry
+
+    distance = threshold - level
+    estimate = distance / slope
+    if horizon is not None and estimate > horizon:
+        entry['status'] = 'beyond_horizon'
+        return entry
+
+    entry['status'] = 'forecast'
+    entry['time_to_threshold'] = round(float(estimate), 2)
+    # The steeper slope crosses first; a non-positive lower slope may never cross
+    entry['time_band'] = [
+        round(float(distance / band[1]), 2),
+        round(float(distance / band[0]), 2) if band[0] > 0 else None
+    ]
+    if last_timestamp is not None:
+        eta = last_timestamp + np.timedelta64(int(round(estimate * SECONDS_PER_HOUR)), 's')
+        entry['eta'] = np.datetime_as_string(eta.astype('datetime64[s]'), unit='s').replace('T', ' ')
+    return entry
@@ -0,0 +1,18 @@
+import os
+
+# GUNICORN_PRELOAD=true imports the app (and warms the analyzer) once in the
+# master so the forked workers share it copy-on-write; app.py reads the same flag
+preload_app = os.getenv('GUNICORN_PRELOAD', 'false').lower() in ('1', 'true', 'yes')
+
+# Web workers; parallel.py shares the cores out between them for the
+# analysis pools and reads the same variable
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+
+# Threads per worker (gthread): admission control (admission.py) lets analysis
+# requests hold at most threads - 1 of them, uploads included, so the spare
+# thread keeps /health and /validate-csv answering
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+
+def post_fork(server, worker):
+    server.log.info(f'Worker {worker.pid} forked (preload: {preload_app})')
@@ -0,0 +1,276 @@
+import json
+import logging
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+
+from ingest import SENSOR_COLUMNS
+from streaming import RunningSensorStats
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: single process, no locking needed
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# One record per reading; a day's readings are one .npy file sorted by time
+PARTITION_DTYPE = np.dtype([('timestamp', 'datetime64[ms]')] + [(column, 'float64') for column in SENSOR_COLUMNS])
+
+INDEX_FILE = 'index.json'
+
+
+def parse_time(value):
+    """Parse an ISO date or datetime (str, datetime or None) into datetime64[ms]
+
+    Timezone-aware values keep their wall-clock time, as timestamps do at ingest.
+    Raises ValueError for anything that does not parse.
+    """
+    if value is None or value == '':
+        return None
+    import pandas as pd
+    try:
+        ts = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid time: {value}. Use an ISO date or datetime')
+    if ts is pd.NaT:
+        raise ValueError(f'Invalid time: {value}. Use an ISO date or datetime')
+    if ts.tzinfo is not None:
+        ts = ts.tz_localize(None)
+    return np.datetime64(ts.to_datetime64(), 'ms')
+
+
+class SensorHistoryStore:
+    """Per-machine reading history, partitioned by day under root_dir
+
+    Each machine has a directory with one <YYYY-MM-DD>.npy file per day
+    (PARTITION_DTYPE records sorted by timestamp) and an index.json of
+    per-day aggregates: row count, first/last timestamp, and per sensor the
+    min, max, sum, M2 and co-moment with the row index. Range reads open only
+    the overlapping partitions, memory-mapped, and binary-search the edges;
+    coarse trends are merged from the index without touching the readings.
+    Writers hold an exclusive file lock per machine and replace files
+    atomically, so readers in other workers never see a partial partition.
+    """
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+
+        if not os.path.exists(self.root_dir):
+            os.makedirs(self.root_dir)
+
+    def append(self, machine_id, timestamps, values):
+        """Store readings, replacing any stored reading with the same timestamp
+
+        timestamps is a datetime64 array (NaT rows are skipped) and values a
+        rows x sensors matrix in SENSOR_COLUMNS order. Returns
+        {'stored', 'skipped', 'days'}.
+        """
+        timestamps = np.asarray(timestamps).astype('datetime64[ms]')
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnat(timestamps)
+        timestamps = timestamps[valid]
+        values = values[valid]
+
+        days = timestamps.astype('datetime64[D]')
+        order = np.argsort(days, kind='stable')
+        days, timestamps, values = days[order], timestamps[order], values[order]
+        boundaries = np.flatnonzero(days[1:] != days[:-1]) + 1
+        starts = np.concatenate(([0], boundaries)) if len(days) else np.array([], dtype=np.int64)
+        ends = np.concatenate((boundaries, [len(days)])) if len(days) else np.array([], dtype=np.int64)
+
+        machine_dir = self._machine_dir(machine_id)
+        os.makedirs(machine_dir, exist_ok=True)
+        with self._locked(machine_id):
+            index = self._load_index(machine_id)
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                day = str(days[start])
+                records = np.empty(end - start, dtype=PARTITION_DTYPE)
+                records['timestamp'] = timestamps[start:end]
+                for i, column in enumerate(SENSOR_COLUMNS):
+                    records[column] = values[start:end, i]
+
+                records = _merge_readings(self._read_partition(machine_id, day, mmap=False), records)
+                self._write_partition(machine_id, day, records)
+                index['days'][day] = _partition_summary(records)
+            index['days'] = dict(sorted(index['days'].items()))
+            self._write_index(machine_id, index)
+
+        stored = int(len(timestamps))
+        logger.info(f'Stored {stored} readings for machine {machine_id} in {len(starts)} day partitions')
+        return {
+            'stored': stored,
+            'skipped': int(np.count_nonzero(~valid)),
+            'days': [str(days[start]) for start in starts.tolist()]
+        }
+
+    def frame(self, machine_id, start=None, end=None):
+        """Readings with start <= timestamp < end as a DataFrame, plus the partitions read
+
+        Returns (df, partitions). df has a datetime64 timestamp column and
+        the sensor columns, in time order.
+        """
+        import pandas as pd
+
+        days = self._days_in_range(machine_id, start, end)
+        pieces = []
+        for day in days:
+            records = self._read_partition(machine_id, day)
+            if records is None:
+                continue
+            # Partitions are sorted, so the range edges are two binary searches
+            lo = np.searchsorted(records['timestamp'], start, side='left') if start is not None else 0
+            hi = np.searchsorted(records['timestamp'], end, side='left') if end is not None else len(records)
+            if hi > lo:
+                pieces.append(records[lo:hi])
+
+        records = np.concatenate(pieces) if pieces else np.empty(0, dtype=PARTITION_DTYPE)
+        df = pd.DataFrame({'timestamp': records['timestamp'].astype('datetime64[ns]')})
+        for column in SENSOR_COLUMNS:
+            df[column] = records[column]
+        return df, len(days)
+
+    def trends(self, machine_id, start=None, end=None):
+        """Day-granularity statistics from the index alone
+
+        Every day partition overlapping [start, end) counts in full. Returns
+        (stats, days) where stats is a RunningSensorStats over those readings
+        (its slope is per reading, as in calculate_trends) and days the
+        index entries used, or (None, []) when nothing is stored.
+        """
+        index = self._load_index(machine_id)
+        days = self._days_in_range(machine_id, start, end, index=index)
+        stats = RunningSensorStats(len(SENSOR_COLUMNS))
+        entries = []
+        for day in days:
+            entry = index['days'][day]
+            stats.merge_summary(
+                entry['rows'],
+                [total / entry['rows'] for total in entry['sum']],
+                entry['m2'],
+                entry['c_xy'],
+                entry['min'],
+                entry['max'],
+                entry['first'],
+                stats.n
+            )
+            entries.append({'day': day, **entry})
+        if stats.n == 0:
+            return None, []
+        return stats, entries
+
+    def summary(self, machine_id):
+        """Stored days and reading counts, or None when the machine has no history"""
+        index = self._load_index(machine_id)
+        if not index['days']:
+            return None
+        days = list(index['days'])
+        return {
+            'machine_id': str(machine_id),
+            'partitions': len(days),
+            'total_readings': sum(entry['rows'] for entry in index['days'].values()),
+            'first_timestamp': index['days'][days[0]]['first_timestamp'],
+            'last_timestamp': index['days'][days[-1]]['last_timestamp'],
+            'days': {day: entry['rows'] for day, entry in index['days'].items()}
+        }
+
+    def _days_in_range(self, machine_id, start, end, index=None):
+        index = index or self._load_index(machine_id)
+        first_day = str(start.astype('datetime64[D]')) if start is not None else None
+        # end is exclusive: a range ending at midnight doesn't need that day
+        last_day = str((end - np.timedelta64(1, 'ms')).astype('datetime64[D]')) if end is not None else None
+        return [
+            day for day in index['days']
+            if (first_day is None or day >= first_day) and (last_day is None or day <= last_day)
+        ]
+
+    def _read_partition(self, machine_id, day, mmap=True):
+        path = self._partition_path(machine_id, day)
+        try:
+            return np.load(path, mmap_mode='r' if mmap else None)
+        except FileNotFoundError:
+            return None
+
+    def _write_partition(self, machine_id, day, records):
+        path = self._partition_path(machine_id, day)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, records)
+        os.replace(tmp_path, path)
+
+    def _load_index(self, machine_id):
+        try:
+            with open(os.path.join(self._machine_dir(machine_id), INDEX_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'days': {}}
+
+    def _write_index(self, machine_id, index):
+        path = os.path.join(self._machine_dir(machine_id), INDEX_FILE)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, path)
+
+    def _machine_dir(self, machine_id):
+        safe_id = re.sub(r'[^A-Za-z0-9_-]', '_', str(machine_id))
+        return os.path.join(self.root_dir, safe_id)
+
+    def _partition_path(self, machine_id, day):
+        return os.path.join(self._machine_dir(machine_id), f'{day}.npy')
+
+    @contextmanager
+    def _locked(self, machine_id):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self._machine_dir(machine_id), '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _merge_readings(existing, incoming):
+    """Time-sorted union of two partitions; incoming wins on equal timestamps"""
+    if existing is None or len(existing) == 0:
+        records = incoming
+    else:
+        records = np.concatenate((np.asarray(existing), incoming))
+    records = records[np.argsort(records['timestamp'], kind='stable')]
+    # Keep the last of each run of equal timestamps (the newest write)
+    keep = np.ones(len(records), dtype=bool)
+    keep[:-1] = records['timestamp'][1:] != records['timestamp'][:-1]
+    return records[keep]
+
+
+def _partition_summary(records):
+    """Index entry for a partition: the mergeable moments RunningSensorStats needs"""
+    values = np.column_stack([records[column] for column in SENSOR_COLUMNS])
+    n = len(values)
+    x = np.arange(n, dtype=np.float64)
+    dx = x - x.mean()
+    mean = values.mean(axis=0)
+    dy = values - mean
+    return {
+        'rows': n,
+        'first_timestamp': _label(records['timestamp'][0]),
+        'last_timestamp': _label(records['timestamp'][-1]),
+        'first': values[0].tolist(),
+        'min': values.min(axis=0).tolist(),
+        'max': values.max(axis=0).tolist(),
+        'sum': values.sum(axis=0).tolist(),
+        'm2': np.einsum('ij,ij->j', dy, dy).tolist(),
+        'c_xy': (dx @ dy).tolist()
+    }
+
+
+def _label(timestamp):
+    """'%Y-%m-%d %H:%M:%S' text, with milliseconds only when there are any"""
+    seconds = timestamp.astype('datetime64[s]')
+    unit = 's' if seconds == timestamp else 'ms'
+    return np.datetime_as_string(timestamp, unit=unit).replace('T', ' ')
@@ -0,0 +1,613 @@
+import csv
+import hashlib
+import logging
+import mmap
+import os
+import statistics
+import tempfile
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Columns the analyzer uses; every format is projected down to these
+ANALYSIS_COLUMNS = ['timestamp', 'temperature', 'vibration', 'current']
+SENSOR_COLUMNS = ['temperature', 'vibration', 'current']
+
+# Sensor dtype: float32 halves reading memory at single precision
+FLOAT_DTYPE = os.getenv('INGEST_FLOAT_DTYPE', 'float64')
+
+# 'pyarrow' parses CSV with multiple threads when pyarrow is installed
+CSV_ENGINE = os.getenv('INGEST_CSV_ENGINE', 'c')
+
+# Timestamps in this format are parsed to datetime64; str() of the parsed
+# value reproduces the text exactly, so report labels are unchanged
+CANONICAL_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+PARQUET_MAGIC = b'PAR1'
+ARROW_FILE_MAGIC = b'ARROW1'
+ARROW_STREAM_MARKER = b'\xff\xff\xff\xff'
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Bytes inspected to tell plain-text CSV from unknown binary content
+TEXT_SNIFF_BYTES = 4096
+
+# Uploads up to this size stay in memory; larger ones spill to an unnamed temporary file
+UPLOAD_SPOOL_MEMORY_BYTES = int(os.getenv('UPLOAD_SPOOL_MEMORY_MB', 8)) * 1024 * 1024
+
+# Readings inspected by sniff_upload for dtypes and timestamp format
+SNIFF_SAMPLE_ROWS = int(os.getenv('VALIDATE_SAMPLE_ROWS', 200))
+# Block size for scanning uploads (newline counting, decompression)
+SCAN_BLOCK_BYTES = 1024 * 1024
+
+# Smallest on-disk size of a reading in formats whose row count isn't cheap to read
+ESTIMATED_BYTES_PER_ROW = {'csv_gzip': 8, 'csv_zstd': 8, 'arrow': 32, 'arrow_stream': 32}
+
+SUPPORTED_FORMATS_MESSAGE = 'Upload a CSV (optionally gzip or zstd compressed), Parquet or Arrow IPC file'
+
+
+class UploadSpool(tempfile.SpooledTemporaryFile):
+    """An upload body held in memory up to max_size, then in an unlinked temporary file
+
+    app.py makes this the request's file stream, so an upload is written
+    once while the request is parsed and then analyzed where it is: view()
+    is the in-memory buffer itself or a read-only memory map of the spilled
+    file. The temporary file never has a name on disk, so nothing is left
+    behind when a worker is killed mid-analysis.
+    """
+
+    def __init__(self, max_size=None, dir=None):
+        super().__init__(max_size=max_size or UPLOAD_SPOOL_MEMORY_BYTES, mode='w+b', dir=dir)
+        self._map = None
+
+    def view(self):
+        """Seekable binary reader over the upload, without copying it"""
+        if not self._rolled:
+            self.seek(0)
+            return self
+        if self._map is None:
+            self.flush()
+            self._map = _UploadMap(self.fileno(), 0, access=mmap.ACCESS_READ)
+        self._map.seek(0)
+        return self._map
+
+    def sha256(self):
+        """Hex digest of the upload, hashed in place"""
+        if not self._rolled:
+            with self._file.getbuffer() as buffer:
+                return hashlib.sha256(buffer).hexdigest()
+        return hashlib.sha256(self.view()).hexdigest()
+
+    def close(self):
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # A zero-copy Arrow buffer still points into the map; it unmaps when that is freed
+                pass
+            self._map = None
+        super().close()
+
+
+class _UploadMap(mmap.mmap):
+    """Read-only memory map that pandas recognises as a binary file"""
+    mode = 'rb'
+
+
+class UnsupportedFormatError(ValueError):
+    """Raised when an upload is not a recognised sensor data format"""
+
+
+def detect_format(source):
+    """Identify an upload from its leading bytes rather than its file name
+
+    Returns one of 'parquet', 'arrow', 'arrow_stream', 'csv_gzip', 'csv_zstd'
+    or 'csv'; raises UnsupportedFormatError for other binary content.
+    """
+    head = _peek(source, TEXT_SNIFF_BYTES)
+
+    if head.startswith(PARQUET_MAGIC):
+        return 'parquet'
+    if head.startswith(ARROW_FILE_MAGIC):
+        return 'arrow'
+    if head.startswith(ARROW_STREAM_MARKER):
+        return 'arrow_stream'
+    if head.startswith(GZIP_MAGIC):
+        return 'csv_gzip'
+    if head.startswith(ZSTD_MAGIC):
+        return 'csv_zstd'
+    if b'\x00' in head:
+        raise UnsupportedFormatError(f'Unsupported file format. {SUPPORTED_FORMATS_MESSAGE}')
+    return 'csv'
+
+
+def read_sensor_header(source, fmt=None):
+    """Column names of an upload, read without parsing its rows"""
+    fmt = fmt or detect_format(source)
+    _rewind(source)
+
+    if fmt in ('csv', 'csv_gzip', 'csv_zstd'):
+        import pandas as pd
+        columns = list(pd.read_csv(source, nrows=0, compression=_csv_compression(fmt)).columns)
+        _rewind(source)
+        return columns
+
+    if fmt == 'parquet':
+        pq = _import_pyarrow('parquet')
+        names = pq.ParquetFile(_arrow_source(source)).schema_arrow.names
+    else:
+        pa = _import_pyarrow()
+        handle = _arrow_source(source)
+        reader = pa.ipc.open_file(handle) if fmt == 'arrow' else pa.ipc.open_stream(handle)
+        names = reader.schema.names
+    _rewind(source)
+    return list(names)
+
+
+def read_sensor_frame(source, fmt=None, columns=None, extra_columns=(), sensors=None):
+    """Load the analysis columns of an upload of any supported format
+
+    Sensor columns get an explicit float dtype and canonical timestamps are
+    parsed once to datetime64 (see parse_timestamps). columns, when known
+    from read_sensor_header, saves re-reading the CSV header. extra_columns
+    (such as machine_id) are read too, as text. sensors names the sensor
+    columns to read (SENSOR_COLUMNS by default).
+    """
+    import pandas as pd
+
+    fmt = fmt or detect_format(source)
+    _rewind(source)
+
+    if fmt in ('csv', 'csv_gzip', 'csv_zstd'):
+        columns = columns if columns is not None else read_sensor_header(source, fmt)
+        if _csv_engine() == 'pyarrow':
+            df = _read_csv_pyarrow(source, fmt, columns, extra_columns, sensors)
+        else:
+            df = pd.read_csv(
+                source, compression=_csv_compression(fmt), **_csv_read_options(columns, extra_columns=extra_columns, sensors=sensors)
+            )
+    else:
+        df = _read_arrow_table(source, fmt, extra_columns, sensors).to_pandas()
+        present = [col for col in sensors or SENSOR_COLUMNS if col in df.columns]
+        df[present] = df[present].astype(FLOAT_DTYPE)
+        for col in extra_columns:
+            if col in df.columns:
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+
+    if 'timestamp' in df.columns:
+        df['timestamp'] = parse_timestamps(df['timestamp'])
+    return df
+
+
+def parse_timestamps(column):
+    """datetime64 version of a timestamp column, or the column unchanged
+
+    Only columns entirely in CANONICAL_TIMESTAMP_FORMAT with no missing
+    values are converted, so labels taken from the parsed values match the
+    uploaded text. Anything else keeps its original values.
+    """
+    import pandas as pd
+
+    if pd.api.types.is_datetime64_any_dtype(column) or len(column) == 0 or column.isna().any():
+        return column
+
+    from pandas.tseries.api import guess_datetime_format
+    if guess_datetime_format(str(column.iloc[0])) != CANONICAL_TIMESTAMP_FORMAT:
+        return column
+
+    parsed = pd.to_datetime(column, format=CANONICAL_TIMESTAMP_FORMAT, errors='coerce')
+    if parsed.isna().any():
+        return column
+    return parsed
+
+
+def iter_sensor_chunks(source, chunksize, fmt=None, sensors=None):
+    """Yield DataFrame chunks of the analysis columns with a continuous row index
+
+    sensors names the sensor columns to read (SENSOR_COLUMNS by default).
+    """
+    import pandas as pd
+
+    fmt = fmt or detect_format(source)
+
+    if fmt in ('csv', 'csv_gzip', 'csv_zstd'):
+        # The pyarrow engine has no chunked reader, so chunks always use the C parser.
+        # Chunks are small and converted to float64 by the caller, so no float32 here
+        yield from pd.read_csv(
+            source,
+            chunksize=chunksize,
+            compression=_csv_compression(fmt),
+            **_csv_read_options(read_sensor_header(source, fmt), float_dtype='float64', sensors=sensors)
+        )
+        return
+
+    start = 0
+    for batch in _iter_arrow_batches(source, fmt, chunksize, sensors=sensors):
+        chunk = batch.to_pandas()
+        chunk.index = pd.RangeIndex(start, start + len(chunk))
+        start += len(chunk)
+        yield chunk
+
+
+def describe_upload(source, fmt=None):
+    """(columns, row count) of an upload; binary formats answer from metadata"""
+    fmt = fmt or detect_format(source)
+
+    if fmt == 'parquet':
+        pq = _import_pyarrow('parquet')
+        metadata = pq.ParquetFile(_arrow_source(source))
+        return list(metadata.schema_arrow.names), metadata.metadata.num_rows
+
+    if fmt in ('arrow', 'arrow_stream'):
+        rows = 0
+        names = None
+        for batch in _iter_arrow_batches(source, fmt, None, project=False):
+            names = batch.schema.names
+            rows += batch.num_rows
+        return list(names or []), rows
+
+    columns = read_sensor_header(source, fmt)
+    return columns, len(read_sensor_frame(source, fmt, columns=columns))
+
+
+def sniff_upload(source, fmt=None, sample_rows=None):
+    """Columns, row count, dtypes and timestamp metadata without building a DataFrame
+
+    CSV uploads are checked from the header and the first sample_rows
+    lines, and their rows counted by scanning newline bytes (a quoted field
+    containing a newline would count twice); the last timestamp comes from
+    the final line. Parquet and Arrow answer from their schema and metadata
+    and read only the timestamp column. dtypes maps each column to
+    'numeric', 'timestamp', 'text' or 'empty' as seen in the sample.
+    """
+    fmt = fmt or detect_format(source)
+    sample_rows = sample_rows or SNIFF_SAMPLE_ROWS
+
+    if fmt in ('csv', 'csv_gzip', 'csv_zstd'):
+        columns, rows, sample, last_row = _sniff_csv(source, fmt, sample_rows)
+        dtypes = {col: _sample_dtype([row[i] if i < len(row) else '' for row in sample]) for i, col in enumerate(columns)}
+        first_timestamps = last_timestamp = None
+        if 'timestamp' in columns:
+            position = columns.index('timestamp')
+            first_timestamps = [row[position] for row in sample if position < len(row)]
+            last_timestamp = last_row[position] if last_row is not None and position < len(last_row) else None
+    else:
+        columns, rows, dtypes, first_timestamps, last_timestamp = _sniff_arrow(source, fmt, sample_rows)
+
+    return {
+        'columns': columns,
+        'rows': rows,
+        'dtypes': dtypes,
+        'timestamp': _timestamp_metadata(first_timestamps, last_timestamp) if 'timestamp' in columns else None
+    }
+
+
+def estimate_rows(source, fmt=None):
+    """Approximate row count of an upload without parsing it
+
+    Plain CSV counts its lines and Parquet reads its metadata; compressed
+    CSV and Arrow are estimated from their size.
+    """
+    fmt = fmt or detect_format(source)
+
+    if fmt == 'parquet':
+        pq = _import_pyarrow('parquet')
+        return pq.ParquetFile(_arrow_source(source)).metadata.num_rows
+
+    if fmt == 'csv':
+        lines = sum(block.count(b'\n') for block in _iter_blocks(source))
+        # Header out, unterminated last line in: close enough either way
+        return max(lines, 1)
+
+    return source_size(source) // ESTIMATED_BYTES_PER_ROW[fmt]
+
+
+def source_size(source):
+    """Size in bytes of a path or seekable binary file-like upload"""
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    return size
+
+
+def _sniff_csv(source, fmt, sample_rows):
+    """(columns, data rows, sample rows, last row) of a CSV from one scan of its bytes"""
+    head = b''
+    lines = 0
+    tail = b''
+    for block in _iter_text_blocks(source, fmt):
+        if head.count(b'\n') <= sample_rows:
+            head += block
+        lines += block.count(b'\n')
+        # Keep enough of the end to hold the last complete line
+        tail = block[-64 * 1024:] if len(block) >= 64 * 1024 else (tail + block)[-64 * 1024:]
+
+    # Blank trailing lines and a missing final newline don't change the row count
+    stripped = tail.rstrip(b'\r\n \t')
+    lines -= tail.count(b'\n') - stripped.count(b'\n')
+    if stripped:
+        lines += 1
+
+    head_lines = [line.decode('utf-8', errors='replace') for line in head.split(b'\n', sample_rows + 1)[:sample_rows + 1]]
+    parsed = list(csv.reader(line.rstrip('\r') for line in head_lines if line.strip()))
+    if not parsed:
+        return [], 0, [], None
+    columns = [name.strip() for name in parsed[0]]
+    last_line = stripped.rsplit(b'\n', 1)[-1].decode('utf-8', errors='replace')
+    last_row = next(csv.reader([last_line])) if lines > 1 else None
+    return columns, max(lines - 1, 0), parsed[1:], last_row
+
+
+def _sniff_arrow(source, fmt, sample_rows):
+    """sniff_upload for Parquet and Arrow: schema, metadata and the timestamp column only"""
+    pa = _import_pyarrow()
+    handle = _arrow_source(source)
+    if fmt == 'parquet':
+        pq = _import_pyarrow('parquet')
+        parquet_file = pq.ParquetFile(handle)
+        schema = parquet_file.schema_arrow
+        rows = parquet_file.metadata.num_rows
+        timestamps = parquet_file.read(columns=['timestamp']).column(0) if 'timestamp' in schema.names else None
+    else:
+        reader = pa.ipc.open_file(handle) if fmt == 'arrow' else pa.ipc.open_stream(handle)
+        schema = reader.schema
+        table = reader.read_all()
+        rows = table.num_rows
+        timestamps = table.column('timestamp') if 'timestamp' in schema.names else None
+
+    dtypes = {}
+    for field in schema:
+        if pa.types.is_integer(field.type) or pa.types.is_floating(field.type) or pa.types.is_decimal(field.type):
+            dtypes[field.name] = 'numeric'
+        elif pa.types.is_timestamp(field.type) or pa.types.is_date(field.type):
+            dtypes[field.name] = 'timestamp'
+        else:
+            dtypes[field.name] = 'text'
+
+    first_timestamps = last_timestamp = None
+    if timestamps is not None and len(timestamps):
+        first_timestamps = [_arrow_label(value) for value in timestamps.slice(0, sample_rows).to_pylist()]
+        last_timestamp = _arrow_label(timestamps[len(timestamps) - 1].as_py())
+        if dtypes['timestamp'] == 'text':
+            dtypes['timestamp'] = _sample_dtype(first_timestamps)
+    _rewind(source)
+    return list(schema.names), rows, dtypes, first_timestamps, last_timestamp
+
+
+def _arrow_label(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None).strftime(CANONICAL_TIMESTAMP_FORMAT)
+    return str(value)
+
+
+def _sample_dtype(values):
+    values = [value.strip() for value in values if value is not None and value.strip()]
+    if not values:
+        return 'empty'
+    try:
+        for value in values:
+            float(value)
+        return 'numeric'
+    except ValueError:
+        pass
+    if all(_parse_timestamp(value)[0] is not None for value in values):
+        return 'timestamp'
+    return 'text'
+
+
+def _parse_timestamp(value):
+    """(datetime, format name) of a timestamp label, or (None, None)"""
+    try:
+        return datetime.strptime(value, CANONICAL_TIMESTAMP_FORMAT), 'canonical'
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value), 'iso8601'
+    except ValueError:
+        return None, None
+
+
+def _timestamp_metadata(first_timestamps, last_timestamp):
+    """Format, first/last value and median sampling interval of a timestamp sample"""
+    values = [value.strip() for value in first_timestamps or [] if value and value.strip()]
+    if not values:
+        return {'format': None, 'first': None, 'last': last_timestamp, 'sampling_interval_seconds': None}
+
+    parsed = [_parse_timestamp(value) for value in values]
+    formats = {name for _, name in parsed}
+    if None in formats:
+        timestamp_format = 'unrecognized'
+    else:
+        timestamp_format = 'canonical' if formats == {'canonical'} else 'iso8601'
+
+    interval = None
+    times = [parsed_time for parsed_time, _ in parsed if parsed_time is not None]
+    try:
+        gaps = [(b - a).total_seconds() for a, b in zip(times, times[1:])]
+    except TypeError:
+        # Mixed timezone-aware and naive values
+        gaps = []
+    gaps = [gap for gap in gaps if gap > 0]
+    if gaps:
+        interval = statistics.median(gaps)
+
+    return {
+        'format': timestamp_format,
+        'first': values[0],
+        'last': last_timestamp.strip() if last_timestamp else None,
+        'sampling_interval_seconds': interval
+    }
+
+
+def _iter_text_blocks(source, fmt):
+    """Decompressed CSV bytes of an upload in SCAN_BLOCK_BYTES blocks"""
+    if fmt == 'csv':
+        yield from _iter_blocks(source, SCAN_BLOCK_BYTES)
+        return
+
+    handle = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else source
+    _rewind(handle)
+    try:
+        if fmt == 'csv_gzip':
+            import gzip
+            reader = gzip.GzipFile(fileobj=handle, mode='rb')
+        else:
+            import zstandard
+            reader = zstandard.ZstdDecompressor().stream_reader(handle, closefd=False)
+        yield from iter(lambda: reader.read(SCAN_BLOCK_BYTES), b'')
+    finally:
+        if handle is not source:
+            handle.close()
+        else:
+            _rewind(source)
+
+
+def _csv_read_options(columns, float_dtype=FLOAT_DTYPE, extra_columns=(), sensors=None):
+    """usecols/dtype for pd.read_csv: analysis columns only, typed up front"""
+    usecols = _projection(columns, extra_columns, sensors)
+    dtype = {col: float_dtype for col in sensors or SENSOR_COLUMNS if col in usecols}
+    # Kept as text so parse_timestamps decides; engines may otherwise infer dates
+    for col in ['timestamp'] + list(extra_columns):
+        if col in usecols:
+            dtype[col] = str
+    return {'usecols': usecols, 'dtype': dtype}
+
+
+def _read_csv_pyarrow(source, fmt, columns, extra_columns=(), sensors=None):
+    """Multithreaded CSV parse with the same column selection and types as the C path"""
+    pa = _import_pyarrow()
+    import pyarrow.csv as pa_csv
+
+    options = _csv_read_options(columns, extra_columns=extra_columns, sensors=sensors)
+    column_types = {col: pa.float32() if FLOAT_DTYPE == 'float32' else pa.float64() for col in sensors or SENSOR_COLUMNS}
+    # Explicit string type: pyarrow would otherwise turn ISO timestamps into dates itself
+    for col in ['timestamp'] + list(extra_columns):
+        column_types[col] = pa.string()
+    stream = pa.input_stream(_arrow_source(source), compression={'csv': None, 'csv_gzip': 'gzip', 'csv_zstd': 'zstd'}[fmt])
+    table = pa_csv.read_csv(
+        stream,
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=options['usecols'],
+            column_types={col: column_types[col] for col in options['usecols']}
+        )
+    )
+    _rewind(source)
+    return table.to_pandas()
+
+
+def _csv_engine():
+    if CSV_ENGINE != 'pyarrow':
+        return 'c'
+    try:
+        import pyarrow  # noqa: F401
+        return 'pyarrow'
+    except ImportError:
+        logger.warning('INGEST_CSV_ENGINE=pyarrow but pyarrow is not installed; using the C parser')
+        return 'c'
+
+
+def _csv_compression(fmt):
+    return {'csv': None, 'csv_gzip': 'gzip', 'csv_zstd': 'zstd'}[fmt]
+
+
+def _read_arrow_table(source, fmt, extra_columns=(), sensors=None):
+    pa = _import_pyarrow()
+    if fmt == 'parquet':
+        pq = _import_pyarrow('parquet')
+        handle = _arrow_source(source)
+        names = pq.ParquetFile(handle).schema_arrow.names
+        return pq.read_table(handle, columns=_projection(names, extra_columns, sensors))
+
+    batches = list(_iter_arrow_batches(source, fmt, None, extra_columns=extra_columns, sensors=sensors))
+    if not batches:
+        return pa.table({})
+    return pa.Table.from_batches(batches)
+
+
+def _iter_arrow_batches(source, fmt, chunksize, project=True, extra_columns=(), sensors=None):
+    pa = _import_pyarrow()
+
+    if fmt == 'parquet':
+        pq = _import_pyarrow('parquet')
+        parquet_file = pq.ParquetFile(_arrow_source(source))
+        columns = _projection(parquet_file.schema_arrow.names, extra_columns, sensors) if project else None
+        yield from parquet_file.iter_batches(batch_size=chunksize or 65536, columns=columns)
+        return
+
+    handle = _arrow_source(source)
+    if fmt == 'arrow':
+        reader = pa.ipc.open_file(handle)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        schema = reader.schema
+    else:
+        reader = pa.ipc.open_stream(handle)
+        batches = iter(reader)
+        schema = reader.schema
+
+    columns = _projection(schema.names, extra_columns, sensors) if project else None
+    for batch in batches:
+        if columns is not None:
+            batch = batch.select(columns)
+        if chunksize:
+            for offset in range(0, batch.num_rows, chunksize):
+                yield batch.slice(offset, chunksize)
+        else:
+            yield batch
+
+
+def _projection(names, extra_columns=(), sensors=None):
+    wanted = ['timestamp'] + list(sensors) if sensors is not None else list(ANALYSIS_COLUMNS)
+    return [name for name in wanted + list(extra_columns) if name in names]
+
+
+def _import_pyarrow(module=None):
+    try:
+        if module == 'parquet':
+            import pyarrow.parquet as pq
+            return pq
+        import pyarrow as pa
+        import pyarrow.ipc  # noqa: F401
+        return pa
+    except ImportError:
+        raise UnsupportedFormatError('Parquet and Arrow uploads require pyarrow to be installed')
+
+
+def _peek(source, size):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return f.read(size)
+    position = source.tell()
+    source.seek(0)
+    head = source.read(size)
+    source.seek(position)
+    return head
+
+
+def _iter_blocks(source, size=1024 * 1024):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield from iter(lambda: f.read(size), b'')
+        return
+    source.seek(0)
+    yield from iter(lambda: source.read(size), b'')
+    source.seek(0)
+
+
+def _arrow_source(source):
+    """Zero-copy pyarrow input: file paths and memory-mapped uploads are read in place"""
+    if isinstance(source, (str, os.PathLike)):
+        return _import_pyarrow().memory_map(source)
+    if isinstance(source, mmap.mmap):
+        pa = _import_pyarrow()
+        return pa.BufferReader(pa.py_buffer(source))
+    _rewind(source)
+    return source
+
+
+def _rewind(source):
+    if not isinstance(source, (str, os.PathLike)):
+        source.seek(0)
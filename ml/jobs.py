@@ -0,0 +1,244 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from serialization import decode_json, encode_json
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATES = ('completed', 'failed', 'cancelled')
+
+# Imported once in the fork server so every job worker starts with them loaded
+JOB_WORKER_PRELOAD = ['pandas', 'sklearn.ensemble', 'joblib', 'model']
+
+
+def analysis_mp_context():
+    """Fork server context for analysis worker processes
+
+    Forking the web worker directly could copy a lock held by one of its
+    threads (such as the background import in app.py) and deadlock the
+    child; a fork server is a clean single-threaded parent.
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(JOB_WORKER_PRELOAD)
+    return context
+
+
+class AnalysisCancelled(Exception):
+    """Raised from the progress callback when a job has been cancelled"""
+
+
+class JobStore:
+    """Job status, results and cancel markers kept as files in one directory
+
+    Gunicorn workers are separate processes, so a job submitted to one worker
+    must be visible to whichever worker serves GET /jobs/<id>. Every write is
+    an atomic replace so readers never see a partial record.
+    """
+
+    def __init__(self, job_dir, result_ttl=None):
+        self.job_dir = job_dir
+        self.result_ttl = result_ttl if result_ttl is not None else int(os.getenv('JOB_RESULT_TTL_SECONDS', 3600))
+
+        if not os.path.exists(self.job_dir):
+            os.makedirs(self.job_dir)
+
+    def create(self, job_id, **fields):
+        record = {
+            'job_id': job_id,
+            'status': 'queued',
+            'progress': 0.0,
+            'stage': 'queued',
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            'error': None
+        }
+        record.update(fields)
+        self._write(self._status_path(job_id), record)
+        return record
+
+    def get(self, job_id):
+        return self._read(self._status_path(job_id))
+
+    def update(self, job_id, **fields):
+        record = self.get(job_id)
+        if record is None:
+            return None
+        record.update(fields)
+        self._write(self._status_path(job_id), record)
+        return record
+
+    def finish(self, job_id, status, result=None, error=None):
+        if result is not None:
+            self._write(self._result_path(job_id), result)
+        return self.update(
+            job_id,
+            status=status,
+            progress=1.0 if status == 'completed' else self.get(job_id).get('progress', 0.0),
+            stage=status,
+            error=error,
+            finished_at=datetime.now().isoformat(),
+            expires_at=datetime.fromtimestamp(time.time() + self.result_ttl).isoformat()
+        )
+
+    def result(self, job_id):
+        return self._read(self._result_path(job_id))
+
+    def request_cancel(self, job_id):
+        with open(self._cancel_path(job_id), 'w'):
+            pass
+
+    def is_cancelled(self, job_id):
+        return os.path.exists(self._cancel_path(job_id))
+
+    def purge_expired(self):
+        """Delete files of finished jobs whose results have expired"""
+        now = datetime.now().isoformat()
+        for name in os.listdir(self.job_dir):
+            if not name.endswith('.status.json'):
+                continue
+            job_id = name[:-len('.status.json')]
+            record = self.get(job_id)
+            if record and record['status'] in FINISHED_STATES and record.get('expires_at', now) < now:
+                self.delete(job_id)
+
+    def delete(self, job_id):
+        for path in (self._status_path(job_id), self._result_path(job_id), self._cancel_path(job_id)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _status_path(self, job_id):
+        return os.path.join(self.job_dir, f'{job_id}.status.json')
+
+    def _result_path(self, job_id):
+        return os.path.join(self.job_dir, f'{job_id}.result.json')
+
+    def _cancel_path(self, job_id):
+        return os.path.join(self.job_dir, f'{job_id}.cancel')
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return decode_json(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(encode_json(data))
+        os.replace(tmp_path, path)
+
+
+def run_analysis_job(job_dir, job_id, filepath, analysis_mode, options):
+    """Process-pool entry point: run one analysis and record its outcome"""
+    from model import analyzer
+
+    store = JobStore(job_dir)
+    try:
+        if store.is_cancelled(job_id):
+            store.finish(job_id, 'cancelled')
+            return
+
+        store.update(job_id, status='running', stage='starting', started_at=datetime.now().isoformat())
+
+        def progress(stage, fraction):
+            if store.is_cancelled(job_id):
+                raise AnalysisCancelled(f'Job {job_id} was cancelled')
+            store.update(job_id, stage=stage, progress=round(fraction, 3))
+
+        analyze = analyzer.analyze_csv_stream if analysis_mode == 'stream' else analyzer.analyze_csv
+        result = analyze(filepath, progress=progress, **options)
+
+        if store.is_cancelled(job_id):
+            store.finish(job_id, 'cancelled')
+        elif result.get('success'):
+            store.finish(job_id, 'completed', result=result)
+        else:
+            store.finish(job_id, 'failed', result=result, error=result.get('error'))
+    except Exception as e:
+        store.finish(job_id, 'failed', error=str(e))
+    finally:
+        try:
+            os.remove(filepath)
+        except OSError:
+            pass
+
+
+class JobManager:
+    """Bounded process pool for analysis jobs submitted through POST /jobs"""
+
+    def __init__(self, job_dir, max_workers=None, max_pending=None):
+        self.store = JobStore(job_dir)
+        self.max_workers = max_workers or int(os.getenv('JOB_WORKERS', 2))
+        self.max_pending = max_pending or int(os.getenv('JOB_MAX_PENDING', 16))
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def pending_count(self):
+        with self._lock:
+            self._futures = {
+                job_id: entry for job_id, entry in self._futures.items() if not entry[0].done()
+            }
+            return len(self._futures)
+
+    def submit(self, filepath, analysis_mode, options, **fields):
+        """Queue an analysis; returns the job record, or None when the queue is full"""
+        self.store.purge_expired()
+        if self.pending_count() >= self.max_pending:
+            return None
+
+        job_id = uuid.uuid4().hex
+        record = self.store.create(job_id, analysis_mode=analysis_mode, **fields)
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._mp_context())
+                atexit.register(self._executor.shutdown, wait=True, cancel_futures=True)
+            future = self._executor.submit(
+                run_analysis_job, self.store.job_dir, job_id, filepath, analysis_mode, options
+            )
+            self._futures[job_id] = (future, filepath)
+
+        logger.info(f'Queued analysis job {job_id} ({analysis_mode})')
+        return record
+
+    def _mp_context(self):
+        return analysis_mp_context()
+
+    def status(self, job_id):
+        record = self.store.get(job_id)
+        if record is not None and record['status'] == 'completed':
+            record['result'] = self.store.result(job_id)
+        return record
+
+    def cancel(self, job_id):
+        """Cancel a job: queued jobs are dropped, running ones stop at the next stage"""
+        record = self.store.get(job_id)
+        if record is None or record['status'] in FINISHED_STATES:
+            return record
+
+        self.store.request_cancel(job_id)
+        with self._lock:
+            entry = self._futures.get(job_id)
+        if entry is not None and entry[0].cancel():
+            # Never started, so the worker won't clean up after it
+            self.store.finish(job_id, 'cancelled')
+            try:
+                os.remove(entry[1])
+            except OSError:
+                pass
+        return self.store.get(job_id)
@@ -0,0 +1,229 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds (the implicit +Inf bucket is added on render)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 4e6, 16e6, 64e6, 256e6, 1e9)
+
+METRIC_PREFIX = 'factorypulse_ml_'
+
+# name -> (type, help, buckets)
+METRIC_DEFINITIONS = {
+    'http_request_duration_seconds': ('histogram', 'Request latency by route', LATENCY_BUCKETS),
+    'http_requests_in_flight': ('gauge', 'Requests currently being handled', None),
+    'upload_bytes': ('histogram', 'Size of uploaded analysis files', BYTES_BUCKETS),
+    'rows_analyzed_total': ('counter', 'Sensor readings analyzed', None),
+    'analysis_stage_seconds': ('histogram', 'Duration of each analysis stage', LATENCY_BUCKETS),
+    'anomaly_model_fit_seconds': ('histogram', 'IsolationForest fit time', LATENCY_BUCKETS),
+    'admission_rejected_total': ('counter', 'Analyses refused with 429 by admission control', None),
+    'report_encode_seconds': ('histogram', 'Time to serialize and compress a report response', LATENCY_BUCKETS),
+    'report_bytes': ('histogram', 'Size of report responses as sent', BYTES_BUCKETS)
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Metrics:
+    """Process-local counters, gauges and histograms with Prometheus text output
+
+    Recording is a dict update under a lock. Because gunicorn workers and job
+    pool processes each hold their own registry, a background thread in every
+    process writes a snapshot to state_dir once a second when something
+    changed, and render() merges the snapshots of all live processes. The
+    request path itself never touches disk.
+    """
+
+    def __init__(self, state_dir=None, flush_interval=None):
+        self.state_dir = state_dir
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv('METRICS_FLUSH_SECONDS', 1.0))
+        self._reset()
+
+        if self.state_dir and not os.path.exists(self.state_dir):
+            os.makedirs(self.state_dir, exist_ok=True)
+
+        # A forked job worker starts from zero instead of re-reporting its parent's counts
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._histograms = {}
+        self._dirty = False
+        self._flusher = None
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+            self._dirty = True
+        if self._flusher is None:
+            self._start_flusher()
+
+    def gauge_add(self, name, delta, **labels):
+        self.inc(name, delta, **labels)
+
+    def observe(self, name, value, **labels):
+        buckets = METRIC_DEFINITIONS[name][2]
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+            self._dirty = True
+        if self._flusher is None:
+            self._start_flusher()
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def flush(self):
+        """Write this process's snapshot for other workers to merge"""
+        if not self.state_dir:
+            return
+        with self._lock:
+            self._dirty = False
+        snapshot = self._snapshot()
+
+        path = os.path.join(self.state_dir, f'{os.getpid()}.json')
+        try:
+            # render() and the flusher thread may flush at the same time
+            fd, tmp_path = tempfile.mkstemp(dir=self.state_dir, prefix=f'{os.getpid()}.json.', suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def render(self):
+        """Prometheus text exposition of all live processes' metrics"""
+        self.flush()
+        values, histograms = self._merged()
+
+        lines = []
+        for name, (metric_type, help_text, buckets) in METRIC_DEFINITIONS.items():
+            full_name = METRIC_PREFIX + name
+            lines.append(f'# HELP {full_name} {help_text}')
+            lines.append(f'# TYPE {full_name} {metric_type}')
+
+            if metric_type == 'histogram':
+                for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(buckets, counts):
+                        cumulative += bucket_count
+                        lines.append(f'{full_name}_bucket{_format_labels(labels, le=_format_bound(bound))} {cumulative}')
+                    lines.append(f'{full_name}_bucket{_format_labels(labels, le="+Inf")} {count}')
+                    lines.append(f'{full_name}_sum{_format_labels(labels)} {total}')
+                    lines.append(f'{full_name}_count{_format_labels(labels)} {count}')
+            else:
+                for (metric, labels), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f'{full_name}{_format_labels(labels)} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def _start_flusher(self):
+        if not self.state_dir:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                self.flush()
+
+    def _snapshot(self):
+        with self._lock:
+            return {
+                'values': [[name, labels, value] for (name, labels), value in self._values.items()],
+                'histograms': [[name, labels, hist[0], hist[1], hist[2]] for (name, labels), hist in self._histograms.items()]
+            }
+
+    def _merged(self):
+        snapshots = [self._snapshot()]
+        if self.state_dir:
+            snapshots = []
+            for filename in os.listdir(self.state_dir):
+                if not filename.endswith('.json') or not filename[:-len('.json')].isdigit():
+                    continue
+                pid = int(filename[:-len('.json')])
+                path = os.path.join(self.state_dir, filename)
+                if pid != os.getpid() and not _pid_alive(pid):
+                    # Exited worker: its series restart from zero, as after a restart
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+        values = {}
+        histograms = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot['values']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                values[key] = values.get(key, 0) + value
+            for name, labels, counts, total, count in snapshot['histograms']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                merged = histograms.setdefault(key, [[0] * len(counts), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        return values, histograms
+
+
+def _format_bound(bound):
+    return repr(float(bound))
+
+
+def _format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = ','.join(
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for key, value in pairs
+    )
+    return '{' + escaped + '}'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Shared registry; snapshots live next to the service unless METRICS_DIR is set
+metrics = Metrics(os.getenv('METRICS_DIR', os.path.join(os.path.dirname(__file__), 'metrics_state')))
@@ -1,20 +1,141 @@
 import numpy as np
-import pandas as pd
-from sklearn.ensemble import RandomForestClassifier, IsolationForest
-from sklearn.preprocessing import StandardScaler
-import joblib
+import logging
 import os
+import time
 from datetime import datetime
+from metrics import metrics
+from model_store import AnomalyModelStore
+from anomaly import AnomalyDetector
+from streaming import StreamingAnalysis
+from ingest import SENSOR_COLUMNS, detect_format, read_sensor_frame, read_sensor_header
+from timeline import TIMELINE_BUCKETS, build_timeline
+from history import SensorHistoryStore, parse_time
+from forecast import forecast_thresholds, window_size
+from changepoint import HEALTH_MIN_SHIFT, binary_segmentation, describe_segments, min_sensor_shift, unit_sums
+from sensors import DEFAULT_UNITS, SensorSet, sensor_matrix, unit_suffix
+from parallel import ParallelScoring, trend_denominator, trend_sums
+
+logger = logging.getLogger(__name__)
+
+def _is_datetime_column(column):
+    """True for a datetime64 column (timestamps parsed at ingest)"""
+    return np.issubdtype(column.dtype, np.datetime64) if isinstance(column.dtype, np.dtype) else False
+
+def _reading_list(values):
+    """Python floats for report records; float32 readings keep their shortest decimal form"""
+    values = np.asarray(values)
+    if values.dtype == np.float32:
+        return values.astype(str).astype(np.float64).tolist()
+    return values.astype(np.float64).tolist()
+
+def load_analysis_libraries():
+    """Import pandas, scikit-learn, joblib and (if installed) pyarrow
+    
+    The analysis code imports these where they are used so the service can
+    answer / and /health before they load; calling this up front moves the
+    cost out of the first analysis request. Returns the seconds it took.
+    """
+    started = time.perf_counter()
+    import pandas  # noqa: F401
+    import joblib  # noqa: F401
+    import sklearn.ensemble  # noqa: F401
+    try:
+        import pyarrow.parquet  # noqa: F401
+        import pyarrow.ipc  # noqa: F401
+    except ImportError:
+        pass
+    return time.perf_counter() - started
+
+def _round_half_even(values, decimals):
+    """Round an array exactly like Python's built-in round()
+    
+    np.round scales by 10**decimals before rounding, which can land on the
+    wrong side of a tie that round() resolves on the exact binary value.
+    Only the few elements sitting near such a tie are re-rounded in Python.
+    """
+    scale = 10.0 ** decimals
+    rounded = np.round(values, decimals)
+    scaled = np.asarray(values, dtype=np.float64) * scale
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for idx in np.flatnonzero(near_tie):
+        rounded.flat[idx] = round(float(values.flat[idx]), decimals)
+    return rounded
+
+# Bump whenever analysis output changes so cached reports are not reused
+ANALYZER_VERSION = '1.6.0'
+
+# Forecast crossings within these many hours raise recommendation priority
+FORECAST_URGENT_HOURS = float(os.getenv('FORECAST_URGENT_HOURS', 48))
+FORECAST_PLANNING_HOURS = float(os.getenv('FORECAST_PLANNING_HOURS', 168))
+
+# Stress level names indexed by the codes returned from stress_levels()
+STRESS_LEVELS = ('Normal', 'High', 'Critical')
+
+# Per-sensor recommendation texts: (action, reason note) over critical and
+# over warning, the action for an upward trend, and the slope per reading
+# that counts as one. Other sensors get _generic_advice().
+SENSOR_ADVICE = {
+    'temperature': {
+        'critical': ('Inspect cooling system and thermal management immediately', 'Immediate cooling system inspection required.'),
+        'warning': ('Inspect cooling system and thermal management', 'Check cooling system efficiency.'),
+        'trend': 'Monitor temperature trends closely',
+        'trend_slope': 0.1
+    },
+    'vibration': {
+        'critical': ('Immediate mechanical inspection required', 'Possible bearing failure, misalignment, or structural damage.'),
+        'warning': ('Inspect bearings, belts, and alignment', 'Early sign of mechanical wear.'),
+        'trend': 'Monitor vibration levels closely',
+        'trend_slope': 0.05
+    },
+    'current': {
+        'critical': ('Check electrical system and motor condition immediately', 'Possible motor overload or electrical fault.'),
+        'warning': ('Inspect electrical system and verify motor condition', 'Check for electrical issues or increased load.'),
+        'trend': 'Monitor current consumption and verify load conditions',
+        'trend_slope': 0.1
+    }
+}
+
+def _generic_advice(label):
+    """SENSOR_ADVICE entry for a sensor without its own texts"""
+    name = label.lower()
+    return {
+        'critical': (f'Inspect the cause of high {name} immediately', f'Reduce load until {name} is back within its thresholds.'),
+        'warning': (f'Inspect the cause of rising {name}', f'Check the components that drive {name}.'),
+        'trend': f'Monitor {name} trends closely',
+        'trend_slope': 0.1
+    }
 
 class MachineryHealthAnalyzer:
     def __init__(self):
-        self.scaler = StandardScaler()
+        self._scaler = None
         self.health_classifier = None
         self.anomaly_detector = None
         self.model_dir = os.path.join(os.path.dirname(__file__), 'models')
         
         if not os.path.exists(self.model_dir):
             os.makedirs(self.model_dir)
+        
+        self.model_store = AnomalyModelStore(self.model_dir)
+        self.history = SensorHistoryStore(os.getenv('HISTORY_DIR', os.path.join(os.path.dirname(__file__), 'history_store')))
+        # Large standard analyses score their row ranges on all cores
+        self.parallel = ParallelScoring()
+    
+    @property
+    def scaler(self):
+        # Created on first use so constructing the analyzer doesn't import sklearn
+        if self._scaler is None:
+            from sklearn.preprocessing import StandardScaler
+            self._scaler = StandardScaler()
+        return self._scaler
+    
+    def warm_up(self, preload_models=False):
+        """Load the analysis libraries and optionally the persisted anomaly models
+        
+        Returns {'libraries_seconds', 'models_loaded'}.
+        """
+        libraries_seconds = load_analysis_libraries()
+        models_loaded = self.model_store.preload() if preload_models else 0
+        return {'libraries_seconds': round(libraries_seconds, 3), 'models_loaded': models_loaded}
     
     def calculate_health_score(self, temp, vibration, current, thresholds):
         """Calculate accurate health score based on sensor readings and machine-specific thresholds
@@ -25,66 +146,67 @@ class MachineryHealthAnalyzer:
         - Critical range: 0-49 points (linear decrease)
         - Above critical: 0 points
         """
+        scores = self.calculate_health_scores([temp], [vibration], [current], thresholds)
+        return float(scores[0])
+    
+    def calculate_health_scores(self, temps, vibrations, currents, thresholds):
+        """Calculate per-reading health scores for whole temperature, vibration and current arrays
+        
+        Scores the three original sensors with their default weights, whatever
+        else thresholds describes; see calculate_health_scores_matrix for any
+        sensor set. Returns a float64 array of scores rounded to 2 decimals.
+        """
         if thresholds is None:
             raise ValueError('Thresholds are required. Machine-specific thresholds must be provided from database.')
+        sensors = SensorSet({
+            name: {'warning': thresholds[name]['warning'], 'critical': thresholds[name]['critical']}
+            for name in SENSOR_COLUMNS
+        })
+        values = np.column_stack([
+            np.asarray(temps, dtype=np.float64),
+            np.asarray(vibrations, dtype=np.float64),
+            np.asarray(currents, dtype=np.float64)
+        ])
+        return self.calculate_health_scores_matrix(values, sensors)
+    
+    def calculate_health_scores_matrix(self, values, thresholds):
+        """Calculate per-reading health scores for a rows x sensors matrix at once
         
-        temp_score = 100
-        vib_score = 100
-        current_score = 100
+        values has one column per sensor in SensorSet(thresholds).names
+        order; thresholds may also be that SensorSet. Every sensor is scored
+        in one pass with the threshold vectors broadcast across the columns,
+        and the weighted sum over sensors gives the overall score.
+        Returns a float64 array of scores rounded to 2 decimals.
+        """
+        sensors = self._sensor_set(thresholds)
+        scores = self._sensor_scores(values, sensors.warning, sensors.critical)
         
-        # Temperature scoring using custom thresholds
-        temp_warn = thresholds['temperature']['warning']
-        temp_crit = thresholds['temperature']['critical']
+        # Overall score (weighted average)
+        # Temperature and Vibration are more critical for machine health (see sensors.DEFAULT_WEIGHTS)
+        overall_scores = (scores * sensors.weights).sum(axis=1)
         
-        if temp >= temp_crit:
-            # Critical: 0-20 points based on how far above critical
-            excess = temp - temp_crit
-            temp_score = max(0, 20 - (excess / temp_crit * 20))
-        elif temp >= temp_warn:
-            # Warning: 50-99 points (linear decrease from warning to critical)
-            ratio = (temp - temp_warn) / (temp_crit - temp_warn)
-            temp_score = 99 - (ratio * 49)
-        else:
-            # Normal: 100 points
-            temp_score = 100
-        
-        # Vibration scoring
-        vib_warn = thresholds['vibration']['warning']
-        vib_crit = thresholds['vibration']['critical']
-        
-        if vibration >= vib_crit:
-            # Critical: 0-20 points
-            excess = vibration - vib_crit
-            vib_score = max(0, 20 - (excess / vib_crit * 20))
-        elif vibration >= vib_warn:
-            # Warning: 50-99 points
-            ratio = (vibration - vib_warn) / (vib_crit - vib_warn)
-            vib_score = 99 - (ratio * 49)
-        else:
-            # Normal: 100 points
-            vib_score = 100
-        
-        # Current scoring
-        curr_warn = thresholds['current']['warning']
-        curr_crit = thresholds['current']['critical']
-        
-        if current >= curr_crit:
-            # Critical: 0-20 points
-            excess = current - curr_crit
-            current_score = max(0, 20 - (excess / curr_crit * 20))
-        elif current >= curr_warn:
-            # Warning: 50-99 points
-            ratio = (current - curr_warn) / (curr_crit - curr_warn)
-            current_score = 99 - (ratio * 49)
-        else:
-            # Normal: 100 points
-            current_score = 100
+        return _round_half_even(overall_scores, 2)
+    
+    def _sensor_scores(self, values, warn, crit):
+        """Piecewise score per reading and sensor: 100 normal, 99-50 warning, 20-0 critical"""
+        values = np.asarray(values, dtype=np.float64)
         
-        # Overall score (weighted average)
-        # Temperature and Vibration are more critical for machine health
-        overall_score = (temp_score * 0.35 + vib_score * 0.40 + current_score * 0.25)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Warning: 50-99 points (linear decrease from warning to critical)
+            ratio = (values - warn) / (crit - warn)
+            warning_scores = 99 - (ratio * 49)
+            
+            # Critical: 0-20 points based on how far above critical
+            excess = values - crit
+            critical_scores = np.maximum(0, 20 - (excess / crit * 20))
         
-        return round(overall_score, 2)
+        return np.where(values >= crit, critical_scores, np.where(values >= warn, warning_scores, 100.0))
+    
+    def _sensor_set(self, thresholds):
+        """SensorSet for thresholds, which may already be one"""
+        if thresholds is None:
+            raise ValueError('Thresholds are required. Machine-specific thresholds must be provided from database.')
+        return thresholds if isinstance(thresholds, SensorSet) else SensorSet(thresholds)
     
     def determine_health_status(self, score):
         """Determine health status from score"""
@@ -99,142 +221,443 @@ class MachineryHealthAnalyzer:
         else:
             return 'Critical'
     
-    def analyze_stress_patterns(self, df, thresholds):
-        """Analyze when machinery gets overstressed using machine-specific thresholds"""
-        if thresholds is None:
-            raise ValueError('Thresholds are required. Machine-specific thresholds must be provided from database.')
+    def analyze_stress_patterns(self, df, thresholds, mode='events', max_episodes=None):
+        """Analyze when machinery gets overstressed using machine-specific thresholds
         
-        stress_events = []
+        mode='events' returns one record per over-threshold reading (the
+        original output). mode='episodes' merges consecutive readings at the
+        same stress level into a single record with start/end and peaks.
+        """
+        sensors = self._sensor_set(thresholds)
+        values = sensors.matrix(df)
+        levels = self.stress_levels(values, sensors)
         
-        for idx, row in df.iterrows():
-            temp = row['temperature']
-            vib = row['vibration']
-            current = row['current']
-            timestamp = row.get('timestamp', idx)
-            
-            stress_level = 'Normal'
-            issues = []
-            
-            # Check for stress conditions using custom thresholds
-            temp_warn = thresholds['temperature']['warning']
-            temp_crit = thresholds['temperature']['critical']
-            vib_warn = thresholds['vibration']['warning']
-            vib_crit = thresholds['vibration']['critical']
-            curr_warn = thresholds['current']['warning']
-            curr_crit = thresholds['current']['critical']
-            
-            if temp > temp_crit:
-                stress_level = 'Critical'
-                issues.append(f'Temperature critically high ({temp:.1f}°C, threshold: {temp_crit}°C)')
-            elif temp > temp_warn:
-                stress_level = 'High' if stress_level != 'Critical' else stress_level
-                issues.append(f'Temperature elevated ({temp:.1f}°C, threshold: {temp_warn}°C)')
-            
-            if vib > vib_crit:
-                stress_level = 'Critical'
-                issues.append(f'Vibration critically high ({vib:.1f} Hz, threshold: {vib_crit} Hz)')
-            elif vib > vib_warn:
-                stress_level = 'High' if stress_level != 'Critical' else stress_level
-                issues.append(f'Vibration elevated ({vib:.1f} Hz, threshold: {vib_warn} Hz)')
-            
-            if current > curr_crit:
-                stress_level = 'Critical'
-                issues.append(f'Current critically high ({current:.1f} A, threshold: {curr_crit} A)')
-            elif current > curr_warn:
-                stress_level = 'High' if stress_level != 'Critical' else stress_level
-                issues.append(f'Current elevated ({current:.1f} A, threshold: {curr_warn} A)')
-            
-            if stress_level != 'Normal':
-                stress_events.append({
-                    'timestamp': str(timestamp),
-                    'stress_level': stress_level,
-                    'issues': issues,
-                    'temperature': temp,
-                    'vibration': vib,
-                    'current': current
-                })
+        if mode == 'episodes':
+            return self.build_stress_episodes(df, values, levels, sensors, max_episodes=max_episodes)
+        if mode != 'events':
+            raise ValueError(f'Unknown stress mode: {mode}')
+        return self.build_stress_events(df, values, levels, sensors)
+    
+    def stress_levels(self, values, thresholds):
+        """Per-reading stress level codes (0 Normal, 1 High, 2 Critical) for a rows x sensors matrix"""
+        sensors = self._sensor_set(thresholds)
+        values = np.asarray(values, dtype=np.float64)
+        
+        levels = (values > sensors.warning).any(axis=1).astype(np.int8)
+        levels[(values > sensors.critical).any(axis=1)] = 2
+        return levels
+    
+    def stress_counts(self, levels):
+        """Critical/high/total reading counts for a stress level array"""
+        critical = int(np.count_nonzero(levels == 2))
+        high = int(np.count_nonzero(levels == 1))
+        return {'critical': critical, 'high': high, 'total': critical + high}
+    
+    def build_stress_events(self, df, values, levels, sensors):
+        """One stress event per flagged reading, in row order"""
+        flagged = np.flatnonzero(levels)
+        if len(flagged) == 0:
+            return []
+        
+        readings = _reading_list(values[flagged])
+        timestamps = self._timestamp_labels(df, flagged)
+        issues = self.stress_issues(readings, sensors)
+        
+        stress_events = []
+        for i, row_idx in enumerate(flagged):
+            stress_events.append(self.stress_event_record(
+                timestamps[i], levels[row_idx], readings[i], issues[i], sensors
+            ))
         
         return stress_events
     
-    def detect_anomalies(self, df):
-        """Detect anomalous patterns in the data"""
-        features = df[['temperature', 'vibration', 'current']].values
+    def stress_event_record(self, timestamp, level, readings, issues, sensors):
+        """Stress event dict for one flagged reading; readings are in sensors.names order"""
+        record = {
+            'timestamp': timestamp,
+            'stress_level': STRESS_LEVELS[level],
+            'issues': issues
+        }
+        record.update(zip(sensors.names, readings))
+        return record
+    
+    def build_stress_episodes(self, df, values, levels, sensors, max_episodes=None):
+        """Collapse consecutive readings at the same stress level into episodes
+        
+        When max_episodes is set, the most severe (then longest) episodes are
+        kept and returned in chronological order. Issue strings are only
+        formatted for the episodes that are returned.
+        """
+        n = len(levels)
+        if n == 0:
+            return []
+        
+        # Run boundaries wherever the level changes
+        boundaries = np.flatnonzero(np.diff(levels)) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [n]))
+        run_levels = levels[starts]
+        
+        # Peak values for every run and sensor in one reduceat (fmax skips NaN)
+        peaks = np.fmax.reduceat(values, starts, axis=0)
+        
+        stressed = np.flatnonzero(run_levels)
+        if max_episodes is not None and len(stressed) > max_episodes:
+            lengths = (ends - starts)[stressed]
+            order = np.lexsort((-lengths, -run_levels[stressed]))
+            stressed = np.sort(stressed[order[:max_episodes]])
+        
+        start_labels = self._timestamp_labels(df, starts[stressed])
+        end_labels = self._timestamp_labels(df, ends[stressed] - 1)
+        if 'timestamp' not in df.columns:
+            durations = [None] * len(stressed)
+        elif _is_datetime_column(df['timestamp']):
+            # Parsed at ingest: subtract the datetime64 values directly
+            timestamps = df['timestamp'].values
+            elapsed = timestamps[ends[stressed] - 1] - timestamps[starts[stressed]]
+            durations = (elapsed / np.timedelta64(1, 's')).tolist()
+        else:
+            durations = self.durations_seconds(start_labels, end_labels)
         
-        # Use Isolation Forest for anomaly detection
-        iso_forest = IsolationForest(contamination=0.1, random_state=42)
-        anomaly_labels = iso_forest.fit_predict(features)
+        run_peaks = _reading_list(peaks[stressed])
+        issues = self.stress_issues(run_peaks, sensors)
+        
+        episodes = []
+        for i, run in enumerate(stressed):
+            episodes.append(self.stress_episode_record(
+                start_labels[i],
+                end_labels[i],
+                durations[i],
+                int(ends[run] - starts[run]),
+                run_levels[run],
+                run_peaks[i],
+                issues[i],
+                sensors
+            ))
+        
+        return episodes
+    
+    def stress_episode_record(self, start, end, duration, sample_count, level, peaks, issues, sensors):
+        """Stress episode dict; issues are formatted from the peak readings"""
+        record = {
+            'timestamp': start,
+            'start': start,
+            'end': end,
+            'duration_seconds': duration,
+            'sample_count': sample_count,
+            'stress_level': STRESS_LEVELS[level],
+            'issues': issues
+        }
+        record.update(zip(sensors.peak_keys, peaks))
+        return record
+    
+    def stress_issues(self, readings, sensors):
+        """Human-readable threshold violations for each row of readings
+        
+        readings is a list of per-row reading lists in sensors.names order.
+        The violations are found for all rows and sensors at once; only
+        those get formatted, sensor by sensor so each row's issues keep the
+        sensor order.
+        """
+        issues = [[] for _ in readings]
+        if not readings:
+            return issues
+        
+        values = np.array(readings, dtype=np.float64)
+        critical = values > sensors.critical
+        elevated = (values > sensors.warning) & ~critical
+        for i, name in enumerate(sensors.names):
+            label, suffix = sensors.labels[i], sensors.suffixes[i]
+            for row in np.flatnonzero(critical[:, i]).tolist():
+                issues[row].append(
+                    f'{label} critically high ({readings[row][i]:.1f}{suffix}, threshold: {sensors.thresholds[i]["critical"]}{suffix})'
+                )
+            for row in np.flatnonzero(elevated[:, i]).tolist():
+                issues[row].append(
+                    f'{label} elevated ({readings[row][i]:.1f}{suffix}, threshold: {sensors.thresholds[i]["warning"]}{suffix})'
+                )
+        
+        return issues
+    
+    def _timestamp_labels(self, df, rows):
+        """String timestamps for the given row positions, falling back to the index"""
+        if 'timestamp' in df.columns:
+            column = df['timestamp']
+            if _is_datetime_column(column) and getattr(column.dt, 'tz', None) is None:
+                values = column.values[rows]
+                seconds = values.astype('datetime64[s]')
+                if np.array_equal(seconds, values):
+                    # Whole-second naive timestamps format in bulk exactly as str(Timestamp)
+                    return [label.replace('T', ' ') for label in np.datetime_as_string(seconds, unit='s').tolist()]
+            # iloc yields pandas Timestamps for binary uploads, which print like the CSV text
+            return [str(ts) for ts in column.iloc[rows]]
+        return [str(label) for label in df.index.values[rows]]
+    
+    def durations_seconds(self, start_labels, end_labels):
+        """Elapsed seconds between paired timestamp labels, or None when they don't parse"""
+        if len(start_labels) == 0:
+            return []
+        
+        import pandas as pd
+        start_ts = pd.to_datetime(pd.Series(start_labels), errors='coerce')
+        end_ts = pd.to_datetime(pd.Series(end_labels), errors='coerce')
+        seconds = (end_ts - start_ts).dt.total_seconds()
+        return [None if pd.isna(value) else float(value) for value in seconds]
+    
+    def detect_anomalies(self, df, machine_id=None, thresholds=None, detector=None, values=None, labels=None):
+        """Detect anomalous patterns in the data
+        
+        detector is an anomaly.AnomalyDetector (the default detector when
+        omitted); read its describe() afterwards for what was used. With a
+        machine_id the IsolationForest modes reuse the persisted per-machine
+        detector (refit only when stale). The features are the sensors of
+        thresholds (the default three without thresholds); values is their
+        matrix when the caller already has it, and labels the fitted
+        detector's labels for it when already scored.
+        """
+        if detector is None:
+            detector = AnomalyDetector()
+        
+        names = self._sensor_set(thresholds).names if thresholds is not None else SENSOR_COLUMNS
+        features = values if values is not None else sensor_matrix(df, names)
+        if labels is None:
+            self.fit_anomaly_detector(detector, features, machine_id, thresholds, sensors=names)
+            labels = detector.predict(features)
+        
+        # Gather the flagged rows from the feature matrix in one indexing step
+        flagged = np.flatnonzero(labels == -1)
+        if 'timestamp' in df.columns:
+            timestamps = self._timestamp_labels(df, flagged)
+        else:
+            timestamps = [str(idx) for idx in flagged.tolist()]
         
         anomalies = []
-        for idx, label in enumerate(anomaly_labels):
-            if label == -1:  # Anomaly detected
-                row = df.iloc[idx]
-                anomalies.append({
-                    'timestamp': str(row.get('timestamp', idx)),
-                    'temperature': float(row['temperature']),
-                    'vibration': float(row['vibration']),
-                    'current': float(row['current']),
-                    'reason': 'Unusual pattern detected'
-                })
+        for timestamp, readings in zip(timestamps, _reading_list(features[flagged])):
+            anomalies.append(self.anomaly_record(timestamp, readings, names))
         
         return anomalies
     
-    def calculate_trends(self, df):
-        """Calculate trends in sensor readings"""
-        trends = {}
-        
-        for column in ['temperature', 'vibration', 'current']:
-            values = df[column].values
-            if len(values) > 1:
-                # Calculate linear trend
-                x = np.arange(len(values))
-                z = np.polyfit(x, values, 1)
-                slope = z[0]
-                
-                if abs(slope) < 0.01:
-                    trend = 'Stable'
-                elif slope > 0:
-                    trend = 'Increasing'
-                else:
-                    trend = 'Decreasing'
-                
-                trends[column] = {
-                    'trend': trend,
-                    'slope': round(float(slope), 4),
-                    'average': round(float(np.mean(values)), 2),
-                    'min': round(float(np.min(values)), 2),
-                    'max': round(float(np.max(values)), 2),
-                    'std': round(float(np.std(values)), 2)
-                }
-            else:
-                trends[column] = {
-                    'trend': 'Insufficient data',
-                    'slope': 0,
-                    'average': round(float(values[0]), 2),
-                    'min': round(float(values[0]), 2),
-                    'max': round(float(values[0]), 2),
-                    'std': 0
-                }
+    def fit_anomaly_detector(self, detector, features, machine_id=None, thresholds=None, sensors=None):
+        detector.fit(features, model_store=self.model_store, machine_id=machine_id, thresholds=thresholds, sensors=sensors)
+        if machine_id is not None:
+            logger.debug(f'Anomaly model for machine {machine_id}: {detector.source}')
+    
+    def anomaly_record(self, timestamp, readings, names):
+        """Anomaly dict for one flagged reading; readings are in names order"""
+        record = {'timestamp': timestamp}
+        record.update(zip(names, readings))
+        record['reason'] = 'Unusual pattern detected'
+        return record
+    
+    def change_point_analysis(self, df, health_scores, values=None, names=None):
+        """Mean-shift segments of the health score and each sensor (see changepoint.py)
         
-        return trends
+        A health score drop or a sensor rise is a degradation; each series
+        reports its segments, change points and current degradation onset.
+        values is the rows x sensors matrix of names (the default three
+        sensors when omitted).
+        """
+        n = len(df)
+        rows = np.arange(n)
+        labels = lambda positions: self._timestamp_labels(df, np.asarray(positions, dtype=np.int64))
+        
+        sums, counts, squares = unit_sums(health_scores)
+        boundaries = binary_segmentation(sums, counts, squares, HEALTH_MIN_SHIFT)
+        result = {'health_score': describe_segments(boundaries, sums, counts, rows, n, labels, higher_is_worse=False)}
+        
+        names = names or SENSOR_COLUMNS
+        if values is None:
+            values = sensor_matrix(df, names)
+        # Sums for every sensor at once; the segmentation itself is per series
+        all_sums, all_counts, all_squares = unit_sums(values)
+        for i, column in enumerate(names):
+            sums, counts, squares = all_sums[:, i], all_counts[:, i], all_squares[:, i]
+            boundaries = binary_segmentation(sums, counts, squares, min_sensor_shift(sums, counts, squares))
+            result[column] = describe_segments(boundaries, sums, counts, rows, n, labels, higher_is_worse=True)
+        return result
+    
+    def health_trend_with_change_points(self, health_trend, change_points):
+        """A health score still falling at its last change point is Declining, whatever the halves say"""
+        if change_points['health_score']['degradation_onset'] is not None:
+            return 'Declining'
+        return health_trend
     
-    def generate_recommendations(self, overall_health, stress_events, trends, machine_name=None, thresholds=None):
-        """Generate comprehensive maintenance recommendations with severity assessment based on machine-specific thresholds"""
+    def add_change_points(self, report, change_points):
+        report['change_points'] = change_points
+        report['summary']['degradation_onset'] = change_points['health_score']['degradation_onset']
+    
+    def forecast(self, df, thresholds, values=None):
+        """Time-to-threshold forecast over the most recent readings (see forecast.py)
+        
+        values is the rows x sensors matrix of thresholds' sensors when the
+        caller already has it.
+        """
+        sensors = self._sensor_set(thresholds)
+        n = len(df)
+        start = n - window_size(n)
+        timestamps = df['timestamp'].iloc[start:] if 'timestamp' in df.columns else None
+        window = values[start:] if values is not None else sensors.matrix(df.iloc[start:])
+        return self.forecast_window(timestamps, window, sensors, self._timestamp_labels(df, [start])[0])
+    
+    def forecast_window(self, timestamps, values, thresholds, window_start):
+        """forecast_thresholds for a window whose timestamps may still be text
+        
+        values has a column per sensor of thresholds (a dict or SensorSet).
+        """
+        if timestamps is not None:
+            import pandas as pd
+            timestamps = pd.Series(timestamps)
+            if not _is_datetime_column(timestamps):
+                timestamps = pd.to_datetime(timestamps, errors='coerce')
+            if getattr(timestamps.dt, 'tz', None) is not None:
+                timestamps = timestamps.dt.tz_localize(None)
+            timestamps = timestamps.values
+        sensors = self._sensor_set(thresholds)
+        return forecast_thresholds(timestamps, values, dict(zip(sensors.names, sensors.thresholds)), window_start, names=sensors.names)
+    
+    def forecast_recommendations(self, forecast, machine_prefix='', sensors=None):
+        """Recommendations for forecast crossings within the planning horizon
+        
+        A critical crossing within FORECAST_URGENT_HOURS is Critical and
+        within FORECAST_PLANNING_HOURS High; a warning crossing within
+        FORECAST_URGENT_HOURS is Medium. sensors (a SensorSet) gives the
+        labels and units.
+        """
+        labels = dict(zip(sensors.names, sensors.labels)) if sensors is not None else {}
+        suffixes = dict(zip(sensors.names, sensors.suffixes)) if sensors is not None else {}
         recommendations = []
-        critical_count = len([e for e in stress_events if e['stress_level'] == 'Critical'])
-        warning_count = len([e for e in stress_events if e['stress_level'] == 'High']) - critical_count
+        for sensor, entry in forecast['sensors'].items():
+            critical = entry.get('critical', {})
+            warning = entry.get('warning', {})
+            if critical.get('status') == 'forecast' and critical['time_to_threshold'] <= FORECAST_PLANNING_HOURS:
+                crossing, name = critical, 'critical'
+                priority = 'Critical' if critical['time_to_threshold'] <= FORECAST_URGENT_HOURS else 'High'
+            elif warning.get('status') == 'forecast' and warning['time_to_threshold'] <= FORECAST_URGENT_HOURS:
+                crossing, name, priority = warning, 'warning', 'Medium'
+            else:
+                continue
+            
+            hours = crossing['time_to_threshold']
+            earliest, latest = crossing['time_band']
+            band = f'{earliest:.0f}-{latest:.0f}h' if latest is not None else f'{earliest:.0f}h or later'
+            label = labels.get(sensor, sensor.capitalize())
+            unit = suffixes.get(sensor, '')
+            recommendations.append({
+                'priority': priority,
+                'action': f'{machine_prefix}Schedule {label.lower()} maintenance within {max(earliest, 1):.0f} hours',
+                'reason': (
+                    f'{label} is forecast to reach its {name} threshold of {crossing["threshold"]}{unit} '
+                    f'in ~{hours:.0f} hours ({band}, around {crossing.get("eta")}) at the recent trend of '
+                    f'{entry["slope"]:+.4f}{unit}/h from {entry["level"]}{unit}.'
+                ),
+                'severity': priority.upper()
+            })
+        return recommendations
+    
+    def build_timeline(self, df, health_scores, stress_levels, bucket, values=None, names=None):
+        """Time-bucketed sensor statistics, health score and stress counts (see timeline.py)
         
-        machine_prefix = f"{machine_name}: " if machine_name else ""
+        values is the rows x sensors matrix of names (the default three
+        sensors when omitted).
+        """
+        if 'timestamp' not in df.columns:
+            raise ValueError('A timestamp column is required for the timeline')
+        
+        import pandas as pd
+        # Parsed once; unparseable timestamps become NaT and are skipped
+        timestamps = pd.to_datetime(df['timestamp'], errors='coerce')
+        if getattr(timestamps.dt, 'tz', None) is not None:
+            timestamps = timestamps.dt.tz_localize(None)
+        names = names or SENSOR_COLUMNS
+        if values is None:
+            values = sensor_matrix(df, names)
+        return build_timeline(timestamps.values, values, health_scores, stress_levels, bucket, names=names)
+    
+    def calculate_trends(self, df, values=None, names=None, statistics=None):
+        """Calculate trends in sensor readings
+        
+        values is the rows x sensors matrix of names (the default three
+        sensors when omitted). Every sensor's least-squares slope and
+        statistics come from one pass over the matrix, unless statistics
+        already holds them (slopes, averages, minimums, maximums, stds) from
+        the parallel path.
+        """
+        names = names or SENSOR_COLUMNS
+        if values is None:
+            values = sensor_matrix(df, names)
+        n = len(values)
+        
+        if n < 2:
+            return {
+                column: self.trend_summary(None, values[0, i], values[0, i], values[0, i], 0)
+                for i, column in enumerate(names)
+            }
+        
+        if statistics is None:
+            # Linear trend against the row index: slope = sum(dx * y) / sum(dx^2),
+            # summed like parallel.ParallelScoring sums its row ranges
+            slopes = trend_sums(values, 0, n) / trend_denominator(n)
+            averages = values.mean(axis=0)
+            minimums = values.min(axis=0)
+            maximums = values.max(axis=0)
+            stds = values.std(axis=0)
+            statistics = (slopes, averages, minimums, maximums, stds)
+        slopes, averages, minimums, maximums, stds = statistics
         
-        # Extract threshold values for recommendations
-        if thresholds:
-            temp_warn = thresholds['temperature']['warning']
-            temp_crit = thresholds['temperature']['critical']
-            vib_warn = thresholds['vibration']['warning']
-            vib_crit = thresholds['vibration']['critical']
-            curr_warn = thresholds['current']['warning']
-            curr_crit = thresholds['current']['critical']
+        return {
+            column: self.trend_summary(slopes[i], averages[i], minimums[i], maximums[i], stds[i])
+            for i, column in enumerate(names)
+        }
+    
+    def trend_summary(self, slope, average, minimum, maximum, std):
+        """Trend entry for one sensor; slope=None means too few readings for a fit"""
+        if slope is None:
+            return {
+                'trend': 'Insufficient data',
+                'slope': 0,
+                'average': round(float(average), 2),
+                'min': round(float(minimum), 2),
+                'max': round(float(maximum), 2),
+                'std': 0
+            }
+        
+        if abs(slope) < 0.01:
+            trend = 'Stable'
+        elif slope > 0:
+            trend = 'Increasing'
         else:
-            temp_warn = temp_crit = vib_warn = vib_crit = curr_warn = curr_crit = None
+            trend = 'Decreasing'
+        
+        return {
+            'trend': trend,
+            'slope': round(float(slope), 4),
+            'average': round(float(average), 2),
+            'min': round(float(minimum), 2),
+            'max': round(float(maximum), 2),
+            'std': round(float(std), 2)
+        }
+    
+    def generate_recommendations(self, overall_health, stress_events, trends, machine_name=None, thresholds=None, stress_counts=None, forecast=None):
+        """Generate comprehensive maintenance recommendations with severity assessment based on machine-specific thresholds
+        
+        stress_counts (from stress_counts()) takes precedence over counting
+        stress_events, so episode output yields the same recommendations.
+        forecast adds time-to-threshold recommendations for sensors still
+        below a threshold but trending toward it.
+        """
+        recommendations = []
+        if stress_counts is None:
+            stress_counts = {
+                'critical': len([e for e in stress_events if e['stress_level'] == 'Critical']),
+                'high': len([e for e in stress_events if e['stress_level'] == 'High']),
+                'total': len(stress_events)
+            }
+        critical_count = stress_counts['critical']
+        warning_count = stress_counts['high'] - critical_count
+        total_stress_count = stress_counts['total']
+        
+        machine_prefix = f"{machine_name}: " if machine_name else ""
+        sensors = self._sensor_set(thresholds) if thresholds else None
         
         # Critical health assessment (score < 30)
         if overall_health['score'] < 30:
@@ -295,85 +718,27 @@ class MachineryHealthAnalyzer:
             })
         
         # Frequent stress events
-        if len(stress_events) > 20:
+        if total_stress_count > 20:
             recommendations.append({
                 'priority': 'High',
                 'action': 'Investigate root cause of frequent stress conditions',
-                'reason': f'{len(stress_events)} stress events indicate systemic issues',
+                'reason': f'{total_stress_count} stress events indicate systemic issues',
                 'severity': 'HIGH'
             })
         
-        # Temperature-specific recommendations
-        temp_trend = trends['temperature']
-        if thresholds and temp_trend['max'] >= temp_crit:
-            recommendations.append({
-                'priority': 'Critical',
-                'action': 'Inspect cooling system and thermal management immediately',
-                'reason': f'Temperature exceeded critical threshold (max: {temp_trend["max"]}°C, critical: {temp_crit}°C). Immediate cooling system inspection required.',
-                'severity': 'CRITICAL'
-            })
-        elif thresholds and temp_trend['max'] >= temp_warn:
-            recommendations.append({
-                'priority': 'High',
-                'action': 'Inspect cooling system and thermal management',
-                'reason': f'Temperature approaching critical levels (max: {temp_trend["max"]}°C, warning: {temp_warn}°C, critical: {temp_crit}°C). Check cooling system efficiency.',
-                'severity': 'HIGH'
-            })
-        elif temp_trend['trend'] == 'Increasing' and temp_trend['slope'] > 0.1:
-            recommendations.append({
-                'priority': 'Medium',
-                'action': 'Monitor temperature trends closely',
-                'reason': f'Temperature showing upward trend (current max: {temp_trend["max"]}°C). Monitor to ensure it stays below warning threshold of {temp_warn}°C.',
-                'severity': 'MEDIUM'
-            })
+        # Sensor-specific recommendations, in sensor order
+        if sensors is not None:
+            described = zip(sensors.names, sensors.thresholds, sensors.labels, sensors.suffixes)
+        else:
+            described = ((name, None, name.capitalize(), unit_suffix(DEFAULT_UNITS.get(name, ''))) for name in trends)
+        for sensor, sensor_thresholds, label, unit in described:
+            recommendation = self._sensor_recommendation(sensor, trends[sensor], sensor_thresholds, label, unit)
+            if recommendation is not None:
+                recommendations.append(recommendation)
         
-        # Vibration-specific recommendations
-        vib_trend = trends['vibration']
-        if thresholds and vib_trend['max'] >= vib_crit:
-            recommendations.append({
-                'priority': 'Critical',
-                'action': 'Immediate mechanical inspection required',
-                'reason': f'Vibration exceeded critical threshold (max: {vib_trend["max"]} Hz, critical: {vib_crit} Hz). Possible bearing failure, misalignment, or structural damage.',
-                'severity': 'CRITICAL'
-            })
-        elif thresholds and vib_trend['max'] >= vib_warn:
-            recommendations.append({
-                'priority': 'High',
-                'action': 'Inspect bearings, belts, and alignment',
-                'reason': f'Vibration approaching critical levels (max: {vib_trend["max"]} Hz, warning: {vib_warn} Hz, critical: {vib_crit} Hz). Early sign of mechanical wear.',
-                'severity': 'HIGH'
-            })
-        elif vib_trend['trend'] == 'Increasing' and vib_trend['slope'] > 0.05:
-            recommendations.append({
-                'priority': 'Medium',
-                'action': 'Monitor vibration levels closely',
-                'reason': f'Vibration showing upward trend (current max: {vib_trend["max"]} Hz). Monitor to ensure it stays below warning threshold of {vib_warn} Hz.',
-                'severity': 'MEDIUM'
-            })
-        
-        # Current-specific recommendations
-        curr_trend = trends['current']
-        if thresholds and curr_trend['max'] >= curr_crit:
-            recommendations.append({
-                'priority': 'Critical',
-                'action': 'Check electrical system and motor condition immediately',
-                'reason': f'Current exceeded critical threshold (max: {curr_trend["max"]} A, critical: {curr_crit} A). Possible motor overload or electrical fault.',
-                'severity': 'CRITICAL'
-            })
-        elif thresholds and curr_trend['max'] >= curr_warn:
-            recommendations.append({
-                'priority': 'High',
-                'action': 'Inspect electrical system and verify motor condition',
-                'reason': f'Current approaching critical levels (max: {curr_trend["max"]} A, warning: {curr_warn} A, critical: {curr_crit} A). Check for electrical issues or increased load.',
-                'severity': 'HIGH'
-            })
-        elif curr_trend['trend'] == 'Increasing' and curr_trend['slope'] > 0.1:
-            recommendations.append({
-                'priority': 'Medium',
-                'action': 'Monitor current consumption and verify load conditions',
-                'reason': f'Current showing upward trend (current max: {curr_trend["max"]} A). Monitor to ensure it stays below warning threshold of {curr_warn} A.',
-                'severity': 'MEDIUM'
-            })
+        # Forecast threshold crossings (hours-based forecasts only)
+        if forecast and forecast['time_unit'] == 'hours':
+            recommendations.extend(self.forecast_recommendations(forecast, machine_prefix, sensors))
         
         # Operational status recommendation for healthy machines
         if overall_health['score'] >= 85:
@@ -397,118 +762,395 @@ class MachineryHealthAnalyzer:
         
         return recommendations
     
-    def analyze_csv(self, csv_path, thresholds=None, machine_name=None):
-        """Main analysis function for CSV file with machine-specific thresholds"""
+    def _sensor_recommendation(self, sensor, trend, sensor_thresholds, label, unit):
+        """Recommendation for one sensor's trend: over critical, over warning or climbing, else None
+        
+        The texts come from SENSOR_ADVICE, or generic ones for other sensors.
+        Without thresholds only the climbing check applies.
+        """
+        advice = SENSOR_ADVICE.get(sensor) or _generic_advice(label)
+        warn = sensor_thresholds['warning'] if sensor_thresholds else None
+        crit = sensor_thresholds['critical'] if sensor_thresholds else None
+        
+        if sensor_thresholds and trend['max'] >= crit:
+            action, note = advice['critical']
+            return {
+                'priority': 'Critical',
+                'action': action,
+                'reason': f'{label} exceeded critical threshold (max: {trend["max"]}{unit}, critical: {crit}{unit}). {note}',
+                'severity': 'CRITICAL'
+            }
+        if sensor_thresholds and trend['max'] >= warn:
+            action, note = advice['warning']
+            return {
+                'priority': 'High',
+                'action': action,
+                'reason': f'{label} approaching critical levels (max: {trend["max"]}{unit}, warning: {warn}{unit}, critical: {crit}{unit}). {note}',
+                'severity': 'HIGH'
+            }
+        if trend['trend'] == 'Increasing' and trend['slope'] > advice['trend_slope']:
+            return {
+                'priority': 'Medium',
+                'action': advice['trend'],
+                'reason': f'{label} showing upward trend (current max: {trend["max"]}{unit}). Monitor to ensure it stays below warning threshold of {warn}{unit}.',
+                'severity': 'MEDIUM'
+            }
+        return None
+    
+    def analyze_csv(self, csv_path, thresholds=None, machine_name=None, stress_mode='events', max_episodes=None, machine_id=None, progress=None, include_timings=False, timeline=None,
+                    anomaly_detector=None, anomaly_sample_size=None):
+        """Main analysis function for CSV file with machine-specific thresholds
+        
+        csv_path is a file path or a seekable binary file-like object (such
+        as ingest.UploadSpool.view()), in any format ingest detects.
+        stress_mode selects the stress_events output ('events' or 'episodes');
+        counts and penalties are always based on individual readings.
+        progress, if given, is called as progress(stage, fraction) between stages.
+        Stage durations always feed the metrics registry; include_timings also
+        adds them to the report as a 'timings' block. timeline ('minute',
+        'hour', 'shift' or 'day') adds per-bucket statistics as 'timeline'.
+        anomaly_detector and anomaly_sample_size choose the anomaly detector
+        (see anomaly.ANOMALY_DETECTORS); the report's 'anomaly_detection'
+        block says which one ran and on how many rows it was trained.
+        """
         try:
-            # Validate thresholds are provided
-            if thresholds is None:
-                return {
-                    'success': False,
-                    'error': 'Machine-specific thresholds are required',
-                    'message': 'Analysis cannot proceed without machine thresholds from database'
-                }
+            error = self._check_analysis_request(thresholds, machine_name, stress_mode)
+            if error:
+                return error
+            detector, error = self._anomaly_detector(anomaly_detector, anomaly_sample_size)
+            if error:
+                return error
+            error = self._check_timeline(timeline)
+            if error:
+                return error
             
-            print(f'✓ Analyzing with machine-specific thresholds for {machine_name}:')
-            print(f'  Temperature: Warning={thresholds["temperature"]["warning"]}°C, Critical={thresholds["temperature"]["critical"]}°C')
-            print(f'  Vibration: Warning={thresholds["vibration"]["warning"]} Hz, Critical={thresholds["vibration"]["critical"]} Hz')
-            print(f'  Current: Warning={thresholds["current"]["warning"]} A, Critical={thresholds["current"]["critical"]} A')
+            timings = {}
+            started = time.perf_counter()
             
-            # Read CSV
-            df = pd.read_csv(csv_path)
+            # Read upload (CSV, compressed CSV, Parquet or Arrow IPC, detected from content)
+            self._report_progress(progress, 'reading', 0.05)
+            stage_start = started
+            upload_format = detect_format(csv_path)
+            columns = read_sensor_header(csv_path, upload_format)
             
-            # Validate required columns
-            required_columns = ['temperature', 'vibration', 'current']
-            if not all(col in df.columns for col in required_columns):
+            # Validate required columns from the header before parsing any rows
+            required_columns = SensorSet(thresholds).names
+            if not all(col in columns for col in required_columns):
                 return {
                     'success': False,
                     'error': f'CSV must contain columns: {", ".join(required_columns)}'
                 }
             
-            # Calculate overall health with custom thresholds
-            health_scores = []
-            for _, row in df.iterrows():
-                score = self.calculate_health_score(
-                    row['temperature'],
-                    row['vibration'],
-                    row['current'],
-                    thresholds=thresholds
-                )
-                health_scores.append(score)
-            
-            base_score = np.mean(health_scores)
-            
-            # Analyze stress patterns first to get event counts
-            stress_events = self.analyze_stress_patterns(df, thresholds=thresholds)
-            critical_count = len([e for e in stress_events if e['stress_level'] == 'Critical'])
-            high_count = len([e for e in stress_events if e['stress_level'] == 'High'])
+            df = read_sensor_frame(csv_path, upload_format, columns=columns, sensors=required_columns)
+            stage_start = self._finish_stage(timings, 'read', stage_start)
             
-            # Apply penalties for stress events
-            overall_score = base_score
+            return self._analyze_frame(
+                df, thresholds, detector, timings, started, stage_start,
+                machine_name=machine_name, stress_mode=stress_mode, max_episodes=max_episodes,
+                machine_id=machine_id, progress=progress, include_timings=include_timings, timeline=timeline
+            )
             
-            # Heavy penalty for critical events
-            if critical_count > 0:
-                # Each critical event reduces score significantly
-                critical_penalty = min(critical_count * 3, 40)  # Max 40% penalty
-                overall_score = overall_score - critical_penalty
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def analyze_dataframe(self, df, thresholds=None, machine_name=None, stress_mode='events', max_episodes=None, machine_id=None, progress=None, include_timings=False, timeline=None,
+                          anomaly_detector=None, anomaly_sample_size=None):
+        """analyze_csv for readings already loaded as a DataFrame (as read_sensor_frame returns)"""
+        try:
+            error = self._check_analysis_request(thresholds, machine_name, stress_mode)
+            if error:
+                return error
+            detector, error = self._anomaly_detector(anomaly_detector, anomaly_sample_size)
+            if error:
+                return error
+            error = self._check_timeline(timeline)
+            if error:
+                return error
             
-            # Moderate penalty for high-level events
-            if high_count > 0:
-                high_penalty = min(high_count * 0.5, 15)  # Max 15% penalty
-                overall_score = overall_score - high_penalty
+            required_columns = SensorSet(thresholds).names
+            if not all(col in df.columns for col in required_columns):
+                return {
+                    'success': False,
+                    'error': f'CSV must contain columns: {", ".join(required_columns)}'
+                }
+            if len(df) == 0:
+                return {
+                    'success': False,
+                    'error': 'CSV contains no readings'
+                }
             
-            # Ensure score doesn't go below 0
-            overall_score = max(0, overall_score)
-            overall_status = self.determine_health_status(overall_score)
+            started = time.perf_counter()
+            return self._analyze_frame(
+                df, thresholds, detector, {}, started, started,
+                machine_name=machine_name, stress_mode=stress_mode, max_episodes=max_episodes,
+                machine_id=machine_id, progress=progress, include_timings=include_timings, timeline=timeline
+            )
             
-            # stress_events already calculated above
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def analyze_history(self, machine_id, start=None, end=None, thresholds=None, machine_name=None, stress_mode='events', max_episodes=None, progress=None, include_timings=False, timeline=None,
+                        anomaly_detector=None, anomaly_sample_size=None):
+        """analyze_csv over a machine's stored readings with start <= timestamp < end
+        
+        Only the day partitions overlapping the range are read (memory-mapped).
+        start and end are ISO dates/datetimes or None for an open end. The
+        report gets a 'history' block with the range and partitions read.
+        """
+        try:
+            error = self._check_analysis_request(thresholds, machine_name, stress_mode)
+            if error:
+                return error
+            detector, error = self._anomaly_detector(anomaly_detector, anomaly_sample_size)
+            if error:
+                return error
+            error = self._check_timeline(timeline)
+            if error:
+                return error
+            range_start, range_end = parse_time(start), parse_time(end)
             
-            # Detect anomalies
-            anomalies = self.detect_anomalies(df)
+            timings = {}
+            started = time.perf_counter()
+            self._report_progress(progress, 'reading', 0.05)
+            df, partitions = self.history.frame(machine_id, range_start, range_end)
+            if len(df) == 0:
+                return {
+                    'success': False,
+                    'error': 'No stored readings for this machine in the requested range'
+                }
+            missing = [name for name in SensorSet(thresholds).names if name not in df.columns]
+            if missing:
+                return {
+                    'success': False,
+                    'error': f'Stored history has no {", ".join(missing)} readings'
+                }
+            stage_start = self._finish_stage(timings, 'read', started)
             
-            # Calculate trends
-            trends = self.calculate_trends(df)
+            report = self._analyze_frame(
+                df, thresholds, detector, timings, started, stage_start,
+                machine_name=machine_name, stress_mode=stress_mode, max_episodes=max_episodes,
+                machine_id=machine_id, progress=progress, include_timings=include_timings, timeline=timeline
+            )
+            report['history'] = {
+                'machine_id': str(machine_id),
+                'start': start,
+                'end': end,
+                'partitions_read': partitions,
+                'first_timestamp': self._timestamp_labels(df, [0])[0],
+                'last_timestamp': self._timestamp_labels(df, [len(df) - 1])[0]
+            }
+            return report
             
-            # Overall health summary
-            overall_health = {
-                'score': round(overall_score, 2),
-                'status': overall_status,
-                'total_readings': len(df),
-                'analysis_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'machine_name': machine_name or 'Unknown'
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
             }
+    
+    def history_trends(self, machine_id, start=None, end=None):
+        """Coarse trends for a machine from the history index, without reading any readings
+        
+        Whole days overlapping [start, end) are included; 'trends' has the
+        calculate_trends schema and 'days' the per-day readings, mean, min and max.
+        """
+        try:
+            stats, days = self.history.trends(machine_id, parse_time(start), parse_time(end))
+            if stats is None:
+                return {
+                    'success': False,
+                    'error': 'No stored readings for this machine in the requested range'
+                }
             
-            # Generate comprehensive recommendations
-            recommendations = self.generate_recommendations(
-                overall_health,
-                stress_events,
-                trends,
-                machine_name=machine_name,
-                thresholds=thresholds
-            )
+            columns = SENSOR_COLUMNS
+            slopes = stats.slope() if stats.n > 1 else None
+            stds = stats.std()
+            trends = {}
+            for i, column in enumerate(columns):
+                if stats.n > 1:
+                    trends[column] = self.trend_summary(slopes[i], stats.mean[i], stats.minimum[i], stats.maximum[i], stds[i])
+                else:
+                    trends[column] = self.trend_summary(None, stats.first[i], stats.first[i], stats.first[i], 0)
             
-            # Compile comprehensive report with thresholds
-            report = {
+            daily = []
+            for entry in days:
+                day = {'day': entry['day'], 'readings': entry['rows']}
+                for i, column in enumerate(columns):
+                    day[column] = {
+                        'mean': round(entry['sum'][i] / entry['rows'], 2),
+                        'min': round(entry['min'][i], 2),
+                        'max': round(entry['max'][i], 2)
+                    }
+                daily.append(day)
+            
+            return {
                 'success': True,
-                'overall_health': overall_health,
-                'machine_thresholds': thresholds,  # Include thresholds used for analysis
-                'stress_events': stress_events,
-                'anomalies': anomalies,
+                'machine_id': str(machine_id),
+                'total_readings': stats.n,
+                'first_timestamp': days[0]['first_timestamp'],
+                'last_timestamp': days[-1]['last_timestamp'],
                 'trends': trends,
-                'recommendations': recommendations,
-                'summary': {
-                    'total_stress_events': len(stress_events),
-                    'critical_events': len([e for e in stress_events if e['stress_level'] == 'Critical']),
-                    'anomalies_detected': len(anomalies),
-                    'health_trend': self.get_health_trend(health_scores)
-                }
+                'days': daily
             }
             
-            print(f'✓ Analysis complete for {machine_name}')
-            print(f'  Health Score: {overall_score:.2f}/100 ({overall_status})')
-            print(f'  Stress Events: {len(stress_events)} (Critical: {len([e for e in stress_events if e["stress_level"] == "Critical"])})')
-            print(f'  Anomalies: {len(anomalies)}')
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def record_history(self, machine_id, csv_path):
+        """Store an upload's timestamped readings in the machine's history
+        
+        Raises ValueError when the upload lacks the sensor or timestamp columns.
+        """
+        upload_format = detect_format(csv_path)
+        columns = read_sensor_header(csv_path, upload_format)
+        required_columns = ['timestamp'] + SENSOR_COLUMNS
+        if not all(col in columns for col in required_columns):
+            raise ValueError(f'Stored history needs columns: {", ".join(required_columns)}')
+        
+        import pandas as pd
+        df = read_sensor_frame(csv_path, upload_format, columns=columns)
+        timestamps = df['timestamp']
+        if not _is_datetime_column(timestamps):
+            timestamps = pd.to_datetime(timestamps, errors='coerce')
+        if getattr(timestamps.dt, 'tz', None) is not None:
+            timestamps = timestamps.dt.tz_localize(None)
+        values = df[SENSOR_COLUMNS].to_numpy(dtype=np.float64)
+        return self.history.append(machine_id, timestamps.values, values)
+    
+    def _analyze_frame(self, df, thresholds, detector, timings, started, stage_start, machine_name=None, stress_mode='events',
+                       max_episodes=None, machine_id=None, progress=None, include_timings=False, timeline=None):
+        """Everything analyze_csv does after reading: scores, stress, anomalies, trends, report
+        
+        Every stage works on one rows x sensors matrix of the sensors in thresholds.
+        Large frames get their per-reading scores, stress levels, anomaly
+        labels and trend sums from the process pool (see parallel.py); the
+        report is the same either way.
+        """
+        sensors = self._sensor_set(thresholds)
+        values = sensors.matrix(df)
+        
+        scored = None
+        if self.parallel.enabled(len(values)):
+            self._report_progress(progress, 'parallel scoring', 0.2)
+            self.fit_anomaly_detector(detector, values, machine_id, thresholds, sensors=sensors.names)
+            scored = self.parallel.score(values, sensors, detector.model)
+            if scored is not None:
+                detector.rows_scored += len(values)
+            stage_start = self._finish_stage(timings, 'parallel_scoring', stage_start)
+        
+        # Calculate overall health with custom thresholds
+        self._report_progress(progress, 'health scoring', 0.25)
+        if scored is not None:
+            health_scores = scored['health_scores']
+        else:
+            health_scores = self.calculate_health_scores_matrix(values, sensors)
+        
+        base_score = np.mean(health_scores)
+        stage_start = self._finish_stage(timings, 'health_scoring', stage_start)
+        
+        # Analyze stress patterns first to get event counts
+        self._report_progress(progress, 'stress patterns', 0.4)
+        stress_levels = scored['stress_levels'] if scored is not None else self.stress_levels(values, sensors)
+        stress_counts = self.stress_counts(stress_levels)
+        
+        if stress_mode == 'episodes':
+            stress_events = self.build_stress_episodes(df, values, stress_levels, sensors, max_episodes=max_episodes)
+        else:
+            stress_events = self.build_stress_events(df, values, stress_levels, sensors)
+        stage_start = self._finish_stage(timings, 'stress_patterns', stage_start)
+        
+        # Detect anomalies
+        self._report_progress(progress, 'anomaly detection', 0.55)
+        anomalies = self.detect_anomalies(
+            df, machine_id=machine_id, thresholds=thresholds, detector=detector, values=values,
+            labels=scored['anomaly_labels'] if scored is not None else None
+        )
+        stage_start = self._finish_stage(timings, 'anomaly_detection', stage_start)
+        
+        # Calculate trends
+        self._report_progress(progress, 'trends', 0.8)
+        trends = self.calculate_trends(df, values, sensors.names, scored['trend_statistics'] if scored is not None else None)
+        stage_start = self._finish_stage(timings, 'trends', stage_start)
+        
+        # Change points over the health score and each sensor
+        self._report_progress(progress, 'change points', 0.85)
+        change_points = self.change_point_analysis(df, health_scores, values, sensors.names)
+        health_trend = self.health_trend_with_change_points(self.get_health_trend(health_scores), change_points)
+        stage_start = self._finish_stage(timings, 'change_points', stage_start)
+        
+        # Time to warning/critical thresholds from the recent window
+        forecast = self.forecast(df, sensors, values)
+        stage_start = self._finish_stage(timings, 'forecast', stage_start)
+        
+        self._report_progress(progress, 'recommendations', 0.9)
+        report = self.compile_report(
+            base_score,
+            stress_counts,
+            stress_events,
+            anomalies,
+            trends,
+            health_trend=health_trend,
+            total_readings=len(df),
+            thresholds=thresholds,
+            machine_name=machine_name,
+            stress_mode=stress_mode,
+            forecast=forecast
+        )
+        report['anomaly_detection'] = detector.describe()
+        self.add_change_points(report, change_points)
+        stage_start = self._finish_stage(timings, 'recommendations', stage_start)
+        
+        if timeline is not None:
+            report['timeline'] = self.build_timeline(df, health_scores, stress_levels, timeline, values, sensors.names)
+            self._finish_stage(timings, 'timeline', stage_start)
+        metrics.inc('rows_analyzed_total', len(df), mode='batch')
+        
+        if include_timings:
+            report['timings'] = self.timings_block(timings, time.perf_counter() - started)
+        return report
+    
+    def analyze_csv_stream(self, csv_path, thresholds=None, machine_name=None, stress_mode='episodes', max_episodes=None, machine_id=None, chunksize=None, progress=None, include_timings=False, timeline=None,
+                           anomaly_detector=None, anomaly_sample_size=None):
+        """Chunked analysis for exports too large to load at once
+        
+        Produces the same report schema as analyze_csv with bounded memory;
+        see streaming.StreamingAnalysis for the running state kept per pass.
+        The timeline's p95 needs every reading of a bucket, so it is not offered here.
+        """
+        try:
+            if timeline is not None:
+                return {
+                    'success': False,
+                    'error': 'timeline is only available with analysis_mode=standard'
+                }
             
-            return report
+            error = self._check_analysis_request(thresholds, machine_name, stress_mode)
+            if error:
+                return error
+            detector, error = self._anomaly_detector(anomaly_detector, anomaly_sample_size)
+            if error:
+                return error
+            
+            stream = StreamingAnalysis(
+                self,
+                thresholds,
+                stress_mode=stress_mode,
+                max_episodes=max_episodes,
+                machine_id=machine_id,
+                chunksize=chunksize,
+                progress=progress,
+                include_timings=include_timings,
+                detector=detector
+            )
+            return stream.run(csv_path, machine_name=machine_name)
             
         except Exception as e:
             return {
@@ -516,14 +1158,171 @@ class MachineryHealthAnalyzer:
                 'error': str(e)
             }
     
+    def apply_stress_penalties(self, base_score, stress_counts):
+        """Subtract critical/high stress penalties from the mean health score"""
+        critical_count = stress_counts['critical']
+        high_count = stress_counts['high']
+        
+        # Apply penalties for stress events
+        overall_score = base_score
+        
+        # Heavy penalty for critical events
+        if critical_count > 0:
+            # Each critical event reduces score significantly
+            critical_penalty = min(critical_count * 3, 40)  # Max 40% penalty
+            overall_score = overall_score - critical_penalty
+        
+        # Moderate penalty for high-level events
+        if high_count > 0:
+            high_penalty = min(high_count * 0.5, 15)  # Max 15% penalty
+            overall_score = overall_score - high_penalty
+        
+        # Ensure score doesn't go below 0
+        return max(0, overall_score)
+    
+    def compile_report(self, base_score, stress_counts, stress_events, anomalies, trends, health_trend,
+                       total_readings, thresholds, machine_name=None, stress_mode='events', anomaly_count=None, forecast=None):
+        """Score, recommend and assemble the final analysis report
+        
+        anomaly_count overrides len(anomalies) when the anomaly list was capped.
+        forecast (from forecast()) is added to the report and its threshold
+        crossings feed the recommendations.
+        """
+        overall_score = self.apply_stress_penalties(base_score, stress_counts)
+        overall_status = self.determine_health_status(overall_score)
+        if anomaly_count is None:
+            anomaly_count = len(anomalies)
+        
+        # Overall health summary
+        overall_health = {
+            'score': round(overall_score, 2),
+            'status': overall_status,
+            'total_readings': total_readings,
+            'analysis_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'machine_name': machine_name or 'Unknown'
+        }
+        
+        # Generate comprehensive recommendations
+        recommendations = self.generate_recommendations(
+            overall_health,
+            stress_events,
+            trends,
+            machine_name=machine_name,
+            thresholds=thresholds,
+            stress_counts=stress_counts,
+            forecast=forecast
+        )
+        
+        # Compile comprehensive report with thresholds
+        report = {
+            'success': True,
+            'overall_health': overall_health,
+            'machine_thresholds': thresholds,  # Include thresholds used for analysis
+            'stress_events': stress_events,
+            'anomalies': anomalies,
+            'trends': trends,
+            'recommendations': recommendations,
+            'summary': {
+                'total_stress_events': stress_counts['total'],
+                'critical_events': stress_counts['critical'],
+                'anomalies_detected': anomaly_count,
+                'health_trend': health_trend
+            }
+        }
+        
+        if stress_mode == 'episodes':
+            report['summary']['stress_episodes'] = len(stress_events)
+        if forecast is not None:
+            report['forecast'] = forecast
+        
+        logger.info(
+            f'Analysis complete for {machine_name}: health score {overall_score:.2f}/100 ({overall_status}), '
+            f'{stress_counts["total"]} stress events ({stress_counts["critical"]} critical), {anomaly_count} anomalies'
+        )
+        
+        return report
+    
+    def _report_progress(self, progress, stage, fraction):
+        if progress is not None:
+            progress(stage, fraction)
+    
+    def _finish_stage(self, timings, stage, stage_start):
+        """Record a stage's wall time and return the start time of the next stage"""
+        now = time.perf_counter()
+        timings[stage] = now - stage_start
+        metrics.observe('analysis_stage_seconds', now - stage_start, stage=stage)
+        return now
+    
+    def timings_block(self, timings, total_seconds):
+        """Report 'timings' entry: per-stage and total wall time in seconds"""
+        return {
+            'stages': {stage: round(seconds, 6) for stage, seconds in timings.items()},
+            'total_seconds': round(total_seconds, 6)
+        }
+    
+    def _check_analysis_request(self, thresholds, machine_name, stress_mode):
+        """Validate analysis options, returning an error report or None"""
+        # Validate thresholds are provided
+        if thresholds is None:
+            return {
+                'success': False,
+                'error': 'Machine-specific thresholds are required',
+                'message': 'Analysis cannot proceed without machine thresholds from database'
+            }
+        
+        try:
+            sensors = SensorSet(thresholds)
+        except ValueError as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            described = ', '.join(
+                f'{name} {entry["warning"]}/{entry["critical"]}{suffix}'
+                for name, entry, suffix in zip(sensors.names, sensors.thresholds, sensors.suffixes)
+            )
+            logger.debug(f'Analyzing {machine_name} with thresholds: {described}')
+        
+        if stress_mode not in ('events', 'episodes'):
+            return {
+                'success': False,
+                'error': f'Invalid stress_mode: {stress_mode}. Use "events" or "episodes"'
+            }
+        
+        return None
+    
+    def _check_timeline(self, timeline):
+        """Error report for an unknown timeline bucket, or None"""
+        if timeline is not None and timeline not in TIMELINE_BUCKETS:
+            return {
+                'success': False,
+                'error': f'Invalid timeline: {timeline}. Use one of: {", ".join(TIMELINE_BUCKETS)}'
+            }
+        return None
+    
+    def _anomaly_detector(self, name, sample_size):
+        """Build the requested anomaly detector, returning (detector, None) or (None, error report)"""
+        try:
+            return AnomalyDetector(name, sample_size), None
+        except ValueError as e:
+            return None, {
+                'success': False,
+                'error': str(e)
+            }
+    
     def get_health_trend(self, scores):
-        """Determine overall health trend"""
+        """Determine overall health trend from the per-reading score array"""
+        scores = np.asarray(scores, dtype=np.float64)
         if len(scores) < 2:
             return 'Stable'
         
-        first_half = np.mean(scores[:len(scores)//2])
-        second_half = np.mean(scores[len(scores)//2:])
-        
+        half = len(scores) // 2
+        return self.health_trend_from_halves(scores[:half].mean(), scores[half:].mean())
+    
+    def health_trend_from_halves(self, first_half, second_half):
+        """Label the change between the mean scores of the two halves of the data"""
         diff = second_half - first_half
         
         if abs(diff) < 5:
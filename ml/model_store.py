@@ -0,0 +1,231 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Detectors kept in memory per process. Unpickling a forest copies its node
+# arrays into private memory (about 1.2 MB for the default 100 trees), so
+# every web worker holds its own copy of each cached model
+MODEL_CACHE_SIZE = int(os.getenv('ANOMALY_MODEL_CACHE_SIZE', 16))
+
+
+def thresholds_fingerprint(thresholds):
+    """Stable hash of a thresholds dict, independent of key order"""
+    if thresholds is None:
+        return None
+    canonical = json.dumps(thresholds, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class AnomalyModelStore:
+    """Per-machine IsolationForest detectors persisted under the models directory
+
+    Fitted detectors are written with joblib. A bounded in-memory LRU of
+    MODEL_CACHE_SIZE models per process keeps hot machines from hitting disk;
+    only models preloaded in the gunicorn master are shared (copy-on-write)
+    between workers. A stored model is refit only when it is stale: too old,
+    fitted against different thresholds, by another detector mode or on other
+    sensors, or the incoming data has drifted away from the training
+    distribution.
+    """
+
+    def __init__(self, model_dir, max_cached=None, max_age_hours=None, drift_threshold=None):
+        self.model_dir = model_dir
+        self.max_cached = max_cached if max_cached is not None else MODEL_CACHE_SIZE
+        self.max_age_hours = max_age_hours if max_age_hours is not None else float(os.getenv('ANOMALY_MODEL_MAX_AGE_HOURS', 24 * 7))
+        self.drift_threshold = drift_threshold if drift_threshold is not None else float(os.getenv('ANOMALY_MODEL_DRIFT_Z', 3.0))
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # Held only while some thread fits or waits for a machine's model
+        self._fit_locks = weakref.WeakValueDictionary()
+
+        if not os.path.exists(self.model_dir):
+            os.makedirs(self.model_dir)
+
+    def get_detector(self, machine_id, features, thresholds=None, mode=None, sensors=None):
+        """Return (detector, source) for a machine, fitting a new one when needed
+
+        source is 'memory', 'disk' or 'fitted'. mode is the anomaly detector
+        mode the features were prepared for (a subsample-fitted model is not
+        reused for isolation_forest) and sensors the names of their columns.
+        """
+        entry, source = self.get_detector_entry(machine_id, features, thresholds=thresholds, mode=mode, sensors=sensors)
+        return entry['model'], source
+
+    def get_detector_entry(self, machine_id, features, thresholds=None, mode=None, sensors=None):
+        """Like get_detector, but returns the whole stored entry (model, n_samples, ...)"""
+        thresholds_hash = thresholds_fingerprint(thresholds)
+        sensors = list(sensors) if sensors is not None else None
+
+        entry, source = self._lookup(machine_id)
+        if entry is not None and not self._is_stale(entry, features, thresholds_hash, mode, sensors):
+            return entry, source
+
+        # One fit per machine at a time; a thread that waited reuses the fresh model
+        with self._fit_lock(machine_id):
+            entry, source = self._lookup(machine_id)
+            if entry is not None and not self._is_stale(entry, features, thresholds_hash, mode, sensors):
+                return entry, source
+            return self.fit(machine_id, features, thresholds_hash, mode=mode, sensors=sensors), 'fitted'
+
+    def fit(self, machine_id, features, thresholds_hash=None, mode=None, sensors=None):
+        """Fit, persist and cache a fresh detector for a machine"""
+        import joblib
+        from sklearn.ensemble import IsolationForest
+
+        model = IsolationForest(contamination=0.1, random_state=42)
+        with metrics.timer('anomaly_model_fit_seconds', model='machine'):
+            model.fit(features)
+
+        entry = {
+            'model': model,
+            'fitted_at': datetime.now().isoformat(),
+            'thresholds_hash': thresholds_hash,
+            'mode': mode,
+            'sensors': sensors,
+            'feature_mean': np.mean(features, axis=0),
+            'feature_std': np.std(features, axis=0),
+            'n_samples': int(len(features))
+        }
+
+        path = self._path(machine_id)
+        # A temp file of its own per writer, as threads of one worker may persist at once
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                joblib.dump(entry, f)
+            # Atomic swap so concurrent workers never load a partial file
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f'Could not persist anomaly model for machine {machine_id}: {e}')
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+        self._remember(machine_id, entry)
+        logger.info(f'Fitted anomaly model for machine {machine_id} on {entry["n_samples"]} readings')
+        return entry
+
+    def load(self, machine_id):
+        """Stored detector for a machine without fitting or staleness checks, or None"""
+        entry, _ = self._lookup(machine_id)
+        return entry['model'] if entry is not None else None
+
+    def invalidate(self, machine_id):
+        """Drop a machine's detector from memory and disk"""
+        with self._lock:
+            self._cache.pop(str(machine_id), None)
+        try:
+            os.remove(self._path(machine_id))
+        except OSError:
+            pass
+
+    def _lookup(self, machine_id):
+        key = str(machine_id)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                return entry, 'memory'
+
+        path = self._path(machine_id)
+        if not os.path.exists(path):
+            return None, None
+
+        import joblib
+        try:
+            entry = joblib.load(path)
+        except Exception as e:
+            logger.warning(f'Discarding unreadable anomaly model {path}: {e}')
+            return None, None
+
+        self._remember(machine_id, entry)
+        return entry, 'disk'
+
+    def preload(self, limit=None):
+        """Load the most recently fitted models into memory; returns how many
+
+        Meant for the gunicorn master in preload mode: models loaded before the
+        fork are shared copy-on-write by every worker. Machines are keyed by
+        their file name, which matches the id for ids without special characters.
+        """
+        limit = self.max_cached if limit is None else limit
+        paths = [
+            os.path.join(self.model_dir, name) for name in os.listdir(self.model_dir)
+            if name.startswith('anomaly_') and name.endswith('.joblib')
+        ]
+        paths.sort(key=os.path.getmtime, reverse=True)
+
+        loaded = 0
+        # Oldest first so the newest models end up most recently used in the LRU
+        for path in reversed(paths[:limit]):
+            machine_id = os.path.basename(path)[len('anomaly_'):-len('.joblib')]
+            entry, _ = self._lookup(machine_id)
+            if entry is not None:
+                loaded += 1
+        return loaded
+
+    def _fit_lock(self, machine_id):
+        key = str(machine_id)
+        with self._lock:
+            lock = self._fit_locks.get(key)
+            if lock is None:
+                lock = threading.Lock()
+                self._fit_locks[key] = lock
+            return lock
+
+    def _remember(self, machine_id, entry):
+        key = str(machine_id)
+        with self._lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    def _is_stale(self, entry, features, thresholds_hash, mode=None, sensors=None):
+        """Check age, thresholds, mode, sensors and a mean-shift drift test against the stored model"""
+        fitted_at = datetime.fromisoformat(entry['fitted_at'])
+        age_hours = (datetime.now() - fitted_at).total_seconds() / 3600
+        if age_hours > self.max_age_hours:
+            return True
+
+        if thresholds_hash is not None and entry.get('thresholds_hash') != thresholds_hash:
+            return True
+
+        # Fitted for another detector mode: a model trained on a sample
+        # doesn't stand in for one trained on every reading
+        if mode is not None and entry.get('mode') != mode:
+            return True
+
+        # Fitted on a different sensor set
+        if sensors is not None and entry.get('sensors') != sensors:
+            return True
+        if len(entry['feature_mean']) != np.shape(features)[1]:
+            return True
+
+        if self.drift_threshold > 0 and len(features) > 0:
+            mean = np.mean(features, axis=0)
+            std = np.asarray(entry['feature_std'], dtype=np.float64)
+            shift = np.abs(mean - np.asarray(entry['feature_mean'], dtype=np.float64))
+            z = shift / np.maximum(std, 1e-9)
+            if np.max(z) > self.drift_threshold:
+                return True
+
+        return False
+
+    def _path(self, machine_id):
+        safe_id = re.sub(r'[^A-Za-z0-9_-]', '_', str(machine_id))
+        return os.path.join(self.model_dir, f'anomaly_{safe_id}.joblib')
@@ -0,0 +1,270 @@
+import os
+import pickle
+import re
+import tempfile
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+from ingest import SENSOR_COLUMNS
+from metrics import metrics
+from sensors import SensorSet
+from streaming import RunningSensorStats, StressEpisodeTracker, episode_records
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: single process, no locking needed
+    fcntl = None
+
+
+class MachineOnlineState:
+    """Rolling analytics for one machine, updated batch by batch
+
+    Everything kept here is O(1) in the number of readings ingested: running
+    statistics and trend co-moments, EWMAs, score sums, stress counts, and a
+    bounded list of recent stress episodes and anomalies.
+    """
+
+    def __init__(self, machine_id, max_recent):
+        self.machine_id = machine_id
+        self.machine_name = None
+        self.thresholds = None
+        self.stats = RunningSensorStats(len(SENSOR_COLUMNS))
+        self.ewma = None
+        self.score_sum = 0.0
+        self.score_ewma = None
+        self.stress_counts = {'critical': 0, 'high': 0, 'total': 0}
+        self.tracker = StressEpisodeTracker(max_records=max_recent, keep_latest=True)
+        self.anomaly_count = 0
+        self.anomaly_scored = 0
+        self.recent_anomalies = deque(maxlen=max_recent)
+        self.has_timestamp = False
+        self.last_timestamp = None
+        self.updated_at = None
+
+
+class OnlineAnalytics:
+    """Incremental per-machine health assessment for POST /machines/<id>/readings
+
+    State is pickled per machine under state_dir and updated under an exclusive
+    file lock, so every gunicorn worker sees the same running totals. Only the
+    SENSOR_COLUMNS sensors are tracked; other sensors in thresholds are ignored.
+    """
+
+    def __init__(self, analyzer, state_dir, ewma_alpha=None, max_recent=None):
+        self.analyzer = analyzer
+        self.state_dir = state_dir
+        self.ewma_alpha = ewma_alpha if ewma_alpha is not None else float(os.getenv('ONLINE_EWMA_ALPHA', 0.05))
+        self.max_recent = max_recent if max_recent is not None else int(os.getenv('ONLINE_MAX_RECENT', 50))
+
+        if not os.path.exists(self.state_dir):
+            os.makedirs(self.state_dir)
+
+    def ingest(self, machine_id, readings, thresholds=None, machine_name=None):
+        """Fold a batch of readings into the machine's state in O(batch) time
+
+        Raises ValueError for malformed readings or when no thresholds are known.
+        """
+        values, labels, has_timestamp = self._parse_readings(readings)
+
+        with self._locked(machine_id):
+            state = self._load(machine_id) or MachineOnlineState(machine_id, self.max_recent)
+            if thresholds is not None:
+                state.thresholds = thresholds
+            if machine_name:
+                state.machine_name = machine_name
+            if state.thresholds is None:
+                raise ValueError('Machine thresholds are required for the first batch of readings')
+
+            start = state.stats.n
+            if not has_timestamp:
+                labels = [str(start + i) for i in range(len(values))]
+            batch = self._update(state, values, labels, start)
+            state.has_timestamp = state.has_timestamp or has_timestamp
+            state.last_timestamp = labels[-1]
+            state.updated_at = datetime.now().isoformat()
+            self._save(machine_id, state)
+
+        metrics.inc('rows_analyzed_total', len(values), mode='online')
+        batch['total_readings'] = state.stats.n
+        batch['rolling_health_score'] = round(float(state.score_ewma), 2)
+        return batch
+
+    def assessment(self, machine_id):
+        """Current health assessment from the stored state, or None if unknown"""
+        state = self._load(machine_id)
+        if state is None:
+            return None
+
+        n = state.stats.n
+        thresholds = state.thresholds
+        sensors = self._sensors(thresholds)
+        base_score = state.score_sum / n
+        overall_score = self.analyzer.apply_stress_penalties(base_score, state.stress_counts)
+        overall_status = self.analyzer.determine_health_status(overall_score)
+
+        overall_health = {
+            'score': round(overall_score, 2),
+            'status': overall_status,
+            'total_readings': n,
+            'analysis_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'machine_name': state.machine_name or 'Unknown'
+        }
+
+        trends = {}
+        slopes = state.stats.slope() if n > 1 else None
+        stds = state.stats.std()
+        for i, column in enumerate(SENSOR_COLUMNS):
+            if n > 1:
+                trends[column] = self.analyzer.trend_summary(
+                    slopes[i], state.stats.mean[i], state.stats.minimum[i], state.stats.maximum[i], stds[i]
+                )
+            else:
+                trends[column] = self.analyzer.trend_summary(
+                    None, state.stats.first[i], state.stats.first[i], state.stats.first[i], 0
+                )
+
+        stress_episodes = episode_records(self.analyzer, state.tracker.snapshot(), state.has_timestamp, sensors)
+        ongoing = state.tracker.open_run is not None and state.tracker.open_run['level'] != 0
+        recommendations = self.analyzer.generate_recommendations(
+            overall_health,
+            stress_episodes,
+            trends,
+            machine_name=state.machine_name,
+            thresholds=sensors,
+            stress_counts=state.stress_counts
+        )
+
+        return {
+            'success': True,
+            'machine_id': state.machine_id,
+            'overall_health': overall_health,
+            'machine_thresholds': thresholds,
+            'recent_stress_episodes': stress_episodes,
+            'recent_anomalies': list(state.recent_anomalies),
+            'trends': trends,
+            'recommendations': recommendations,
+            'rolling': {
+                'health_score_ewma': round(float(state.score_ewma), 2),
+                'ewma_alpha': self.ewma_alpha,
+                'sensors_ewma': {
+                    column: round(float(state.ewma[i]), 2) for i, column in enumerate(SENSOR_COLUMNS)
+                },
+                'last_timestamp': state.last_timestamp,
+                'updated_at': state.updated_at
+            },
+            'summary': {
+                'total_stress_events': state.stress_counts['total'],
+                'critical_events': state.stress_counts['critical'],
+                'stress_episodes': state.tracker.total + (1 if ongoing else 0),
+                'anomalies_detected': state.anomaly_count,
+                'anomaly_readings_scored': state.anomaly_scored,
+                # Long-run mean vs. recent EWMA stands in for the two-halves comparison
+                'health_trend': self.analyzer.health_trend_from_halves(base_score, state.score_ewma)
+            }
+        }
+
+    def _update(self, state, values, labels, start):
+        analyzer = self.analyzer
+        sensors = self._sensors(state.thresholds)
+
+        scores = analyzer.calculate_health_scores_matrix(values, sensors)
+        state.score_sum += float(scores.sum())
+        state.score_ewma = self._ewma(state.score_ewma, scores)
+        state.ewma = self._ewma(state.ewma, values)
+        state.stats.update(values, start)
+
+        levels = analyzer.stress_levels(values, sensors)
+        batch_counts = analyzer.stress_counts(levels)
+        for key in state.stress_counts:
+            state.stress_counts[key] += batch_counts[key]
+        state.tracker.update(levels, values, labels, start)
+
+        # Score against the machine's persisted detector when one exists
+        anomalies = 0
+        detector = analyzer.model_store.load(state.machine_id)
+        if detector is not None and getattr(detector, 'n_features_in_', len(SENSOR_COLUMNS)) != len(SENSOR_COLUMNS):
+            # Fitted by an analysis over a different sensor set
+            detector = None
+        if detector is not None:
+            flagged = np.flatnonzero(detector.predict(values) == -1)
+            anomalies = len(flagged)
+            state.anomaly_count += anomalies
+            state.anomaly_scored += len(values)
+            recent = flagged[-self.max_recent:]
+            for i, readings in zip(recent, values[recent].tolist()):
+                state.recent_anomalies.append(analyzer.anomaly_record(labels[i], readings, SENSOR_COLUMNS))
+
+        return {
+            'accepted': len(values),
+            'stress': batch_counts,
+            'anomalies': anomalies,
+            'anomaly_model': detector is not None
+        }
+
+    def _sensors(self, thresholds):
+        """SensorSet of the sensors online state tracks, whatever else thresholds describe"""
+        missing = [column for column in SENSOR_COLUMNS if not isinstance(thresholds.get(column), dict)]
+        if missing:
+            raise ValueError(f'Thresholds must include {", ".join(SENSOR_COLUMNS)}')
+        return SensorSet({column: thresholds[column] for column in SENSOR_COLUMNS})
+
+    def _ewma(self, previous, values):
+        """Fold a batch into an EWMA in one vectorized step"""
+        alpha = self.ewma_alpha
+        if previous is None:
+            previous = values[0]
+            values = values[1:]
+        m = len(values)
+        if m == 0:
+            return previous
+        decay = (1 - alpha) ** np.arange(m - 1, -1, -1)
+        return (1 - alpha) ** m * previous + alpha * (decay @ values)
+
+    def _parse_readings(self, readings):
+        if not isinstance(readings, list) or len(readings) == 0:
+            raise ValueError('readings must be a non-empty list')
+
+        try:
+            values = np.array(
+                [[reading[column] for column in SENSOR_COLUMNS] for reading in readings],
+                dtype=np.float64
+            )
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'Each reading must contain numeric {", ".join(SENSOR_COLUMNS)}')
+
+        has_timestamp = all('timestamp' in reading for reading in readings)
+        labels = [str(reading['timestamp']) for reading in readings] if has_timestamp else None
+        return values, labels, has_timestamp
+
+    def _path(self, machine_id):
+        safe_id = re.sub(r'[^A-Za-z0-9_-]', '_', str(machine_id))
+        return os.path.join(self.state_dir, f'{safe_id}.pkl')
+
+    @contextmanager
+    def _locked(self, machine_id):
+        if fcntl is None:
+            yield
+            return
+        with open(f'{self._path(machine_id)}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self, machine_id):
+        try:
+            with open(self._path(machine_id), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _save(self, machine_id, state):
+        path = self._path(machine_id)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
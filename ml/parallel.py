@@ -0,0 +1,273 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from jobs import analysis_mp_context
+
+logger = logging.getLogger(__name__)
+
+# Web workers (gunicorn.conf.py reads the same variable); each has its own pool
+WEB_WORKERS = int(os.getenv('WEB_CONCURRENCY', 2))
+# Pool processes per web worker for scoring the row ranges of one analysis,
+# by default the cores shared out between the web workers
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', max(1, (os.cpu_count() or 1) // WEB_WORKERS)))
+# Below this many readings the copy into shared memory and the round trips
+# to the pool (tens of milliseconds) cost more than they save; IsolationForest
+# scoring alone takes about 6 microseconds a reading on one core
+PARALLEL_MIN_ROWS = int(os.getenv('ANALYSIS_PARALLEL_MIN_ROWS', 100000))
+
+# numpy sums a contiguous run of n values pairwise: the first
+# n // 2 - (n // 2) % 8 values and the rest are summed separately and added,
+# recursively, down to blocks of 128. Row ranges cut at those same points
+# give partial sums that add up to the bits np.sum produces on the whole run.
+PAIRWISE_BLOCK = 128
+
+# Shared output blocks score() fills, besides the copy of the readings
+OUTPUT_DTYPES = {'health_scores': np.float64, 'stress_levels': np.int8, 'anomaly_labels': np.int8}
+
+# The last anomaly model a pool process unpickled, by token
+_worker_model = {}
+
+
+class SharedArray:
+    """A NumPy array in a multiprocessing.shared_memory block
+
+    Created in the analyzing process and attached by name in the pool
+    processes with spec(), so row ranges are read and written in place
+    rather than pickled to and from every task.
+    """
+
+    def __init__(self, shape, dtype, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.owner = name is None
+
+    def spec(self):
+        return self.shm.name, self.shape, self.dtype.str
+
+    @classmethod
+    def attach(cls, spec):
+        name, shape, dtype = spec
+        return cls(shape, dtype, name=name)
+
+    def array(self):
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class ParallelScoring:
+    """Row-parallel scoring of one analysis on a persistent process pool
+
+    The rows x sensors matrix is copied into shared memory once and split
+    into row ranges. Each pool process scores its range in place (health
+    scores, stress levels and anomaly labels into shared output arrays) and
+    returns the range's partial trend sums; a second round returns the
+    squared deviations from the merged means. Per-reading results don't
+    depend on the split, and the ranges follow numpy's pairwise summation,
+    so score() returns exactly what the serial stages compute.
+
+    Only processes that are not themselves pool workers (web workers, the
+    CLI) go parallel; job and batch workers already run one analysis per core.
+    """
+
+    def __init__(self, max_workers=None, min_rows=None):
+        self.max_workers = max_workers or ANALYSIS_WORKERS
+        self.min_rows = PARALLEL_MIN_ROWS if min_rows is None else min_rows
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def enabled(self, rows):
+        return self.max_workers > 1 and rows >= self.min_rows and multiprocessing.parent_process() is None
+
+    def score(self, values, sensors, model):
+        """Per-reading arrays and trend statistics for values, or None when the pool failed
+
+        Returns {'health_scores', 'stress_levels', 'anomaly_labels',
+        'trend_statistics'}; trend_statistics is what calculate_trends takes.
+        """
+        n = len(values)
+        # About two ranges per process, so one slow range doesn't hold up the rest
+        depth = (self.max_workers * 2 - 1).bit_length()
+        ranges = pairwise_ranges(n, depth)
+        model_token = (uuid.uuid4().hex, pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+
+        # The block is sensors x rows like sensor_matrix's, so each range of
+        # a sensor is contiguous in the pool processes too
+        shared = {'values': SharedArray((values.shape[1], n), values.dtype)}
+        shared.update({name: SharedArray((n,), dtype) for name, dtype in OUTPUT_DTYPES.items()})
+        try:
+            block = shared['values'].array()
+            block[:] = values.T
+            del block
+            specs = {name: array.spec() for name, array in shared.items()}
+
+            executor = self._pool()
+            parts = list(executor.map(
+                score_range,
+                [specs] * len(ranges), ranges, [sensors] * len(ranges), [model_token] * len(ranges)
+            ))
+            sums = merge_pairwise([part['sums'] for part in parts], n, depth)
+            weighted_sums = merge_pairwise([part['weighted_sums'] for part in parts], n, depth)
+            minimums = np.minimum.reduce([part['minimums'] for part in parts])
+            maximums = np.maximum.reduce([part['maximums'] for part in parts])
+
+            # As numpy's mean and std: the sum divided by the count, then the
+            # sum of squared deviations from that mean
+            averages = np.true_divide(sums, np.intp(n), out=sums, casting='unsafe')
+            deviations = list(executor.map(
+                deviation_range,
+                [specs['values']] * len(ranges), ranges, [averages] * len(ranges)
+            ))
+            variances = merge_pairwise(deviations, n, depth)
+            variances = np.true_divide(variances, np.intp(n), out=variances, casting='unsafe')
+            stds = np.sqrt(variances, out=variances)
+
+            # Copied out so the shared blocks can be released now
+            result = {name: shared[name].array().copy() for name in OUTPUT_DTYPES}
+        except BrokenProcessPool as e:
+            logger.warning(f'Analysis pool failed ({e}); scoring on one core')
+            self._reset()
+            return None
+        finally:
+            for array in shared.values():
+                array.close()
+
+        slopes = weighted_sums / trend_denominator(n)
+        result['trend_statistics'] = (slopes, averages, minimums, maximums, stds)
+        return result
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=analysis_mp_context())
+                atexit.register(self.shutdown)
+            return self._executor
+
+    def shutdown(self):
+        """Stop the pool and wait for its processes, so none outlive the interpreter"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _reset(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def shared_memory_bytes(rows, sensors, dtype=np.float64):
+    """Bytes of the shared blocks score() allocates for a rows x sensors matrix of dtype"""
+    output_bytes = sum(np.dtype(dtype).itemsize for dtype in OUTPUT_DTYPES.values())
+    return rows * (sensors * np.dtype(dtype).itemsize + output_bytes)
+
+
+def pairwise_ranges(n, depth):
+    """(start, stop) row ranges at depth levels of numpy's pairwise summation of n values"""
+    ranges = []
+
+    def split(start, count, level):
+        if level == 0 or count <= PAIRWISE_BLOCK:
+            ranges.append((start, start + count))
+            return
+        half = count // 2
+        half -= half % 8
+        split(start, half, level - 1)
+        split(start + half, count - half, level - 1)
+
+    split(0, n, depth)
+    return ranges
+
+
+def merge_pairwise(partials, n, depth):
+    """Add the partial sums over pairwise_ranges(n, depth) in the order numpy adds them"""
+    parts = iter(partials)
+
+    def merge(count, level):
+        if level == 0 or count <= PAIRWISE_BLOCK:
+            return next(parts)
+        half = count // 2
+        half -= half % 8
+        left = merge(half, level - 1)
+        return left + merge(count - half, level - 1)
+
+    return merge(n, depth)
+
+
+def trend_denominator(n):
+    """sum(dx^2) for the centred row index dx of n readings"""
+    dx = np.arange(n, dtype=np.float64) - (n - 1) / 2
+    return dx @ dx
+
+
+def trend_sums(values, start, n):
+    """Per-sensor sum(dx * reading) over rows start.. of n, dx the centred row index"""
+    dx = np.arange(start, start + len(values), dtype=np.float64) - (n - 1) / 2
+    values = np.asarray(values, dtype=np.float64)
+    return np.array([np.add.reduce(dx * values[:, i]) for i in range(values.shape[1])])
+
+
+def score_range(specs, bounds, sensors, model_token):
+    """Pool task: score rows [start, stop) in place and return their partial trend sums"""
+    from model import analyzer
+
+    start, stop = bounds
+    attached = {name: SharedArray.attach(spec) for name, spec in specs.items()}
+    try:
+        values = attached['values'].array().T[start:stop]
+        n = attached['values'].shape[1]
+
+        attached['health_scores'].array()[start:stop] = analyzer.calculate_health_scores_matrix(values, sensors)
+        attached['stress_levels'].array()[start:stop] = analyzer.stress_levels(values, sensors)
+        attached['anomaly_labels'].array()[start:stop] = _model(model_token).predict(values)
+
+        part = {
+            'sums': np.add.reduce(values, axis=0),
+            'weighted_sums': trend_sums(values, start, n),
+            'minimums': values.min(axis=0),
+            'maximums': values.max(axis=0)
+        }
+        return part
+    finally:
+        # The views have to go before the blocks can be closed
+        values = None
+        for array in attached.values():
+            array.close()
+
+
+def deviation_range(spec, bounds, averages):
+    """Pool task: per-sensor sum of squared deviations from averages over rows [start, stop)"""
+    start, stop = bounds
+    attached = SharedArray.attach(spec)
+    try:
+        values = attached.array().T[start:stop]
+        deviations = np.subtract(values, averages)
+        deviations = np.square(deviations, out=deviations)
+        return np.add.reduce(deviations, axis=0)
+    finally:
+        values = None
+        attached.close()
+
+
+def _model(model_token):
+    token, blob = model_token
+    if token not in _worker_model:
+        _worker_model.clear()
+        _worker_model[token] = pickle.loads(blob)
+    return _worker_model[token]
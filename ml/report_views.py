@@ -0,0 +1,128 @@
+import heapq
+
+from serialization import decode_json, encode_json
+
+# Report lists that can be capped, paged and streamed
+REPORT_LISTS = ('stress_events', 'anomalies')
+
+RESPONSE_MODES = ('full', 'summary', 'top', 'ndjson')
+
+STRESS_RANK = {'Critical': 2, 'High': 1}
+
+
+def summary_view(report, report_id=None, counts=None):
+    """The report without its event and anomaly lists, plus their sizes
+
+    counts gives the list sizes when report is a head stored without its lists.
+    """
+    view = report_head(report)
+    view['lists'] = {name: list_info(report, name, 0, report_id, None if counts is None else counts[name]) for name in REPORT_LISTS}
+    view['report_id'] = report_id
+    return view
+
+
+def top_view(report, top_n, report_id=None):
+    """The report with each list capped to its top_n most severe records
+
+    Stress records rank by level, then by how far their worst reading is past
+    its critical threshold; anomalies by the latter alone. The kept records
+    stay in chronological order.
+    """
+    view = summary_view(report, report_id)
+    thresholds = report.get('machine_thresholds') or {}
+    for name in REPORT_LISTS:
+        records = report.get(name, [])
+        keep = top_indices(records, top_n, lambda record: severity(record, thresholds))
+        view[name] = [records[i] for i in keep]
+        view['lists'][name] = list_info(report, name, len(keep), report_id)
+    return view
+
+
+def page(stored, list_name, cursor, limit):
+    """One page of a cached report's list; cursor is the offset returned as next_cursor
+
+    Only the page's records are read from the StoredLists and decoded.
+    """
+    items = [decode_json(record) for record in stored.records(list_name, cursor, cursor + limit)]
+    total = stored.count(list_name)
+    next_offset = cursor + len(items)
+    return {
+        'list': list_name,
+        'items': items,
+        'cursor': str(cursor),
+        'next_cursor': str(next_offset) if next_offset < total else None,
+        'total': total
+    }
+
+
+def report_head(report):
+    """The report without its lists"""
+    return {key: value for key, value in report.items() if key not in REPORT_LISTS}
+
+
+def iter_ndjson(report, report_id=None):
+    """NDJSON lines of a report dict, encoding one record at a time
+
+    The lines themselves are produced lazily, but the report they come from
+    is already in memory; a cached report streams from its stored lists
+    instead (iter_stored_ndjson).
+    """
+    records = {name: (encode_json(record) for record in report.get(name, [])) for name in REPORT_LISTS}
+    return ndjson_lines(summary_view(report, report_id), records)
+
+
+def stored_summary(stored, report_id=None):
+    """summary_view of a cached report's StoredLists, decoding only its head"""
+    return summary_view(decode_json(stored.head), report_id, {name: stored.count(name) for name in REPORT_LISTS})
+
+
+def iter_stored_ndjson(stored, summary):
+    """NDJSON lines of a cached report's StoredLists, read from the cache line by line"""
+    return ndjson_lines(summary, {name: stored.iter_records(name) for name in REPORT_LISTS})
+
+
+def ndjson_lines(summary, records):
+    """NDJSON lines: the summary, then one line per record, then an end marker
+
+    records maps each list name to an iterable of its records encoded as JSON.
+    """
+    yield _line({'type': 'summary', 'data': summary})
+    for name, record_type in (('stress_events', 'stress_event'), ('anomalies', 'anomaly')):
+        prefix = b'{"type":"' + record_type.encode() + b'","data":'
+        for record in records[name]:
+            yield prefix + record + b'}\n'
+    yield _line({'type': 'end', 'counts': {name: summary['lists'][name]['count'] for name in REPORT_LISTS}})
+
+
+def list_info(report, list_name, returned, report_id=None, count=None):
+    if count is None:
+        count = len(report.get(list_name, []))
+    info = {'count': count, 'returned': returned, 'truncated': returned < count}
+    if report_id is not None:
+        info['pages'] = f'/reports/{report_id}/{list_name}'
+    return info
+
+
+def severity(record, thresholds):
+    """(stress rank, worst reading as a multiple of its critical threshold), over every sensor in thresholds"""
+    worst = 0.0
+    for sensor, sensor_thresholds in thresholds.items():
+        if not isinstance(sensor_thresholds, dict):
+            continue
+        value = record.get(f'peak_{sensor}', record.get(sensor))
+        critical = sensor_thresholds.get('critical')
+        if value is not None and critical:
+            worst = max(worst, value / critical)
+    return STRESS_RANK.get(record.get('stress_level'), 0), worst
+
+
+def top_indices(records, top_n, key):
+    """Positions of the top_n records by key (earlier wins ties), in order"""
+    if top_n >= len(records):
+        return list(range(len(records)))
+    best = heapq.nlargest(top_n, range(len(records)), key=lambda i: (key(records[i]), -i))
+    return sorted(best)
+
+
+def _line(obj):
+    return encode_json(obj) + b'\n'
@@ -0,0 +1,275 @@
+import hashlib
+import json
+import logging
+import io
+import os
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+
+from model_store import thresholds_fingerprint
+from serialization import encode_json
+
+logger = logging.getLogger(__name__)
+
+# Bytes copied per read while hashing an upload
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Record offsets of a stored list are little-endian int64
+OFFSET = struct.Struct('<q')
+
+
+def save_and_hash(file_storage, filepath):
+    """Write an uploaded file to disk, hashing it as it streams through
+
+    Returns the SHA-256 hex digest of the uploaded bytes.
+    """
+    digest = hashlib.sha256()
+    stream = file_storage.stream
+    with open(filepath, 'wb') as out:
+        while True:
+            block = stream.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            out.write(block)
+    return digest.hexdigest()
+
+
+def analysis_cache_key(upload_digest, thresholds, analyzer_version, options=None):
+    """Cache key for an analysis: upload bytes + thresholds + analyzer version + options"""
+    parts = {
+        'upload': upload_digest,
+        'thresholds': thresholds_fingerprint(thresholds),
+        'version': analyzer_version,
+        'options': options or {}
+    }
+    canonical = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class StoredLists:
+    """A cached report's head (the report without its lists) and lists, read a slice at a time
+
+    Each list is stored as one JSON record per line next to the byte offsets
+    of its records, so a page reads two offsets and its own records and a
+    stream reads the list line by line.
+    """
+
+    def __init__(self, head, opener):
+        self.head = head
+        self._open = opener
+
+    def count(self, name):
+        with self._open(name, 'idx') as idx:
+            return idx.seek(0, os.SEEK_END) // OFFSET.size - 1
+
+    def records(self, name, start=0, stop=None):
+        """Records start..stop of a list, each as encoded JSON"""
+        with self._open(name, 'idx') as idx:
+            count = idx.seek(0, os.SEEK_END) // OFFSET.size - 1
+            stop = count if stop is None else min(stop, count)
+            if start >= stop:
+                return []
+            idx.seek(start * OFFSET.size)
+            first = OFFSET.unpack(idx.read(OFFSET.size))[0]
+            idx.seek(stop * OFFSET.size)
+            last = OFFSET.unpack(idx.read(OFFSET.size))[0]
+        with self._open(name, 'ndjson') as f:
+            f.seek(first)
+            return f.read(last - first).splitlines()
+
+    def iter_records(self, name):
+        """Every record of a list, each as encoded JSON, read line by line"""
+        with self._open(name, 'ndjson') as f:
+            for line in f:
+                yield line.rstrip(b'\n')
+
+
+class ResultCache:
+    """Two-tier cache of serialized analysis reports keyed by content hash
+
+    The memory tier is a bounded LRU per process. The optional disk tier is
+    shared by all workers and evicts least recently used entries once the
+    directory grows past max_disk_bytes.
+
+    put_lists stores a report's lists a second time, record by record, for
+    pages and NDJSON streams (see StoredLists). They go to the disk tier
+    only, or to the memory tier when the disk tier is disabled.
+    """
+
+    def __init__(self, cache_dir, max_memory_items=None, max_disk_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_memory_items = max_memory_items if max_memory_items is not None else int(os.getenv('RESULT_CACHE_MEMORY_ITEMS', 64))
+        if max_disk_bytes is None:
+            max_disk_bytes = int(float(os.getenv('RESULT_CACHE_DISK_MB', 256)) * 1024 * 1024)
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0
+        }
+
+        if self.max_disk_bytes > 0 and not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def get(self, key):
+        """Serialized report bytes for a key, or None"""
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return payload
+
+        payload = self._read_disk(key)
+        with self._lock:
+            if payload is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+        self._remember(key, payload)
+        return payload
+
+    def put(self, key, payload):
+        self._remember(key, payload)
+        with self._lock:
+            self.stats['stores'] += 1
+        if self.max_disk_bytes > 0:
+            self._write_disk(key, payload)
+
+    def put_lists(self, key, head, lists):
+        """Store a report's head (a dict) and its lists (name -> records) for get_lists"""
+        parts = {'head': encode_json(head)}
+        for name, records in lists.items():
+            lines = [encode_json(record) + b'\n' for record in records]
+            offsets = [0]
+            for line in lines:
+                offsets.append(offsets[-1] + len(line))
+            parts[f'{name}.ndjson'] = b''.join(lines)
+            parts[f'{name}.idx'] = b''.join(OFFSET.pack(offset) for offset in offsets)
+
+        if self.max_disk_bytes <= 0:
+            self._remember(f'{key}.lists', parts)
+            return
+        if sum(len(data) for data in parts.values()) > self.max_disk_bytes:
+            return
+        try:
+            # The head goes last: get_lists finds an entry once its head exists
+            for part, data in sorted(parts.items(), key=lambda item: item[0] == 'head'):
+                self._write_file(self._lists_path(key, part), data)
+            self._evict_disk()
+        except OSError as e:
+            logger.warning(f'Could not write result cache lists {key}: {e}')
+
+    def get_lists(self, key):
+        """StoredLists for a key stored with put_lists, or None"""
+        if self.max_disk_bytes <= 0:
+            with self._lock:
+                parts = self._memory.get(f'{key}.lists')
+                if parts is None:
+                    return None
+                self._memory.move_to_end(f'{key}.lists')
+                self.stats['memory_hits'] += 1
+            return StoredLists(parts['head'], lambda name, part: io.BytesIO(parts[f'{name}.{part}']))
+
+        path = self._lists_path(key, 'head')
+        try:
+            with open(path, 'rb') as f:
+                head = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        with self._lock:
+            self.stats['disk_hits'] += 1
+        return StoredLists(head, lambda name, part: open(self._lists_path(key, f'{name}.{part}'), 'rb'))
+
+    def summary(self):
+        with self._lock:
+            summary = dict(self.stats)
+            summary['memory_items'] = len(self._memory)
+        lookups = summary['memory_hits'] + summary['disk_hits'] + summary['misses']
+        summary['hit_rate'] = round((summary['memory_hits'] + summary['disk_hits']) / lookups, 4) if lookups else 0.0
+        summary['disk_enabled'] = self.max_disk_bytes > 0
+        return summary
+
+    def _remember(self, key, payload):
+        with self._lock:
+            self._memory[key] = payload
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def _lists_path(self, key, part):
+        return os.path.join(self.cache_dir, f'{key}.lists.{part}')
+
+    def _read_disk(self, key):
+        if self.max_disk_bytes <= 0:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                payload = f.read()
+            # Touch so eviction sees this entry as recently used
+            os.utime(path)
+            return payload
+        except OSError:
+            return None
+
+    def _write_disk(self, key, payload):
+        if len(payload) > self.max_disk_bytes:
+            return
+        try:
+            self._write_file(self._path(key), payload)
+            self._evict_disk()
+        except OSError as e:
+            logger.warning(f'Could not write result cache entry {key}: {e}')
+
+    def _write_file(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            os.remove(tmp_path)
+            raise
+
+    def _evict_disk(self):
+        """Remove least recently used files until the directory fits the budget
+
+        A report's stored lists are evicted with their head, as one entry.
+        """
+        entries = {}
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.tmp'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entry = name.split('.lists.', 1)[0] + '.lists' if '.lists.' in name else name
+            mtime, size, names = entries.get(entry, (0, 0, []))
+            entries[entry] = (max(mtime, stat.st_mtime), size + stat.st_size, names + [name])
+            total += stat.st_size
+
+        for _, size, names in sorted(entries.values()):
+            if total <= self.max_disk_bytes:
+                break
+            for name in names:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+            total -= size
+            with self._lock:
+                self.stats['evictions'] += 1
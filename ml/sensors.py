@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+
+from ingest import SENSOR_COLUMNS
+
+# Health score weights of the original sensors; temperature and vibration matter most
+DEFAULT_WEIGHTS = {'temperature': 0.35, 'vibration': 0.40, 'current': 0.25}
+# Weight of any other sensor whose thresholds don't give one (before normalizing)
+DEFAULT_WEIGHT = float(os.getenv('SENSOR_DEFAULT_WEIGHT', 0.25))
+DEFAULT_UNITS = {'temperature': '°C', 'vibration': 'Hz', 'current': 'A'}
+
+
+class SensorSet:
+    """The sensors an analysis covers, as described by its thresholds dict
+
+    Every dict entry of thresholds is a sensor with 'warning' and 'critical'
+    values and optionally a health score 'weight', a display 'unit' and a
+    'label'; other entries (machine metadata such as a model name) are skipped.
+    The original three sensors come first in SENSOR_COLUMNS order, any
+    others follow in thresholds order. Weights are normalized to sum to 1,
+    so the default three keep 0.35/0.40/0.25. warning, critical and weights
+    are float vectors in names order, for broadcasting against the rows x
+    sensors matrix from matrix().
+    """
+
+    def __init__(self, thresholds):
+        if isinstance(thresholds, dict):
+            thresholds = {name: entry for name, entry in thresholds.items() if isinstance(entry, dict)}
+        if not isinstance(thresholds, dict) or not thresholds:
+            raise ValueError('Thresholds must describe at least one sensor')
+        for name, entry in thresholds.items():
+            if entry.get('warning') is None or entry.get('critical') is None:
+                raise ValueError(f'Thresholds for {name} need warning and critical values')
+
+        self.names = [name for name in SENSOR_COLUMNS if name in thresholds]
+        self.names += [name for name in thresholds if name not in SENSOR_COLUMNS]
+        self.thresholds = [thresholds[name] for name in self.names]
+
+        self.warning = np.array([entry['warning'] for entry in self.thresholds], dtype=np.float64)
+        self.critical = np.array([entry['critical'] for entry in self.thresholds], dtype=np.float64)
+        weights = np.array([
+            entry.get('weight', DEFAULT_WEIGHTS.get(name, DEFAULT_WEIGHT))
+            for name, entry in zip(self.names, self.thresholds)
+        ], dtype=np.float64)
+        if (weights < 0).any() or not weights.sum() > 0:
+            raise ValueError('Sensor weights must be non-negative and not all zero')
+        self.weights = weights / weights.sum()
+
+        self.units = [entry.get('unit', DEFAULT_UNITS.get(name, '')) for name, entry in zip(self.names, self.thresholds)]
+        self.labels = [entry.get('label', name.replace('_', ' ').capitalize()) for name, entry in zip(self.names, self.thresholds)]
+        self.suffixes = [unit_suffix(unit) for unit in self.units]
+        self.peak_keys = [f'peak_{name}' for name in self.names]
+
+    def __len__(self):
+        return len(self.names)
+
+    def matrix(self, df):
+        return sensor_matrix(df, self.names)
+
+
+def is_thresholds(value):
+    """Whether value reads as one thresholds dict: every dict entry a sensor with warning and critical values"""
+    if not isinstance(value, dict):
+        return False
+    entries = [entry for entry in value.values() if isinstance(entry, dict)]
+    return bool(entries) and all('warning' in entry and 'critical' in entry for entry in entries)
+
+
+def sensor_matrix(df, names):
+    """rows x sensors readings of df's names columns, each sensor's column contiguous
+
+    float32 columns stay float32 (see ingest.FLOAT_DTYPE); anything else
+    becomes float64.
+    """
+    dtypes = [df[name].dtype for name in names]
+    dtype = np.float32 if all(dtype == np.float32 for dtype in dtypes) else np.float64
+    # Filled sensor by sensor into a sensors x rows block, so per-sensor
+    # reductions (means, sums) run over contiguous memory in the same order
+    # as on the separate columns
+    block = np.empty((len(names), len(df)), dtype=dtype)
+    for i, name in enumerate(names):
+        block[i] = df[name].to_numpy()
+    return block.T
+
+
+def unit_suffix(unit):
+    """Text after a reading: '°C' attaches directly, other units follow a space"""
+    if not unit:
+        return ''
+    return unit if unit.startswith('°') else f' {unit}'
@@ -0,0 +1,114 @@
+import gzip
+import json
+import logging
+import os
+from datetime import date, datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MEDIA_TYPE = 'application/json'
+MSGPACK_MEDIA_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+# Response compression for clients that send Accept-Encoding: encodings the
+# service may use (in preference order when the client accepts several
+# equally), the smallest body worth compressing and the compression levels.
+# The defaults favour speed; a report is encoded once per request.
+RESPONSE_COMPRESSION = [
+    encoding.strip() for encoding in os.getenv('RESPONSE_COMPRESSION', 'zstd,gzip').split(',')
+    if encoding.strip() in ('zstd', 'gzip')
+]
+COMPRESS_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', 16 * 1024))
+GZIP_LEVEL = int(os.getenv('RESPONSE_GZIP_LEVEL', 1))
+ZSTD_LEVEL = int(os.getenv('RESPONSE_ZSTD_LEVEL', 3))
+
+if orjson is not None:
+    # NumPy scalars and C-contiguous arrays are written by orjson itself;
+    # int dict keys become strings as with the stdlib encoder
+    ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def media_types():
+    """Response media types this process can produce, JSON first"""
+    return [JSON_MEDIA_TYPE] + (list(MSGPACK_MEDIA_TYPES) if msgpack is not None else [])
+
+
+def summary():
+    return {
+        'json_encoder': 'orjson' if orjson is not None else 'json',
+        'media_types': media_types(),
+        'compression': RESPONSE_COMPRESSION
+    }
+
+
+def encode(obj, media_type=JSON_MEDIA_TYPE):
+    """Serialize a report (or any response body) to bytes of media_type"""
+    if media_type in MSGPACK_MEDIA_TYPES:
+        return msgpack.packb(obj, default=_default, use_bin_type=True)
+    return encode_json(obj)
+
+
+def encode_json(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def decode_json(payload):
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def compress(payload, accepted):
+    """(body, content encoding or None) for a payload and the client's Accept-Encoding
+
+    accepted is werkzeug's request.accept_encodings. Small payloads, and
+    clients that accept none of RESPONSE_COMPRESSION, get the payload as is.
+    """
+    if len(payload) < COMPRESS_MIN_BYTES:
+        return payload, None
+    encoding = _best_encoding(accepted)
+    if encoding == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            logger.warning('zstd response compression needs zstandard; trying gzip')
+            encoding = 'gzip' if 'gzip' in RESPONSE_COMPRESSION and accepted['gzip'] else None
+        else:
+            return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(payload), 'zstd'
+    if encoding == 'gzip':
+        return gzip.compress(payload, compresslevel=GZIP_LEVEL, mtime=0), 'gzip'
+    return payload, None
+
+
+def _best_encoding(accepted):
+    best = None
+    best_quality = 0
+    for encoding in RESPONSE_COMPRESSION:
+        quality = accepted[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _default(obj):
+    """Values neither encoder writes natively; anything else is written as its str()"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return str(obj)
@@ -0,0 +1,484 @@
+import heapq
+import logging
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+from anomaly import AnomalyDetector
+from changepoint import HEALTH_MIN_SHIFT, BlockAccumulator, binary_segmentation, describe_segments, min_sensor_shift
+from forecast import MAX_WINDOW_ROWS, window_size
+from ingest import SENSOR_COLUMNS, iter_sensor_chunks
+from metrics import metrics
+from sensors import SensorSet
+
+logger = logging.getLogger(__name__)
+
+
+class RunningSensorStats:
+    """Mergeable per-sensor statistics over a stream of row chunks
+
+    Keeps count, min/max, mean and M2 (Welford/Chan) plus the co-moment of each
+    sensor with the row index, so the least-squares slope of calculate_trends
+    can be recovered without keeping the readings.
+    """
+
+    def __init__(self, width):
+        self.n = 0
+        self.mean = np.zeros(width)
+        self.m2 = np.zeros(width)
+        self.minimum = np.full(width, np.inf)
+        self.maximum = np.full(width, -np.inf)
+        self.mean_x = 0.0
+        self.m2_x = 0.0
+        self.c_xy = np.zeros(width)
+        self.first = None
+
+    def update(self, values, start_index):
+        """Merge a (rows x sensors) chunk whose first row has global index start_index"""
+        n_b = len(values)
+        if n_b == 0:
+            return
+        if self.first is None:
+            self.first = values[0].copy()
+
+        x = np.arange(start_index, start_index + n_b, dtype=np.float64)
+        mean_x_b = x.mean()
+        dx = x - mean_x_b
+        mean_b = values.mean(axis=0)
+        dy = values - mean_b
+
+        m2_b = np.einsum('ij,ij->j', dy, dy)
+        c_b = dx @ dy
+        m2_x_b = dx @ dx
+        self._combine(n_b, mean_b, m2_b, c_b, mean_x_b, m2_x_b, values.min(axis=0), values.max(axis=0))
+
+    def merge_summary(self, rows, mean, m2, c_xy, minimum, maximum, first, start_index):
+        """Merge precomputed statistics of rows whose first row has global index start_index
+
+        c_xy is the co-moment with the local row index 0..rows-1, which a
+        shift of the index leaves unchanged.
+        """
+        if rows == 0:
+            return
+        if self.first is None:
+            self.first = np.asarray(first, dtype=np.float64)
+        mean_x_b = start_index + (rows - 1) / 2
+        m2_x_b = rows * (rows * rows - 1) / 12
+        self._combine(
+            rows, np.asarray(mean, dtype=np.float64), np.asarray(m2, dtype=np.float64),
+            np.asarray(c_xy, dtype=np.float64), mean_x_b, m2_x_b,
+            np.asarray(minimum, dtype=np.float64), np.asarray(maximum, dtype=np.float64)
+        )
+
+    def _combine(self, n_b, mean_b, m2_b, c_b, mean_x_b, m2_x_b, minimum_b, maximum_b):
+        self.minimum = np.minimum(self.minimum, minimum_b)
+        self.maximum = np.maximum(self.maximum, maximum_b)
+
+        n_a = self.n
+        n = n_a + n_b
+        delta = mean_b - self.mean
+        delta_x = mean_x_b - self.mean_x
+        weight = n_a * n_b / n
+
+        self.mean = self.mean + delta * n_b / n
+        self.m2 = self.m2 + m2_b + delta * delta * weight
+        self.c_xy = self.c_xy + c_b + delta_x * delta * weight
+        self.mean_x = self.mean_x + delta_x * n_b / n
+        self.m2_x = self.m2_x + m2_x_b + delta_x * delta_x * weight
+        self.n = n
+
+    def slope(self):
+        return self.c_xy / self.m2_x
+
+    def std(self):
+        return np.sqrt(self.m2 / self.n)
+
+
+class ReservoirSample:
+    """Fixed-size uniform sample of rows (Algorithm R, vectorized per chunk)"""
+
+    def __init__(self, size, width, seed=42):
+        self.size = size
+        self.rows = np.empty((size, width))
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        n_b = len(values)
+        fill = min(max(self.size - self.seen, 0), n_b)
+        if fill:
+            self.rows[self.seen:self.seen + fill] = values[:fill]
+
+        rest = values[fill:]
+        if len(rest):
+            # Row i (0-based, global) replaces slot j ~ U[0, i] when j < size;
+            # fancy assignment keeps the last write, matching sequential order
+            positions = np.arange(self.seen + fill, self.seen + n_b)
+            slots = (self.rng.random(len(rest)) * (positions + 1)).astype(np.int64)
+            keep = slots < self.size
+            self.rows[slots[keep]] = rest[keep]
+
+        self.seen += n_b
+
+    def sample(self):
+        return self.rows[:min(self.seen, self.size)]
+
+
+class RecentRows:
+    """The last size rows of a stream and their labels, for the forecast window"""
+
+    def __init__(self, size):
+        self.size = size
+        self.chunks = deque()
+        self.rows = 0
+
+    def update(self, values, labels):
+        self.chunks.append((values[-self.size:], labels[-self.size:]))
+        self.rows += len(self.chunks[-1][0])
+        # Drop whole chunks that the newer ones already cover
+        while self.rows - len(self.chunks[0][0]) >= self.size:
+            self.rows -= len(self.chunks.popleft()[0])
+
+    def tail(self, rows):
+        """(values, labels) of the last rows readings"""
+        values = np.concatenate([chunk for chunk, _ in self.chunks])[-rows:]
+        labels = [label for _, chunk_labels in self.chunks for label in chunk_labels][-rows:]
+        return values, labels
+
+
+class StressEpisodeTracker:
+    """Builds stress episodes across chunk boundaries
+
+    Only raw run data is kept while streaming; issue strings are formatted when
+    the report is assembled, for the episodes that are actually returned.
+    """
+
+    def __init__(self, max_episodes=None, max_records=None, keep_latest=False):
+        self.max_episodes = max_episodes
+        self.max_records = max_records
+        self.keep_latest = keep_latest
+        self.open_run = None
+        # keep_latest retains the most recent max_records episodes (for online state)
+        self.episodes = deque(maxlen=max_records) if keep_latest else []
+        self.total = 0
+        self._heap_seq = 0
+
+    def update(self, levels, values, labels, start_index):
+        n = len(levels)
+        if n == 0:
+            return
+
+        boundaries = np.flatnonzero(np.diff(levels)) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [n]))
+        peaks = np.fmax.reduceat(values, starts, axis=0)
+
+        for i in range(len(starts)):
+            level = int(levels[starts[i]])
+            start_row = start_index + int(starts[i])
+            end_row = start_index + int(ends[i]) - 1
+
+            if self.open_run is not None and self.open_run['level'] == level:
+                run = self.open_run
+                run['end_row'] = end_row
+                run['end_label'] = labels[ends[i] - 1]
+                run['peaks'] = np.fmax(run['peaks'], peaks[i])
+                continue
+
+            self._close()
+            self.open_run = {
+                'level': level,
+                'start_row': start_row,
+                'end_row': end_row,
+                'start_label': labels[starts[i]],
+                'end_label': labels[ends[i] - 1],
+                'peaks': peaks[i]
+            }
+
+    def finish(self):
+        self._close()
+        if self.max_episodes is not None:
+            runs = [item[-1] for item in self.episodes]
+            return sorted(runs, key=lambda run: run['start_row'])
+        return list(self.episodes)
+
+    def snapshot(self):
+        """Closed episodes plus the ongoing one, without closing it"""
+        runs = list(self.episodes)
+        if self.open_run is not None and self.open_run['level'] != 0:
+            runs.append(self.open_run)
+        return runs
+
+    def _close(self):
+        run = self.open_run
+        self.open_run = None
+        if run is None or run['level'] == 0:
+            return
+
+        self.total += 1
+        if self.max_episodes is not None:
+            # Keep the most severe, then longest, episodes in a bounded min-heap
+            length = run['end_row'] - run['start_row'] + 1
+            self._heap_seq += 1
+            item = (run['level'], length, -self._heap_seq, run)
+            if len(self.episodes) < self.max_episodes:
+                heapq.heappush(self.episodes, item)
+            elif item[:3] > self.episodes[0][:3]:
+                heapq.heapreplace(self.episodes, item)
+        elif self.keep_latest or self.max_records is None or len(self.episodes) < self.max_records:
+            self.episodes.append(run)
+
+
+def episode_records(analyzer, runs, has_timestamp, sensors):
+    """Report records for raw tracker runs, formatting issues only for these runs
+
+    sensors is the SensorSet whose readings the runs' peaks hold.
+    """
+    start_labels = [run['start_label'] for run in runs]
+    end_labels = [run['end_label'] for run in runs]
+    if has_timestamp:
+        durations = analyzer.durations_seconds(start_labels, end_labels)
+    else:
+        durations = [None] * len(runs)
+
+    peaks = [run['peaks'].tolist() for run in runs]
+    issues = analyzer.stress_issues(peaks, sensors)
+    records = []
+    for i, run in enumerate(runs):
+        records.append(analyzer.stress_episode_record(
+            start_labels[i],
+            end_labels[i],
+            durations[i],
+            run['end_row'] - run['start_row'] + 1,
+            run['level'],
+            peaks[i],
+            issues[i],
+            sensors
+        ))
+    return records
+
+
+class StreamingAnalysis:
+    """Two-pass chunked analysis with memory bounded by chunk and sample sizes
+
+    Pass 1 accumulates health-score sums, stress counts and episodes, running
+    sensor statistics and a reservoir sample for the anomaly model. Pass 2
+    scores every row against that model and splits the health scores into the
+    halves used by get_health_trend. Event and anomaly lists are capped at
+    max_records while their counts stay exact. With include_timings the
+    report gets a 'timings' block for the pass_1, anomaly_model, pass_2 and
+    report stages. Change points are found on per-block sums kept in pass 1
+    (changepoint.BlockAccumulator), so their boundaries are block-aligned. The anomaly detector (anomaly.AnomalyDetector) is trained
+    on the reservoir sample, or a subsample of it, and scores each chunk.
+    The forecast uses the last forecast.MAX_WINDOW_ROWS rows kept in pass 1.
+    The sensors are those of thresholds (see sensors.SensorSet).
+    """
+
+    def __init__(self, analyzer, thresholds, stress_mode='episodes', max_episodes=None,
+                 machine_id=None, chunksize=None, reservoir_size=None, max_records=None, progress=None,
+                 include_timings=False, detector=None):
+        self.analyzer = analyzer
+        self.thresholds = thresholds
+        self.sensors = SensorSet(thresholds)
+        self.stress_mode = stress_mode
+        self.max_episodes = max_episodes
+        self.machine_id = machine_id
+        self.chunksize = chunksize or int(os.getenv('STREAM_CHUNK_ROWS', 100000))
+        self.reservoir_size = reservoir_size or int(os.getenv('STREAM_RESERVOIR_SIZE', 50000))
+        self.max_records = max_records or int(os.getenv('STREAM_MAX_RECORDS', 10000))
+        self.progress = progress
+        self.include_timings = include_timings
+        self.detector = detector if detector is not None else AnomalyDetector()
+
+    def run(self, csv_path, machine_name=None):
+        has_timestamp = None
+        sensors = self.sensors
+        names = sensors.names
+        stats = RunningSensorStats(len(names))
+        reservoir = ReservoirSample(self.reservoir_size, len(names))
+        tracker = StressEpisodeTracker(max_episodes=self.max_episodes, max_records=self.max_records)
+        blocks = BlockAccumulator(1 + len(names))
+        recent = RecentRows(MAX_WINDOW_ROWS)
+        stress_counts = {'critical': 0, 'high': 0, 'total': 0}
+        stress_events = []
+        score_chunks = []
+        n = 0
+        timings = {}
+        started = stage_start = time.perf_counter()
+
+        # Pass 1: scores, stress, running statistics and reservoir sample
+        for chunk in self._chunks(csv_path):
+            if has_timestamp is None:
+                missing = [col for col in names if col not in chunk.columns]
+                if missing:
+                    return {
+                        'success': False,
+                        'error': f'CSV must contain columns: {", ".join(names)}'
+                    }
+                has_timestamp = 'timestamp' in chunk.columns
+
+            values = chunk[names].to_numpy(dtype=np.float64)
+
+            scores = self.analyzer.calculate_health_scores_matrix(values, sensors)
+            score_chunks.append((n, len(scores), float(scores.sum())))
+
+            levels = self.analyzer.stress_levels(values, sensors)
+            chunk_counts = self.analyzer.stress_counts(levels)
+            for key in stress_counts:
+                stress_counts[key] += chunk_counts[key]
+
+            labels = self._labels(chunk, has_timestamp)
+            blocks.update(np.column_stack((scores, values)), labels)
+            recent.update(values, labels)
+            if self.stress_mode == 'episodes':
+                tracker.update(levels, values, labels, n)
+            elif len(stress_events) < self.max_records:
+                flagged = np.flatnonzero(levels)[:self.max_records - len(stress_events)]
+                readings = values[flagged].tolist()
+                issues = self.analyzer.stress_issues(readings, sensors)
+                for i, row in enumerate(flagged):
+                    stress_events.append(self.analyzer.stress_event_record(
+                        labels[row], levels[row], readings[i], issues[i], sensors
+                    ))
+
+            stats.update(values, n)
+            reservoir.update(values)
+            n += len(chunk)
+            # Total rows are unknown until the end of pass 1
+            self._report_progress(f'pass 1: {n} rows', 0.1)
+
+        if n == 0:
+            return {
+                'success': False,
+                'error': 'CSV contains no readings'
+            }
+
+        if self.stress_mode == 'episodes':
+            stress_events = episode_records(self.analyzer, tracker.finish(), has_timestamp, sensors)
+        stage_start = self.analyzer._finish_stage(timings, 'pass_1', stage_start)
+
+        # Pass 2: anomaly scoring against a model fitted on the reservoir sample
+        self._report_progress('anomaly model', 0.5)
+        detector = self._detector(reservoir.sample())
+        stage_start = self.analyzer._finish_stage(timings, 'anomaly_model', stage_start)
+        anomalies = []
+        anomaly_count = 0
+        half = n // 2
+        first_half_sum = 0.0
+        for chunk_index, chunk in enumerate(self._chunks(csv_path)):
+            values = chunk[names].to_numpy(dtype=np.float64)
+            flagged = np.flatnonzero(detector.predict(values) == -1)
+            anomaly_count += len(flagged)
+
+            room = self.max_records - len(anomalies)
+            if room > 0 and len(flagged):
+                picked = flagged[:room]
+                labels = self._labels(chunk, has_timestamp)
+                for i, readings in zip(picked, values[picked].tolist()):
+                    anomalies.append(self.analyzer.anomaly_record(labels[i], readings, names))
+
+            # Whole chunks reuse their pass-1 sums; only the chunk straddling
+            # the midpoint has its scores recomputed
+            start, count, chunk_sum = score_chunks[chunk_index]
+            if start + count <= half:
+                first_half_sum += chunk_sum
+            elif start < half:
+                scores = self.analyzer.calculate_health_scores_matrix(values, sensors)
+                first_half_sum += float(scores[:half - start].sum())
+
+            self._report_progress(f'pass 2: {start + count} of {n} rows', 0.5 + 0.4 * (start + count) / n)
+
+        stage_start = self.analyzer._finish_stage(timings, 'pass_2', stage_start)
+
+        total_score = sum(chunk_sum for _, _, chunk_sum in score_chunks)
+        if n < 2:
+            health_trend = 'Stable'
+        else:
+            health_trend = self.analyzer.health_trend_from_halves(
+                first_half_sum / half, (total_score - first_half_sum) / (n - half)
+            )
+
+        trends = {}
+        slopes = stats.slope() if n > 1 else [None] * len(names)
+        stds = stats.std()
+        for i, column in enumerate(names):
+            if n > 1:
+                trends[column] = self.analyzer.trend_summary(
+                    slopes[i], stats.mean[i], stats.minimum[i], stats.maximum[i], stds[i]
+                )
+            else:
+                trends[column] = self.analyzer.trend_summary(
+                    None, stats.first[i], stats.first[i], stats.first[i], 0
+                )
+
+        change_points = self._change_points(blocks, n)
+        health_trend = self.analyzer.health_trend_with_change_points(health_trend, change_points)
+
+        values, labels = recent.tail(window_size(n))
+        forecast = self.analyzer.forecast_window(labels if has_timestamp else None, values, sensors, labels[0])
+
+        report = self.analyzer.compile_report(
+            total_score / n,
+            stress_counts,
+            stress_events,
+            anomalies,
+            trends,
+            health_trend=health_trend,
+            total_readings=n,
+            thresholds=self.thresholds,
+            machine_name=machine_name,
+            stress_mode=self.stress_mode,
+            anomaly_count=anomaly_count,
+            forecast=forecast
+        )
+        report['streaming'] = {
+            'chunks': len(score_chunks),
+            'chunk_rows': self.chunksize,
+            'anomaly_sample_size': int(len(reservoir.sample())),
+            'stress_records_truncated': len(stress_events) < (tracker.total if self.stress_mode == 'episodes' else stress_counts['total']),
+            'anomaly_records_truncated': len(anomalies) < anomaly_count
+        }
+        report['anomaly_detection'] = detector.describe()
+        self.analyzer.add_change_points(report, change_points)
+        if self.stress_mode == 'episodes':
+            report['summary']['stress_episodes'] = tracker.total
+        self.analyzer._finish_stage(timings, 'report', stage_start)
+        metrics.inc('rows_analyzed_total', n, mode='streaming')
+
+        if self.include_timings:
+            report['timings'] = self.analyzer.timings_block(timings, time.perf_counter() - started)
+        return report
+
+    def _change_points(self, blocks, n):
+        """Change points from per-block sums, so boundaries fall on block edges"""
+        unit_rows = blocks.unit_rows()
+        result = {}
+        for column, name in enumerate(['health_score'] + self.sensors.names):
+            sums, counts, squares = blocks.series(column)
+            if column == 0:
+                min_shift = HEALTH_MIN_SHIFT
+            else:
+                min_shift = min_sensor_shift(sums, counts, squares)
+            boundaries = binary_segmentation(sums, counts, squares, min_shift)
+            result[name] = describe_segments(boundaries, sums, counts, unit_rows, n, blocks.label, higher_is_worse=column > 0)
+        return result
+
+    def _report_progress(self, stage, fraction):
+        if self.progress is not None:
+            self.progress(stage, fraction)
+
+    def _chunks(self, csv_path):
+        return iter_sensor_chunks(csv_path, self.chunksize, sensors=self.sensors.names)
+
+    def _labels(self, chunk, has_timestamp):
+        if has_timestamp:
+            return [str(ts) for ts in chunk['timestamp']]
+        return [str(label) for label in chunk.index.values]
+
+    def _detector(self, sample):
+        self.detector.fit(sample, model_store=self.analyzer.model_store, machine_id=self.machine_id, thresholds=self.thresholds, sensors=self.sensors.names)
+        if self.machine_id is not None:
+            logger.debug(f'Anomaly model for machine {self.machine_id}: {self.detector.source}')
+        return self.detector
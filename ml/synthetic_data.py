@@ -0,0 +1,106 @@
+"""Seeded synthetic sensor data for benchmarks and load testing
+
+Usage:
+    python synthetic_data.py --rows 100000 --output synthetic.csv
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+# Thresholds the generated series are designed around
+DEFAULT_THRESHOLDS = {
+    'temperature': {'warning': 60, 'critical': 75},
+    'vibration': {'warning': 4.5, 'critical': 6},
+    'current': {'warning': 15, 'critical': 18}
+}
+
+# Normal operating level and noise for each sensor
+SENSOR_PROFILES = {
+    'temperature': {'base': 48.0, 'noise': 1.5, 'daily_swing': 4.0, 'drift': 6.0},
+    'vibration': {'base': 2.6, 'noise': 0.35, 'daily_swing': 0.3, 'drift': 0.8},
+    'current': {'base': 11.5, 'noise': 0.8, 'daily_swing': 1.0, 'drift': 1.5}
+}
+
+
+def generate_sensor_data(rows, seed=42, start='2025-01-01', freq='1min', thresholds=None,
+                         spike_rate=0.002, stuck_rate=0.0005, excursion_rate=0.0002):
+    """Realistic temperature/vibration/current series with known faults
+
+    Each sensor combines a daily cycle, slow linear drift, a wandering but
+    mean-reverting AR(1) component and Gaussian noise. On top of that the
+    generator injects:
+    - spikes: single readings far above the normal level
+    - stuck sensors: stretches where a sensor repeats its last value
+    - threshold excursions: episodes that ramp past warning or critical
+    Rates are per reading. The same seed always yields the same frame.
+    """
+    thresholds = thresholds or DEFAULT_THRESHOLDS
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range(start=start, periods=rows, freq=freq)
+    minutes = np.arange(rows, dtype=np.float64)
+    progress = minutes / max(rows - 1, 1)
+    day_phase = 2 * np.pi * (timestamps.hour.values * 60 + timestamps.minute.values) / 1440
+
+    data = {'timestamp': timestamps.strftime('%Y-%m-%d %H:%M:%S')}
+    for sensor, profile in SENSOR_PROFILES.items():
+        # AR(1) with phi close to 1 wanders for hours but stays bounded at any length
+        phi = 0.999
+        innovations = rng.normal(0, profile['noise'] * 0.5 * np.sqrt(1 - phi ** 2), rows)
+        wander = lfilter([1.0], [1.0, -phi], innovations)
+        values = (
+            profile['base']
+            + profile['daily_swing'] * np.sin(day_phase)
+            + profile['drift'] * progress
+            + wander
+            + rng.normal(0, profile['noise'], rows)
+        )
+
+        _inject_spikes(values, rng, spike_rate, thresholds[sensor]['critical'])
+        _inject_excursions(values, rng, excursion_rate, thresholds[sensor])
+        _inject_stuck(values, rng, stuck_rate)
+
+        data[sensor] = np.round(np.maximum(values, 0), 2)
+
+    return pd.DataFrame(data)
+
+
+def _inject_spikes(values, rng, rate, critical):
+    count = rng.binomial(len(values), rate)
+    positions = rng.integers(0, len(values), count)
+    values[positions] = critical * rng.uniform(0.9, 1.4, count)
+
+
+def _inject_excursions(values, rng, rate, sensor_thresholds):
+    """Ramps up to a peak between warning and 1.3x critical, then back down"""
+    count = rng.binomial(len(values), rate)
+    for start in rng.integers(0, len(values), count):
+        length = int(rng.integers(10, 240))
+        end = min(start + length, len(values))
+        peak = rng.uniform(sensor_thresholds['warning'], sensor_thresholds['critical'] * 1.3)
+        ramp = np.sin(np.linspace(0, np.pi, end - start))
+        values[start:end] = np.maximum(values[start:end], values[start:end] + (peak - values[start:end]) * ramp)
+
+
+def _inject_stuck(values, rng, rate):
+    count = rng.binomial(len(values), rate)
+    for start in rng.integers(1, len(values), count):
+        length = int(rng.integers(30, 600))
+        values[start:start + length] = values[start - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic machine sensor data')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='synthetic_sensor_data.csv')
+    args = parser.parse_args()
+
+    df = generate_sensor_data(args.rows, seed=args.seed)
+    df.to_csv(args.output, index=False)
+    print(f'Wrote {len(df)} rows to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
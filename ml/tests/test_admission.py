@@ -0,0 +1,82 @@
+import io
+import json
+import threading
+import time
+
+import app as app_module
+from admission import AdmissionController
+
+THRESHOLDS = {
+    'temperature': {'warning': 60, 'critical': 75},
+    'vibration': {'warning': 4.5, 'critical': 6},
+    'current': {'warning': 15, 'critical': 18}
+}
+CSV = b'timestamp,temperature,vibration,current\n2024-01-01 00:00:00,50,3,12\n2024-01-01 00:01:00,51,3.1,12.5\n'
+
+
+def post_analysis(client):
+    return client.post('/analyze', data={
+        'file': (io.BytesIO(CSV), 'readings.csv'),
+        'thresholds': json.dumps(THRESHOLDS),
+        'include_timings': 'true'
+    }, content_type='multipart/form-data')
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out waiting for the analyses to fill the worker')
+        time.sleep(0.01)
+
+
+def test_queue_and_slots_fit_in_all_but_one_thread():
+    controller = AdmissionController(max_concurrent=2, max_queued=4, threads=4)
+    assert controller.max_in_flight == 3
+    assert controller.max_concurrent + controller.max_queued <= controller.max_in_flight
+
+    assert all(controller.enter() for _ in range(3))
+    assert not controller.enter()
+    controller.leave()
+    assert controller.enter()
+
+
+def test_health_answers_while_analysis_slots_and_queue_are_full(monkeypatch):
+    controller = AdmissionController(max_concurrent=2, max_queued=4, queue_timeout=30, threads=4)
+    monkeypatch.setattr(app_module, 'admission', controller)
+
+    release = threading.Event()
+
+    def blocked_analysis(source, **options):
+        release.wait(30)
+        return {'success': True}
+
+    monkeypatch.setattr(app_module.analyzer, 'analyze_csv', blocked_analysis)
+
+    client = app_module.app.test_client()
+    statuses = []
+    threads = [threading.Thread(target=lambda: statuses.append(post_analysis(client).status_code)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    try:
+        # Two analyses running and one queued take every thread but one
+        wait_for(lambda: controller.summary()['running'] == 2 and controller.summary()['queued'] == 1)
+        assert controller.summary()['in_flight'] == 3
+
+        started = time.monotonic()
+        refused = post_analysis(client)
+        assert refused.status_code == 429
+        assert 'Retry-After' in refused.headers
+
+        health = client.get('/health')
+        assert health.status_code == 200
+        assert health.get_json()['admission']['in_flight'] == 3
+        # Neither request waited for an analysis to finish
+        assert time.monotonic() - started < 5
+    finally:
+        release.set()
+        for thread in threads:
+            thread.join(30)
+
+    assert statuses == [200, 200, 200]
+    assert controller.summary()['in_flight'] == 0
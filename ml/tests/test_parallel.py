@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+from model import analyzer
+from parallel import ParallelScoring
+from synthetic_data import DEFAULT_THRESHOLDS, generate_sensor_data
+
+ROWS = 20000
+
+
+@pytest.fixture(scope='module')
+def readings(tmp_path_factory):
+    path = tmp_path_factory.mktemp('parallel') / 'readings.csv'
+    generate_sensor_data(ROWS, seed=7).to_csv(path, index=False)
+    return str(path)
+
+
+def analyze(monkeypatch, readings, parallel, **options):
+    monkeypatch.setattr(analyzer, 'parallel', parallel)
+    report = analyzer.analyze_csv(readings, thresholds=DEFAULT_THRESHOLDS, machine_name='press', include_timings=True, **options)
+    assert report['success']
+    report['overall_health'].pop('analysis_date')
+    stages = report.pop('timings')['stages']
+    return json.dumps(report, sort_keys=True), stages
+
+
+@pytest.mark.parametrize('options', [{}, {'stress_mode': 'episodes', 'timeline': 'hour'}])
+def test_parallel_scoring_matches_serial(monkeypatch, readings, options):
+    serial, stages = analyze(monkeypatch, readings, ParallelScoring(max_workers=1), **options)
+    assert 'parallel_scoring' not in stages
+
+    # Lowered ANALYSIS_PARALLEL_MIN_ROWS, so the pool scores this file
+    parallel = ParallelScoring(max_workers=3, min_rows=1000)
+    assert parallel.enabled(ROWS)
+    try:
+        report, stages = analyze(monkeypatch, readings, parallel, **options)
+        assert 'parallel_scoring' in stages
+        assert report == serial
+    finally:
+        parallel.shutdown()
@@ -0,0 +1,17 @@
+from model import analyzer
+from synthetic_data import DEFAULT_THRESHOLDS, generate_sensor_data
+
+
+def test_short_stream_change_points_match_in_memory(tmp_path):
+    # A temperature rise partway through a file shorter than STREAM_MAX_BLOCKS
+    readings = generate_sensor_data(2000, seed=11)
+    readings.loc[84:, 'temperature'] += 12
+    path = str(tmp_path / 'readings.csv')
+    readings.to_csv(path, index=False)
+
+    standard = analyzer.analyze_csv(path, thresholds=DEFAULT_THRESHOLDS, stress_mode='episodes')
+    assert standard['summary']['degradation_onset'] is not None
+    for chunksize in (333, 5000):
+        streamed = analyzer.analyze_csv_stream(path, thresholds=DEFAULT_THRESHOLDS, chunksize=chunksize)
+        assert streamed['change_points'] == standard['change_points']
+        assert streamed['summary']['degradation_onset'] == standard['summary']['degradation_onset']
@@ -0,0 +1,36 @@
+import io
+import threading
+
+import app as app_module
+
+CSV = b'timestamp,temperature,vibration,current\n2024-01-01 00:00:00,50,3,12\n2024-01-01 00:01:00,51,3.1,12.5\n'
+
+
+def test_light_endpoints_answer_during_warm_up(monkeypatch):
+    # A warm-up that never finishes
+    monkeypatch.setattr(app_module, 'analysis_libraries_ready', threading.Event())
+    client = app_module.app.test_client()
+
+    validated = client.post('/validate-csv', data={'file': (io.BytesIO(CSV), 'readings.csv')})
+    assert validated.status_code == 200
+    assert validated.get_json()['valid']
+
+    assert client.get('/jobs/0123456789abcdef0123456789abcdef').status_code == 404
+    assert client.get('/machines/unknown-machine/health').status_code == 404
+    assert client.get('/health').status_code == 200
+
+
+def test_analysis_waits_for_warm_up(monkeypatch):
+    ready = threading.Event()
+    monkeypatch.setattr(app_module, 'analysis_libraries_ready', ready)
+    client = app_module.app.test_client()
+
+    responses = []
+    request = threading.Thread(target=lambda: responses.append(client.post('/analyze', data={})))
+    request.start()
+    request.join(0.5)
+    assert request.is_alive()
+
+    ready.set()
+    request.join(10)
+    assert responses[0].status_code == 400
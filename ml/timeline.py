@@ -0,0 +1,124 @@
+import os
+
+import numpy as np
+
+from ingest import SENSOR_COLUMNS
+
+NS_PER_SECOND = 1_000_000_000
+
+# Shifts are SHIFT_HOURS long starting at SHIFT_START_HOUR (06:00-14:00, 14:00-22:00, 22:00-06:00)
+SHIFT_HOURS = int(os.getenv('TIMELINE_SHIFT_HOURS', 8))
+SHIFT_START_HOUR = int(os.getenv('TIMELINE_SHIFT_START_HOUR', 6))
+
+# Bucket name -> (width, offset) in seconds
+TIMELINE_BUCKETS = {
+    'minute': (60, 0),
+    'hour': (3600, 0),
+    'shift': (SHIFT_HOURS * 3600, SHIFT_START_HOUR * 3600),
+    'day': (86400, 0)
+}
+
+# Only the most recent buckets are returned past this many
+MAX_TIMELINE_BUCKETS = int(os.getenv('TIMELINE_MAX_BUCKETS', 5000))
+
+PERCENTILE = 0.95
+
+
+def build_timeline(timestamps, values, scores, levels, bucket, max_buckets=None, names=None):
+    """Per-bucket sensor statistics, mean health score and stress counts
+
+    timestamps is a datetime64[ns] array (NaT rows are skipped), values a
+    rows x sensors matrix with a column per sensor in names (SENSOR_COLUMNS
+    by default), scores and levels the per-reading health scores and
+    stress level codes. Rows are assigned to buckets with integer division,
+    and every statistic is computed for all buckets at once from group
+    indices: counts and sums with bincount, min/max/p95 by indexing the rows
+    sorted by (bucket, value). The output grows with the bucket count only.
+    """
+    if bucket not in TIMELINE_BUCKETS:
+        raise ValueError(f'Invalid timeline bucket: {bucket}. Use one of: {", ".join(TIMELINE_BUCKETS)}')
+    max_buckets = MAX_TIMELINE_BUCKETS if max_buckets is None else max_buckets
+    width, offset = TIMELINE_BUCKETS[bucket]
+
+    ns = np.asarray(timestamps, dtype='datetime64[ns]').view(np.int64)
+    valid = ~np.isnat(np.asarray(timestamps, dtype='datetime64[ns]'))
+    width_ns = width * NS_PER_SECOND
+    offset_ns = offset * NS_PER_SECOND
+    keys = (ns[valid] - offset_ns) // width_ns
+
+    bucket_keys, groups = np.unique(keys, return_inverse=True)
+    n_buckets = len(bucket_keys)
+    counts = np.bincount(groups, minlength=n_buckets)
+
+    scores = np.asarray(scores, dtype=np.float64)[valid]
+    levels = np.asarray(levels)[valid]
+    mean_scores = np.bincount(groups, weights=scores, minlength=n_buckets) / np.maximum(counts, 1)
+    critical = np.bincount(groups, weights=levels == 2, minlength=n_buckets).astype(np.int64)
+    high = np.bincount(groups, weights=levels == 1, minlength=n_buckets).astype(np.int64)
+
+    values = np.asarray(values, dtype=np.float64)[valid]
+    sensor_stats = [_group_stats(values[:, i], groups, n_buckets) for i in range(values.shape[1])]
+
+    first = max(n_buckets - max_buckets, 0)
+    starts = bucket_keys * width_ns + offset_ns
+    start_labels = np.datetime_as_string(starts[first:].astype('datetime64[ns]'), unit='s')
+    end_labels = np.datetime_as_string((starts[first:] + width_ns).astype('datetime64[ns]'), unit='s')
+
+    buckets = []
+    for j in range(first, n_buckets):
+        entry = {
+            'start': start_labels[j - first].replace('T', ' '),
+            'end': end_labels[j - first].replace('T', ' '),
+            'readings': int(counts[j]),
+            'health_score': round(float(mean_scores[j]), 2),
+            'stress': {
+                'critical': int(critical[j]),
+                'high': int(high[j]),
+                'total': int(critical[j] + high[j])
+            }
+        }
+        for sensor, stats in zip(names or SENSOR_COLUMNS, sensor_stats):
+            entry[sensor] = {name: _rounded(column[j]) for name, column in stats.items()}
+        buckets.append(entry)
+
+    return {
+        'bucket': bucket,
+        'bucket_seconds': width,
+        'buckets': buckets,
+        'total_buckets': int(n_buckets),
+        'truncated': first > 0,
+        'skipped_readings': int(np.count_nonzero(~valid))
+    }
+
+
+def _group_stats(column, groups, n_buckets):
+    """mean/min/max/p95 of one sensor per group, ignoring NaN readings"""
+    finite = ~np.isnan(column)
+    column = column[finite]
+    groups = groups[finite]
+    counts = np.bincount(groups, minlength=n_buckets)
+    sums = np.bincount(groups, weights=column, minlength=n_buckets)
+
+    # Rows sorted by group then value: each group is a contiguous sorted run
+    order = np.lexsort((column, groups))
+    ordered = column[order]
+    ends = np.cumsum(counts)
+    begins = ends - counts
+
+    has_data = counts > 0
+    stats = {name: np.full(n_buckets, np.nan) for name in ('mean', 'min', 'max', 'p95')}
+    stats['mean'][has_data] = sums[has_data] / counts[has_data]
+    stats['min'][has_data] = ordered[begins[has_data]]
+    stats['max'][has_data] = ordered[ends[has_data] - 1]
+
+    # Linear interpolation between order statistics, as np.percentile does
+    position = begins[has_data] + PERCENTILE * (counts[has_data] - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, ends[has_data] - 1)
+    fraction = position - lower
+    stats['p95'][has_data] = ordered[lower] + (ordered[upper] - ordered[lower]) * fraction
+    return stats
+
+
+def _rounded(value):
+    return None if np.isnan(value) else round(float(value), 2)